@@ -4,6 +4,12 @@ import digitalio
 import pwmio
 from picamera2 import Picamera2
 from picamera2.devices import IMX500
+import os
+import sys
+
+# リポジトリ直下の共通モジュール (imx500_detect) を読み込めるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from imx500_detect import DetectionDecoder, best_detection, normalize_metadata
 
 # ==========================================
 # 1. モーター設定
@@ -40,26 +46,19 @@ def stop_motors():
 # ==========================================
 # 2. AIテンソル解析
 # ==========================================
-def parse_direct_tensor(tensor_list):
-    # データ数が1801個であることを確認
-    if not tensor_list or len(tensor_list) != 1801:
-        return None
+detector = DetectionDecoder()
 
-    # [0] は「AIが確信を持って検出した物体の数」
-    num_detections = int(tensor_list[0])
-    
+def parse_direct_tensor(tensor_list):
+    """全検出を復号し、一番確かなコーン (スコア×大きさ) の中心X (0.0 ~ 1.0) を返す"""
+    dets = detector.decode(tensor_list)
+    best = best_detection(dets)
     # 1つも見つからなかったら None を返す
-    if num_detections == 0:
+    if best is None:
         return None
-
-    # 見つかった場合、最初の物体（一番信頼度が高いもの）のX座標は [1] にある
-    cx = tensor_list[1]
-    
-    # 画像サイズ(320x320と想定)で 0.0 ~ 1.0 に正規化
-    center_x = cx / 320.0
+    center_x = float(best["cx"])
     
     # デバッグ用に検出数も出しておきます
-    print(f"🎯 ロックオン (検出数:{num_detections}個) 位置:{center_x:.2f}")
+    print(f"🎯 ロックオン (検出数:{dets.size}個) 位置:{center_x:.2f} スコア:{best['score']:.2f}")
     
     return center_x
 
@@ -109,7 +108,7 @@ def main():
             time.sleep(0.1)
             
             # シンプルに最新のメタデータを1回だけ取得する
-            metadata = picam2.capture_metadata()
+            metadata = normalize_metadata(picam2.capture_metadata(), imx500)
             cx = None
             
             if 'CnnOutputTensor' in metadata:
@@ -4,7 +4,13 @@ import digitalio
 import pwmio
 from picamera2 import Picamera2
 from picamera2.devices import IMX500
-import subprocess
+import os
+import sys
+
+# リポジトリ直下の共通モジュール (imx500_detect) を読み込めるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from imx500_detect import DetectionDecoder, best_detection
+from live_view import LiveView, capture_with_preview
 import socket
 
 # ==========================================
@@ -42,26 +48,19 @@ def stop_motors():
 # ==========================================
 # 2. AIテンソル解析
 # ==========================================
-def parse_direct_tensor(tensor_list):
-    # データ数が1801個であることを確認
-    if not tensor_list or len(tensor_list) != 1801:
-        return None
+detector = DetectionDecoder()
 
-    # [0] は「AIが確信を持って検出した物体の数」
-    num_detections = int(tensor_list[0])
-    
+def parse_direct_tensor(tensor_list):
+    """全検出を復号し、一番確かなコーン (スコア×大きさ) の中心X (0.0 ~ 1.0) を返す"""
+    dets = detector.decode(tensor_list)
+    best = best_detection(dets)
     # 1つも見つからなかったら None を返す
-    if num_detections == 0:
+    if best is None:
         return None
-
-    # 見つかった場合、最初の物体（一番信頼度が高いもの）のX座標は [1] にある
-    cx = tensor_list[1]
-    
-    # 画像サイズ(320x320と想定)で 0.0 ~ 1.0 に正規化
-    center_x = cx / 320.0
+    center_x = float(best["cx"])
     
     # デバッグ用に検出数も出しておきます
-    print(f"🎯 ロックオン (検出数:{num_detections}個) 位置:{center_x:.2f}")
+    print(f"🎯 ロックオン (検出数:{dets.size}個) 位置:{center_x:.2f} スコア:{best['score']:.2f}")
     
     return center_x
 
@@ -91,90 +90,23 @@ def get_local_ip():
         s.close()
 
 
-def create_live_view_page(web_dir, image_name="latest_view.jpg"):
-        """
-        ブラウザキャッシュを回避しながら画像を自動更新表示するページを作る
-        """
-        html = f"""<!doctype html>
-<html lang=\"ja\">
-<head>
-    <meta charset=\"utf-8\">
-    <meta name=\"viewport\" content=\"width=device-width, initial-scale=1\">
-    <title>CanSat Live View</title>
-    <style>
-        body {{
-            margin: 0;
-            font-family: sans-serif;
-            background: #111;
-            color: #eee;
-            display: grid;
-            place-items: center;
-            min-height: 100vh;
-        }}
-        .wrap {{
-            width: min(96vw, 960px);
-        }}
-        img {{
-            width: 100%;
-            height: auto;
-            border: 1px solid #444;
-            border-radius: 8px;
-            background: #222;
-        }}
-        .meta {{
-            margin-top: 8px;
-            font-size: 14px;
-            color: #bbb;
-        }}
-    </style>
-</head>
-<body>
-    <div class=\"wrap\">
-        <img id=\"live\" src=\"{image_name}\" alt=\"live\">
-        <div class=\"meta\">0.5秒ごとに自動更新（キャッシュ回避）</div>
-    </div>
-    <script>
-        const img = document.getElementById('live');
-        setInterval(() => {{
-            img.src = '{image_name}?t=' + Date.now();
-        }}, 500);
-    </script>
-</body>
-</html>
-"""
-
-        with open(f"{web_dir.rstrip('/')}/index.html", "w", encoding="utf-8") as f:
-                f.write(html)
-
 # ==========================================
 # 3. メイン制御ループ (Stop & Go)
 # ==========================================
 def main():
-    # ★追加: テスト用に裏で画像確認用Webサーバーを自動で立ち上げる
+    # ★追加: テスト用に映像と検出枠をブラウザへ配信する (MJPEG)
     web_port = 8080
-    web_dir = "/dev/shm/"
     local_ip = get_local_ip()
-    create_live_view_page(web_dir)
-    print(f"🌐 画像確認用Webサーバー起動 (http://{local_ip}:{web_port}/index.html)")
-    web_server_proc = subprocess.Popen(
-        [
-            "python3",
-            "-m",
-            "http.server",
-            str(web_port),
-            "--bind",
-            "0.0.0.0",
-            "--directory",
-            web_dir,
-        ],
-        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-    )
+    live = LiveView(port=web_port)
+    live.start()
+    print(f"🌐 ライブビュー配信開始 (http://{local_ip}:{web_port}/)")
 
     print("AIモデル(network.rpk)を初期化中...")
     imx500 = IMX500("network.rpk")
     picam2 = Picamera2(imx500.camera_num)
     
-    config = picam2.create_preview_configuration(main={"size": (640, 480)})
+    # lores はライブビュー用 (配信中だけ推論結果と同じフレームを取り出す)
+    config = picam2.create_preview_configuration(main={"size": (640, 480)}, lores={"size": (320, 240)})
     picam2.configure(config)
     picam2.start()
     
@@ -202,11 +134,7 @@ def main():
             time.sleep(0.1)
             
             # シンプルに最新のメタデータを1回だけ取得する
-            metadata = picam2.capture_metadata()
-            try:
-                picam2.capture_file("/dev/shm/latest_view.jpg")
-            except Exception as e:
-                pass # エラーが起きてもメインループは止めない
+            metadata = capture_with_preview(picam2, live, imx500)
 
             cx = None
             
@@ -282,8 +210,8 @@ def main():
         print(f"\nエラーが発生しました: {e}")
     finally:
         stop_motors()
-        if web_server_proc.poll() is None:
-            web_server_proc.terminate()
+        live.stop()
+        print(live.report())
         picam2.stop()
 
 if __name__ == "__main__":
@@ -0,0 +1,69 @@
+import math
+import struct
+
+# ==========================================
+# BNO055 バースト読み出し
+# ==========================================
+# データレジスタ 0x08〜0x35 (46バイト) は連続しているので、1回の取引でまとめて読み、
+# 確保済みのバッファから struct.unpack_from で取り出す。
+# adafruit_bno055 のプロパティ (euler, acceleration, gyro, magnetic ...) は
+# 1つ読むたびに1取引かかるので、全部読むと 8 取引 → 1 取引になる。
+#
+#   0x08 ACC  3h  1/100 m/s^2      0x20 QUA  4h  1/2^14 (w, x, y, z)
+#   0x0E MAG  3h  1/16 uT          0x28 LIA  3h  1/100 m/s^2
+#   0x14 GYR  3h  1/16 dps→rad/s   0x2E GRV  3h  1/100 m/s^2
+#   0x1A EUL  3h  1/16 deg         0x34 TEMP b   1 ℃
+#                                  0x35 CALIB_STAT B (sys|gyro|accel|mag 各2bit)
+#
+# 単位は adafruit_bno055 と同じにしてある (既定の UNIT_SEL のまま使う前提)。
+
+DATA_REGISTER = 0x08
+_BLOCK = struct.Struct("<3h3h3h3h4h3h3hbB")
+_MOTION = struct.Struct("<12h")  # 先頭 24 バイト (ACC, MAG, GYR, EUL)
+
+_ACC = 1 / 100.0
+_MAG = 1 / 16.0
+_GYR = math.radians(1 / 16)   # 1/16 dps を rad/s に (adafruit_bno055 と同じ)
+_EUL = 1 / 16.0
+_QUA = 1 / (1 << 14)
+
+
+class Bno055Sample:
+    __slots__ = ("euler", "quaternion", "accel", "linear_accel", "gravity",
+                 "gyro", "mag", "temperature", "calibration")
+
+
+class Bno055Burst:
+    """BNO055_I2C の i2c_device を借りて、データレジスタを一括で読む"""
+
+    def __init__(self, i2c_device):
+        self.i2c_device = i2c_device
+        self._reg = bytes([DATA_REGISTER])
+        self._buf = bytearray(_BLOCK.size)
+
+    def read(self):
+        """全チャンネルを読んで Bno055Sample を返す"""
+        with self.i2c_device as i2c:
+            i2c.write_then_readinto(self._reg, self._buf)
+        v = _BLOCK.unpack_from(self._buf)
+        s = Bno055Sample()
+        s.accel = (v[0] * _ACC, v[1] * _ACC, v[2] * _ACC)
+        s.mag = (v[3] * _MAG, v[4] * _MAG, v[5] * _MAG)
+        s.gyro = (v[6] * _GYR, v[7] * _GYR, v[8] * _GYR)
+        s.euler = (v[9] * _EUL, v[10] * _EUL, v[11] * _EUL)
+        s.quaternion = (v[12] * _QUA, v[13] * _QUA, v[14] * _QUA, v[15] * _QUA)
+        s.linear_accel = (v[16] * _ACC, v[17] * _ACC, v[18] * _ACC)
+        s.gravity = (v[19] * _ACC, v[20] * _ACC, v[21] * _ACC)
+        s.temperature = v[22]
+        c = v[23]
+        s.calibration = ((c >> 6) & 3, (c >> 4) & 3, (c >> 2) & 3, c & 3)
+        return s
+
+    def read_motion(self):
+        """制御用に (euler, accel, gyro) だけ読む (先頭 24 バイト)"""
+        with self.i2c_device as i2c:
+            i2c.write_then_readinto(self._reg, self._buf, in_end=_MOTION.size)
+        v = _MOTION.unpack_from(self._buf)
+        return ((v[9] * _EUL, v[10] * _EUL, v[11] * _EUL),
+                (v[0] * _ACC, v[1] * _ACC, v[2] * _ACC),
+                (v[6] * _GYR, v[7] * _GYR, v[8] * _GYR))
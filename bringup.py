@@ -0,0 +1,121 @@
+import time
+import threading
+
+# ==========================================
+# 起動シーケンス (依存関係つきのデバイス初期化を並列に進める)
+# ==========================================
+# 各デバイスの初期化を Step として add() で宣言し、run() で
+# 依存先 (after) が終わったものから別スレッドで同時に進める。
+#   - fn には依存先の結果を after の順に引数で渡す
+#   - required=False の Step は失敗しても結果 None で続ける (センサーが無い場合と同じ扱い)
+#     required=True の Step が失敗したら、全部終わった後に run() がその例外を投げる
+#   - power=True の Step は同時に1つしか走らせず、終わってから settle 秒空けて次を通す
+#     (カメラ・ToF の起動電流のスパイクを重ねない)
+# 依存先は先に add() したものしか書けないので循環は起きない。
+# run() 中の1回目の Ctrl+C は cancel (Event) を立てるだけ。待ち続ける Step は cancel を見て抜ける。
+# report() は各 Step の開始・終了を帯で並べた起動タイムライン。
+
+BAR_WIDTH = 40
+
+
+class Step:
+    __slots__ = ("name", "fn", "after", "required", "power", "settle",
+                 "result", "error", "start", "end", "done", "thread")
+
+    def __init__(self, name, fn, after, required, power, settle):
+        self.name = name
+        self.fn = fn
+        self.after = tuple(after)
+        self.required = required
+        self.power = power
+        self.settle = settle
+        self.result = None
+        self.error = None
+        self.start = None
+        self.end = None
+        self.done = threading.Event()
+        self.thread = None
+
+
+class Bringup:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.steps = {}
+        self._power = threading.Lock()
+        self.cancel = threading.Event()   # run() 中の Ctrl+C で立つ (2回目はそのまま止める)
+        self.t0 = None
+        self.t1 = None
+
+    def add(self, name, fn, after=(), required=False, power=False, settle=0.0):
+        if name in self.steps:
+            raise ValueError(f"{name}: 同じ名前の Step があります")
+        for dep in after:
+            if dep not in self.steps:
+                raise ValueError(f"{name}: 依存先 {dep} が未登録です (先に add() すること)")
+        step = self.steps[name] = Step(name, fn, after, required, power, settle)
+        return step
+
+    def run(self):
+        """全 Step を実行して {名前: 結果} を返す"""
+        self.t0 = self.clock()
+        for step in self.steps.values():
+            step.thread = threading.Thread(target=self._run_step, args=(step,),
+                                           name=f"init-{step.name}", daemon=True)
+            step.thread.start()
+        for step in self.steps.values():
+            while not step.done.is_set():
+                try:
+                    step.done.wait()
+                except KeyboardInterrupt:
+                    # Ctrl+C は待っているメインスレッドに来る。1回目は cancel を立てて
+                    # 中断できる Step (手動キャリブレーション) だけ止め、起動は続ける
+                    if self.cancel.is_set():
+                        raise
+                    self.cancel.set()
+        self.t1 = self.clock()
+        for step in self.steps.values():
+            if step.required and step.error is not None:
+                raise step.error
+        return {name: step.result for name, step in self.steps.items()}
+
+    def _run_step(self, step):
+        args = []
+        for dep in step.after:
+            d = self.steps[dep]
+            d.done.wait()
+            args.append(d.result)
+        if step.power:
+            self._power.acquire()
+        try:
+            step.start = self.clock()
+            try:
+                step.result = step.fn(*args)
+            except Exception as e:
+                step.error = e
+                print(f"❌ {step.name} の初期化に失敗: {e}")
+            step.end = self.clock()
+        finally:
+            step.done.set()
+            if step.power:
+                # 依存先は待たせず、次の電源系 Step だけ間を空ける
+                if step.settle > 0:
+                    time.sleep(step.settle)
+                self._power.release()
+
+    def report(self):
+        if self.t0 is None:
+            return "⏱️ 起動タイムライン (未実行)"
+        total = (self.t1 or self.clock()) - self.t0
+        serial = sum(s.end - s.start for s in self.steps.values() if s.end is not None)
+        scale = BAR_WIDTH / total if total > 0 else 0.0
+        lines = [f"⏱️ 起動タイムライン 合計 {total:.1f}s (直列なら {serial:.1f}s)"]
+        for s in sorted(self.steps.values(), key=lambda s: (s.start is None, s.start or 0.0)):
+            if s.start is None:
+                lines.append(f"  {s.name:<10} 未実行")
+                continue
+            a, b = s.start - self.t0, s.end - self.t0
+            lead = int(a * scale)
+            bar = " " * lead + "█" * max(1, int(b * scale) - lead)
+            mark = "❌" if s.error is not None else "✅"
+            lines.append(f"  {s.name:<10} {a:5.1f} → {b:5.1f}s {mark} |{bar:<{BAR_WIDTH}}|")
+        return "\n".join(lines)
@@ -0,0 +1,156 @@
+import threading
+
+# ==========================================
+# カメラ取得スレッド (IMX500 の推論結果を1枚だけ持つ郵便受け)
+# ==========================================
+# 専用スレッドが capture_metadata() をフレームごとに呼び、結果を Frame にして
+# 1枠だけの郵便受けに入れる (前のフレームがまだ取られていなければ上書き = 捨てる)。
+# 制御側は take() で「まだ使っていない最新フレーム」だけを受け取るので、
+#   - 古いフレームを捨てるために capture_metadata() を空読みする必要が無い
+#   - フレーム待ちで time.sleep する必要も無い (無ければ None が返るだけ)
+# Frame.stamp は露光開始時刻 (カメラの SensorTimestamp を clock.monotonic() の時間軸へ直したもの)。
+# take(since=t) とすると t より前に露光したフレーム (旋回中のブレた画像) を使わずに捨てる。
+#
+# 仮想時計 (シミュレーション・再生) ではスレッドを使わず、take() のたびに
+# camera.poll_metadata() で新しいフレームがあるかを見る。
+#
+# lazy=True で付けた場合は start() を呼ぶまでカメラを動かさない (推論の電力・CPU を
+# Phase 3 の手前まで使わない)。取得スレッドは最初に camera.start() を呼んでから回る。
+
+MAX_FRAME_AGE = 0.3      # これより古いフレームは使わない [s]
+
+
+class Frame:
+    __slots__ = ("seq", "stamp", "received", "metadata")
+
+    def __init__(self, seq, stamp, received, metadata):
+        self.seq = seq
+        self.stamp = stamp          # 露光開始 [s] (clock.monotonic() の時間軸)
+        self.received = received    # 推論結果を受け取った時刻 [s]
+        self.metadata = metadata
+
+    def age(self, now):
+        return max(0.0, now - self.stamp)
+
+
+class CameraPipeline:
+    def __init__(self, camera, clock, threaded=True):
+        self.camera = camera
+        self.clock = clock
+        self.threaded = threaded
+        self.started_at = None      # start() した時刻 (まだなら None)
+        self._slot = None
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._taken = 0
+        self._stop = threading.Event()
+        self._thread = None
+        # 統計
+        self.frames = 0
+        self.errors = 0
+        self.dropped = 0         # 取られる前に次のフレームで上書きされた
+        self.blurred = 0         # since より前の露光だったので捨てた
+        self.stale = 0           # MAX_FRAME_AGE より古かったので捨てた
+        self.used = 0
+        self.age_total = 0.0
+        self.age_max = 0.0
+
+    @property
+    def started(self):
+        return self.started_at is not None
+
+    def start(self):
+        """取得を始める (2回目以降は何もしない)"""
+        if self.started:
+            return
+        self.started_at = self.clock.monotonic()
+        if not self.threaded:
+            self.camera.start()
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="camera", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.started_at = None
+
+    def _run(self):
+        try:
+            self.camera.start()
+        except Exception as e:
+            print(f"⚠️ カメラを起動できません: {e}")
+            self.errors += 1
+        while not self._stop.is_set():
+            try:
+                metadata = self.camera.capture_metadata()
+            except Exception:
+                self.errors += 1
+                self._stop.wait(0.1)
+                continue
+            self._post(metadata)
+
+    def _post(self, metadata):
+        now = self.clock.monotonic()
+        stamp = self.camera.exposure_time(metadata)
+        if stamp is None:
+            stamp = now
+        with self._lock:
+            self._seq += 1
+            self.frames += 1
+            if self._slot is not None and self._slot.seq > self._taken:
+                self.dropped += 1
+            self._slot = Frame(self._seq, stamp, now, metadata)
+
+    def _poll(self):
+        if not self.threaded and self.started:
+            metadata = self.camera.poll_metadata()
+            if metadata is not None:
+                self._post(metadata)
+
+    def latest(self):
+        """最新の Frame (使用済みでも返す)。まだ1枚も無ければ None"""
+        self._poll()
+        return self._slot
+
+    def take(self, since=None, max_age=MAX_FRAME_AGE):
+        """まだ使っていない最新フレームを取り出す。無い・使えない場合は None
+
+        since より前に露光したもの、max_age より古いものは取り出したうえで捨てる。
+        """
+        self._poll()
+        with self._lock:
+            frame = self._slot
+            if frame is None or frame.seq <= self._taken:
+                return None
+            self._taken = frame.seq
+        if since is not None and frame.stamp < since:
+            self.blurred += 1
+            return None
+        age = frame.age(self.clock.monotonic())
+        if max_age is not None and age > max_age:
+            self.stale += 1
+            return None
+        self.used += 1
+        self.age_total += age
+        if age > self.age_max:
+            self.age_max = age
+        return frame
+
+    def report(self):
+        n = self.used or 1
+        return (f"📷 カメラ {self.frames}フレーム | 使用 {self.used} | 上書き {self.dropped} | "
+                f"ブレ除外 {self.blurred} | 古すぎ {self.stale} | 失敗 {self.errors} | "
+                f"使用時の経過 平均 {self.age_total / n * 1000:.0f}ms 最大 {self.age_max * 1000:.0f}ms")
+
+
+def attach_camera_pipeline(hw, threaded=True, lazy=False):
+    """hw.camera の取得スレッドを hw.frames に付ける。lazy=False ならすぐに起動する"""
+    pipeline = CameraPipeline(hw.camera, hw.clock, threaded=threaded)
+    hw.frames = pipeline
+    if not lazy:
+        pipeline.start()
+    return pipeline
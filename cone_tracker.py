@@ -0,0 +1,136 @@
+import math
+
+# ==========================================
+# コーン追跡 (カルマンフィルタ: 方位ズレ + その変化率)
+# ==========================================
+# 状態 x = [err, rate]
+#   err  : カメラ正面からコーンまでの方位ズレ [deg] (正 = 右旋回で正面に来る側)
+#   rate : 機体の回転以外によるズレの変化 [deg/s] (前進中の見え方の変化など)
+# 予測: err += rate*dt - Δheading   (IMU の方位変化 = 機体自身の回転ぶんを差し引く)
+# 観測: IMX500 の検出中心 cx から err = (0.5 - cx) * 画角
+#
+# フレームの合間や数フレームの見失いでも予測で方位を出せるので、
+# 1フレームの cx だけで動くより旋回の止めどころが正確になる。
+# 2x2 なので numpy は使わずスカラーで書いている。
+
+CAMERA_HFOV = 66.3        # カメラ水平画角 [deg]
+MEAS_NOISE = 1.5          # 観測ノイズ (1σ) [deg]
+RATE_NOISE = 5.0          # rate のランダムウォーク強度 [deg/s/√s]
+HEADING_NOISE = 1.0       # IMU 方位差分のノイズ (1σ) [deg]
+INIT_RATE_STD = 10.0      # 初期化時の rate の不確かさ [deg/s]
+GATE = 9.0                # 観測を採用するマハラノビス距離² の上限 (3σ)
+MAX_REJECTS = 3           # これだけ連続で棄却したら観測側を信じて初期化し直す
+LOST_TIMEOUT = 1.0        # これ以上観測が無ければ見失い [s]
+
+
+def cx_to_bearing(cx, hfov=CAMERA_HFOV):
+    return (0.5 - cx) * hfov
+
+
+def bearing_to_cx(err, hfov=CAMERA_HFOV):
+    return 0.5 - err / hfov
+
+
+def _wrap(deg):
+    return (deg + 180.0) % 360.0 - 180.0
+
+
+class ConeTracker:
+    def __init__(self, hfov=CAMERA_HFOV):
+        self.hfov = hfov
+        self.reset()
+
+    def reset(self):
+        self.initialized = False
+        self.err = 0.0
+        self.rate = 0.0
+        self.P = [[0.0, 0.0], [0.0, 0.0]]
+        self.t = None
+        self.heading = None
+        self.last_seen = None
+        self.rejects = 0
+        self.updates = 0
+
+    # --- 予測 ---
+    def predict(self, t, heading=None):
+        """時刻 t まで状態を進める。heading [deg] を渡すと機体の回転を差し引く"""
+        if not self.initialized:
+            self.t, self.heading = t, heading
+            return
+        dt = max(0.0, t - self.t)
+        self.t = t
+        q_turn = 0.0
+        if heading is not None:
+            if self.heading is not None:
+                self.err -= _wrap(heading - self.heading)
+                q_turn = HEADING_NOISE ** 2
+            self.heading = heading
+        self.err += self.rate * dt
+
+        (p00, p01), (p10, p11) = self.P
+        q = RATE_NOISE ** 2
+        # F = [[1, dt], [0, 1]],  Q = q * [[dt^3/3, dt^2/2], [dt^2/2, dt]]
+        p00 = p00 + dt * (p10 + p01) + dt * dt * p11 + q * dt ** 3 / 3 + q_turn
+        p01 = p01 + dt * p11 + q * dt * dt / 2
+        p10 = p01
+        p11 = p11 + q * dt
+        self.P = [[p00, p01], [p10, p11]]
+
+    # --- 観測 ---
+    def update(self, cx):
+        """検出中心 cx (0.0〜1.0) で補正する。採用したら True"""
+        z = cx_to_bearing(cx, self.hfov)
+        if not self.initialized:
+            self._init(z)
+            return True
+        r = MEAS_NOISE ** 2
+        (p00, p01), (p10, p11) = self.P
+        s = p00 + r
+        y = z - self.err
+        if y * y / s > GATE:
+            self.rejects += 1
+            if self.rejects < MAX_REJECTS:
+                return False
+            # 別の物を追っていたとみなし、観測側で初期化し直す
+            self._init(z)
+            return True
+        k0, k1 = p00 / s, p10 / s
+        self.err += k0 * y
+        self.rate += k1 * y
+        self.P = [[(1 - k0) * p00, (1 - k0) * p01],
+                  [p10 - k1 * p00, p11 - k1 * p01]]
+        self.rejects = 0
+        self.updates += 1
+        self.last_seen = self.t
+        return True
+
+    def _init(self, z):
+        self.initialized = True
+        self.err = z
+        self.rate = 0.0
+        self.P = [[MEAS_NOISE ** 2, 0.0], [0.0, INIT_RATE_STD ** 2]]
+        self.rejects = 0
+        self.updates += 1
+        self.last_seen = self.t
+
+    def step(self, t, cx, heading=None):
+        """予測 → (検出があれば) 補正 をまとめて行う"""
+        self.predict(t, heading)
+        if cx is not None:
+            self.update(cx)
+
+    # --- 推定値 ---
+    @property
+    def lost(self):
+        return (not self.initialized or self.last_seen is None
+                or self.t - self.last_seen > LOST_TIMEOUT)
+
+    @property
+    def cx(self):
+        """推定した検出中心 (画像外なら 0〜1 を外れる)"""
+        return bearing_to_cx(self.err, self.hfov)
+
+    @property
+    def sigma(self):
+        """方位ズレの標準偏差 [deg]"""
+        return math.sqrt(max(self.P[0][0], 0.0))
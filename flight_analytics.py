@@ -0,0 +1,466 @@
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+from geodesy import path_length_array
+
+# ==========================================
+# 航法ログの一括解析 (logs/navi_*.csv / navi_*.bin)
+# ==========================================
+# 全ファイルを1つの列指向テーブル (FlightTable) に読み込む。
+#   - 行は (run, t) の順に並び、run ごとの開始位置 (offsets) で区切る
+#   - 列は numpy 配列 (欠測は NaN)。旧形式 (9列) の Phase/State は hal_replay と同じ規則で補う
+# CSV は行をまとめて分割し、列ごとに一括で数値・時刻へ変換する (行ごとの float() をしない)。
+# 読み込んだ結果は logs/.analytics_cache.npz に保存し、次回はファイルの
+# サイズ・更新時刻が変わっていない run をキャッシュから取り、変わった分だけ読み直す。
+#
+# python3 flight_analytics.py logs --summary summary.csv --plots plots/
+
+CACHE_NAME = ".analytics_cache.npz"
+CACHE_VERSION = 1
+FALL_ANGLE = 100.0       # 転倒とみなす Roll/Pitch [deg] (main_0306 の転倒検知と同じ)
+NAV_PHASE = 2
+
+# 列名と dtype (CSV の列名 / 欠測時の値)
+COLUMNS = [
+    ("phase",      "u1", "Phase",       0),
+    ("lat",        "f8", "Lat",         np.nan),
+    ("lon",        "f8", "Lon",         np.nan),
+    ("heading",    "f4", "Heading",     np.nan),
+    ("target_ang", "f4", "TargetAngle", np.nan),
+    ("dist",       "f4", "Dist",        np.nan),
+    ("roll",       "f4", "Roll",        np.nan),
+    ("pitch",      "f4", "Pitch",       np.nan),
+    ("l_val",      "f4", "L_Speed",     np.nan),
+    ("r_val",      "f4", "R_Speed",     np.nan),
+    ("fix",        "u1", "Fix",         0),
+    ("rel_alt",    "f4", "RelAlt",      np.nan),
+    ("accel_norm", "f4", "AccelNorm",   np.nan),
+    ("ai_cx",      "f4", "AI_CX",       np.nan),
+    ("tof",        "f4", "ToF_Dist",    np.nan),
+]
+STATE_DTYPE = "S8"
+
+
+# ==========================================
+# 読み込み (1ファイル -> 列の dict)
+# ==========================================
+def _spread_within_second(sec):
+    """1秒単位の時刻を、同じ秒の行が等間隔に並ぶよう小数を足す (hal_replay と同じ)"""
+    if sec.size == 0:
+        return sec.astype("f8")
+    starts = np.flatnonzero(np.r_[True, sec[1:] != sec[:-1]])
+    counts = np.diff(np.r_[starts, sec.size])
+    group = np.repeat(np.arange(starts.size), counts)
+    rank = np.arange(sec.size) - starts[group]
+    return sec + rank / counts[group]
+
+
+def _numeric(col, dtype, missing):
+    """文字列の列を一括で数値にする (空欄は missing)"""
+    empty = col == ""
+    if empty.any():
+        col = np.where(empty, "nan", col)
+    values = col.astype("f8")
+    if np.dtype(dtype).kind in "ui":
+        values = np.nan_to_num(values, nan=missing)
+    return values.astype(dtype)
+
+
+def parse_csv(path):
+    """navi_*.csv を列の dict にする (ヘッダーの重複行・注記行は捨てる)"""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        lines = f.read().splitlines()
+    header = None
+    for line in lines:
+        if line.startswith(("Timestamp", "Phase")):
+            header = line.split(",")
+            break
+    out = {"t": np.zeros(0), "state": np.zeros(0, STATE_DTYPE)}
+    for name, dtype, _, _ in COLUMNS:
+        out[name] = np.zeros(0, dtype)
+    if header is None:
+        return out
+    n = len(header)
+    body = [line for line in lines if line[:1].isdigit() and line.count(",") == n - 1]
+    if not body:
+        return out
+    cells = np.array([line.split(",") for line in body])
+    idx = {name: i for i, name in enumerate(header)}
+
+    stamps = np.char.replace(cells[:, idx["Timestamp"]], " ", "T").astype("datetime64[s]")
+    out["t"] = _spread_within_second(stamps.astype("i8"))
+    for name, dtype, csv_name, missing in COLUMNS:
+        if csv_name in idx:
+            out[name] = _numeric(cells[:, idx[csv_name]], dtype, missing)
+        else:
+            out[name] = np.full(len(body), missing, dtype)
+    if "State" in idx:
+        out["state"] = cells[:, idx["State"]].astype(STATE_DTYPE)
+    else:
+        # 旧形式 (9列): Phase 2 のみ。State は左右の出力から復元する
+        out["phase"][:] = NAV_PHASE
+        state = np.where(out["l_val"] == out["r_val"], b"DRIVE", b"TURN")
+        out["state"] = np.where(out["fix"] == 0, b"NOFIX", state).astype(STATE_DTYPE)
+    # 旧ロガーは ToF の未取得を 0 で書いていた
+    out["tof"][out["tof"] == 0] = np.nan
+    return out
+
+
+def parse_bin(path):
+    """navi_*.bin (telemetry_bin) を列の dict にする"""
+    from telemetry_bin import load
+    _, rows = load(path, use_mmap=False)
+    csv_names = rows.dtype.names
+    out = {"t": rows["Timestamp"].astype("f8"), "state": rows["State"].astype(STATE_DTYPE)}
+    for name, dtype, csv_name, missing in COLUMNS:
+        if csv_name in csv_names:
+            out[name] = rows[csv_name].astype(dtype)
+        else:
+            out[name] = np.full(rows.size, missing, dtype)
+    return out
+
+
+def list_runs(log_dir):
+    """(run名, パス, サイズ, 更新時刻ns) のリスト。同じ名前の .bin と .csv は .bin を使う"""
+    found = {}
+    for entry in os.scandir(log_dir):
+        stem, ext = os.path.splitext(entry.name)
+        if not stem.startswith("navi_") or ext not in (".csv", ".bin"):
+            continue
+        if ext == ".csv" and stem in found and found[stem][1].endswith(".bin"):
+            continue
+        st = entry.stat()
+        found[stem] = (stem, entry.path, st.st_size, st.st_mtime_ns)
+    return [found[k] for k in sorted(found)]
+
+
+# ==========================================
+# テーブル
+# ==========================================
+class FlightTable:
+    """全 run の行を (run, t) 順に並べた列指向テーブル"""
+
+    def __init__(self, runs, columns, offsets, sources):
+        self.runs = list(runs)            # run名 (navi_1772850319 など)
+        self.columns = columns            # 列名 -> numpy 配列 (全 run 連結)
+        self.offsets = offsets            # run i の行は offsets[i]:offsets[i+1]
+        self.sources = sources            # run名 -> (サイズ, 更新時刻ns)
+        self.run = np.repeat(np.arange(len(self.runs), dtype="i4"), np.diff(offsets))
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def __getitem__(self, name):
+        if name == "run":
+            return self.run
+        return self.columns[name]
+
+    def index(self, run):
+        return self.runs.index(run) if isinstance(run, str) else run
+
+    def slice(self, run):
+        i = self.index(run)
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def view(self, run):
+        """1 run 分の列の dict (コピーしない view)"""
+        s = self.slice(run)
+        return {name: col[s] for name, col in self.columns.items()}
+
+    def at(self, run, t):
+        """run の時刻 t 以前で最も新しい行の番号 (テーブル全体での添字)"""
+        s = self.slice(run)
+        k = np.searchsorted(self.columns["t"][s], t, side="right") - 1
+        return s.start + max(int(k), 0)
+
+    # --- キャッシュ ---
+    def save(self, path):
+        arrays = {f"col_{name}": col for name, col in self.columns.items()}
+        sizes = np.array([self.sources[r][0] for r in self.runs], dtype="i8")
+        mtimes = np.array([self.sources[r][1] for r in self.runs], dtype="i8")
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, version=np.array(CACHE_VERSION), runs=np.array(self.runs, dtype="U"),
+                 offsets=self.offsets, sizes=sizes, mtimes=mtimes, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def open_cache(cls, path):
+        with np.load(path, allow_pickle=False) as z:
+            if int(z["version"]) != CACHE_VERSION:
+                return None
+            runs = [str(r) for r in z["runs"]]
+            columns = {k[4:]: z[k] for k in z.files if k.startswith("col_")}
+            sources = {r: (int(s), int(m)) for r, s, m in zip(runs, z["sizes"], z["mtimes"])}
+            return cls(runs, columns, z["offsets"], sources)
+
+
+def _concat(parts, runs, sources):
+    names = ["t", "state"] + [c[0] for c in COLUMNS]
+    lengths = [len(p["t"]) for p in parts]
+    offsets = np.zeros(len(parts) + 1, dtype="i8")
+    np.cumsum(lengths, out=offsets[1:])
+    columns = {}
+    for name in names:
+        if parts:
+            columns[name] = np.concatenate([p[name] for p in parts])
+        else:
+            columns[name] = np.zeros(0, STATE_DTYPE if name == "state" else "f8")
+    return FlightTable(runs, columns, offsets, sources)
+
+
+def load_logs(log_dir, use_cache=True, verbose=False):
+    """log_dir の全 run を FlightTable にする。変わっていない run はキャッシュから取る"""
+    cache_path = os.path.join(log_dir, CACHE_NAME)
+    cached = None
+    if use_cache and os.path.exists(cache_path):
+        try:
+            cached = FlightTable.open_cache(cache_path)
+        except (OSError, ValueError, KeyError):
+            cached = None
+
+    listing = list_runs(log_dir)
+    parts, runs, sources = [], [], {}
+    parsed = 0
+    for run, path, size, mtime in listing:
+        if cached is not None and cached.sources.get(run) == (size, mtime):
+            parts.append(cached.view(run))
+        else:
+            try:
+                parts.append(parse_bin(path) if path.endswith(".bin") else parse_csv(path))
+            except (OSError, ValueError) as e:
+                print(f"⚠️ {path}: {e}", file=sys.stderr)
+                continue
+            parsed += 1
+        runs.append(run)
+        sources[run] = (size, mtime)
+
+    table = _concat(parts, runs, sources)
+    if use_cache and (parsed or cached is None or cached.runs != runs):
+        try:
+            table.save(cache_path)
+        except OSError as e:
+            print(f"⚠️ キャッシュを書けません: {e}", file=sys.stderr)
+    if verbose:
+        print(f"📂 {len(runs)} run / {len(table)} 行 (読み直し {parsed}, キャッシュ {len(runs) - parsed})")
+    return table
+
+
+# ==========================================
+# 指標
+# ==========================================
+def _wrap(deg):
+    return (deg + 180.0) % 360.0 - 180.0
+
+
+def _row_durations(t):
+    """各行が続いた時間 (次の行までの間隔。最後の行は間隔の中央値)"""
+    if t.size < 2:
+        return np.zeros(t.size)
+    dt = np.diff(t)
+    return np.r_[dt, np.median(dt)]
+
+
+def _intervals(mask, t):
+    """mask が True の区間の [(開始, 終了)] (終了は次に False になった行の時刻)"""
+    edges = np.diff(np.r_[0, mask.astype("i1"), 0])
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    end_t = np.r_[t, t[-1] if t.size else 0.0]
+    return [(float(t[s]), float(end_t[e])) for s, e in zip(starts, ends)]
+
+
+def run_metrics(v):
+    """1 run 分 (FlightTable.view) の指標を dict で返す"""
+    t = v["t"]
+    n = t.size
+    m = {"rows": n, "duration": float(t[-1] - t[0]) if n else 0.0}
+    if n == 0:
+        return m
+    dur = _row_durations(t)
+
+    # フェーズ・状態ごとの時間
+    for p in (1, 2, 3):
+        m[f"phase{p}_s"] = float(dur[v["phase"] == p].sum())
+    states, inv = np.unique(v["state"], return_inverse=True)
+    m["state_s"] = {s.decode(errors="replace"): float(x)
+                    for s, x in zip(states, np.bincount(inv, weights=dur))}
+
+    # 転倒 (Roll/Pitch が FALL_ANGLE を超えた回数) と復帰動作
+    tilted = (np.abs(v["roll"]) > FALL_ANGLE) | (np.abs(v["pitch"]) > FALL_ANGLE)
+    m["falls"] = len(_intervals(tilted, t))
+    m["recoveries"] = len(_intervals(v["state"] == b"RECOVER", t))
+
+    # GPS の途切れ (Phase 2 以降、最初の測位より後で Fix=0 の区間)
+    ground = v["phase"] >= NAV_PHASE
+    fixed = np.flatnonzero(ground & (v["fix"] > 0))
+    if fixed.size:
+        after = np.arange(n) >= fixed[0]
+        drops = _intervals(ground & after & (v["fix"] == 0), t)
+        lengths = [b - a for a, b in drops]
+        m["gps_dropouts"] = len(drops)
+        m["gps_dropout_s"] = float(sum(lengths))
+        m["gps_dropout_max_s"] = float(max(lengths, default=0.0))
+    else:
+        m["gps_dropouts"] = 0
+        m["gps_dropout_s"] = m["gps_dropout_max_s"] = 0.0
+
+    # Phase 2 の航法 (測位中の行)
+    nav = (v["phase"] == NAV_PHASE) & (v["fix"] > 0) & (v["dist"] > 0)
+    if nav.any():
+        d, tn = v["dist"][nav].astype("f8"), t[nav]
+        k = int(np.argmin(d))
+        m["dist_start"] = float(d[0])
+        m["dist_min"] = float(d[k])
+        m["dist_end"] = float(d[-1])
+        # 近づく速さ: 最初の測位から最接近までに縮めた距離 / 時間
+        m["approach_speed"] = float((d[0] - d[k]) / (tn[k] - tn[0])) if tn[k] > tn[0] else 0.0
+        err = _wrap(v["target_ang"][nav].astype("f8") - v["heading"][nav])
+        err = err[np.isfinite(err)]
+        a = np.abs(err)
+        m["heading_err_mean"] = float(a.mean())
+        m["heading_err_p50"] = float(np.percentile(a, 50))
+        m["heading_err_p95"] = float(np.percentile(a, 95))
+        m["heading_err_rms"] = float(np.sqrt((err * err).mean()))
+        lat, lon = v["lat"][nav], v["lon"][nav]
+        moved = np.r_[True, (lat[1:] != lat[:-1]) | (lon[1:] != lon[:-1])]
+        m["gps_path_m"] = float(path_length_array(lat[moved], lon[moved]).sum()) if moved.sum() > 1 else 0.0
+    return m
+
+
+SUMMARY_FIELDS = [
+    ("run", "{}"), ("rows", "{}"), ("duration", "{:.1f}"),
+    ("phase1_s", "{:.1f}"), ("phase2_s", "{:.1f}"), ("phase3_s", "{:.1f}"),
+    ("DRIVE_s", "{:.1f}"), ("TURN_s", "{:.1f}"), ("NOFIX_s", "{:.1f}"),
+    ("dist_start", "{:.1f}"), ("dist_min", "{:.1f}"), ("dist_end", "{:.1f}"),
+    ("approach_speed", "{:.3f}"), ("gps_path_m", "{:.1f}"),
+    ("heading_err_mean", "{:.1f}"), ("heading_err_p50", "{:.1f}"),
+    ("heading_err_p95", "{:.1f}"), ("heading_err_rms", "{:.1f}"),
+    ("falls", "{}"), ("recoveries", "{}"),
+    ("gps_dropouts", "{}"), ("gps_dropout_s", "{:.1f}"), ("gps_dropout_max_s", "{:.1f}"),
+]
+
+
+def summarize(table):
+    """run ごとの指標のリスト (SUMMARY_FIELDS の列を持つ dict)"""
+    out = []
+    for i, run in enumerate(table.runs):
+        m = run_metrics(table.view(i))
+        for s in ("DRIVE", "TURN", "NOFIX"):
+            m[f"{s}_s"] = m.get("state_s", {}).get(s, 0.0)
+        m["run"] = run
+        out.append(m)
+    return out
+
+
+def write_summary(rows, path):
+    with open(path, "w") as f:
+        f.write(",".join(k for k, _ in SUMMARY_FIELDS) + "\n")
+        for m in rows:
+            f.write(",".join(fmt.format(m[k]) if k in m else "" for k, fmt in SUMMARY_FIELDS) + "\n")
+
+
+def print_summary(rows):
+    print(f"{'run':<17} {'行':>5} {'時間':>6} {'P1':>6} {'P2':>6} {'P3':>6} {'開始':>6} {'最接近':>6} "
+          f"{'接近速度':>8} {'方位誤差p50/p95':>14} {'転倒':>4} {'GPS断':>5}")
+    for m in rows:
+        near = f"{m['dist_min']:6.1f}" if "dist_min" in m else "     -"
+        start = f"{m['dist_start']:6.1f}" if "dist_start" in m else "     -"
+        speed = f"{m['approach_speed']:8.3f}" if "approach_speed" in m else "       -"
+        herr = (f"{m['heading_err_p50']:6.1f}/{m['heading_err_p95']:6.1f}"
+                if "heading_err_p50" in m else "             -")
+        print(f"{m['run']:<17} {m['rows']:>5} {m['duration']:>6.0f} {m.get('phase1_s', 0):>6.0f} "
+              f"{m.get('phase2_s', 0):>6.0f} {m.get('phase3_s', 0):>6.0f} {start} {near} {speed} "
+              f"{herr:>14} {m.get('falls', 0):>4} {m.get('gps_dropouts', 0):>5}")
+
+
+# ==========================================
+# グラフ (matplotlib がある環境のみ)
+# ==========================================
+def write_plots(table, rows, out_dir):
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("⚠️ matplotlib が無いのでグラフは省略します (pip install matplotlib)")
+        return []
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+
+    # ゴールまでの距離 (Phase 2, 最初の測位からの経過時間)
+    fig, ax = plt.subplots(figsize=(9, 5))
+    for i, run in enumerate(table.runs):
+        v = table.view(i)
+        nav = (v["phase"] == NAV_PHASE) & (v["fix"] > 0) & (v["dist"] > 0)
+        if nav.sum() > 1:
+            t = v["t"][nav]
+            ax.plot(t - t[0], v["dist"][nav], lw=1, label=run[5:])
+    ax.set_xlabel("time since first fix [s]")
+    ax.set_ylabel("distance to goal [m]")
+    ax.grid(alpha=0.3)
+    if len(table.runs) <= 12:
+        ax.legend(fontsize=7)
+    written.append(_save(fig, out_dir, "dist_to_goal.png"))
+
+    # 方位誤差の分布 (全 run)
+    nav = (table["phase"] == NAV_PHASE) & (table["fix"] > 0) & (table["dist"] > 0)
+    err = _wrap(table["target_ang"][nav].astype("f8") - table["heading"][nav])
+    fig, ax = plt.subplots(figsize=(7, 4))
+    ax.hist(err[np.isfinite(err)], bins=72, range=(-180, 180))
+    ax.set_xlabel("heading error (target - heading) [deg]")
+    ax.set_ylabel("rows")
+    written.append(_save(fig, out_dir, "heading_error_hist.png"))
+
+    # run ごとのフェーズ別の時間
+    fig, ax = plt.subplots(figsize=(9, 4))
+    x = np.arange(len(rows))
+    bottom = np.zeros(len(rows))
+    for p in (1, 2, 3):
+        h = np.array([m.get(f"phase{p}_s", 0.0) for m in rows])
+        ax.bar(x, h, bottom=bottom, label=f"Phase {p}")
+        bottom += h
+    ax.set_xticks(x, [m["run"][5:] for m in rows], rotation=90, fontsize=6)
+    ax.set_ylabel("time [s]")
+    ax.legend()
+    written.append(_save(fig, out_dir, "phase_time.png"))
+    return written
+
+
+def _save(fig, out_dir, name):
+    import matplotlib.pyplot as plt
+    path = os.path.join(out_dir, name)
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+    plt.close(fig)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="logs/ の航法ログをまとめて読み、run ごとの指標を出す")
+    parser.add_argument("log_dir", nargs="?", default="logs")
+    parser.add_argument("--summary", metavar="CSV", help="run ごとの指標を CSV に書き出す")
+    parser.add_argument("--plots", metavar="DIR", help="グラフ (PNG) の出力先")
+    parser.add_argument("--no-cache", action="store_true", help="キャッシュを使わず全ファイルを読み直す")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    table = load_logs(args.log_dir, use_cache=not args.no_cache, verbose=True)
+    t1 = time.perf_counter()
+    rows = summarize(table)
+    t2 = time.perf_counter()
+    print_summary(rows)
+    print(f"⏱️ 読み込み {1000 * (t1 - t0):.0f}ms / 指標 {1000 * (t2 - t1):.0f}ms")
+    if args.summary:
+        write_summary(rows, args.summary)
+        print(f"📝 {args.summary}")
+    if args.plots:
+        for path in write_plots(table, rows, args.plots):
+            print(f"🖼️ {path}")
+
+
+if __name__ == "__main__":
+    main()
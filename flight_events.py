@@ -0,0 +1,209 @@
+import math
+import threading
+from collections import deque
+
+from hal import pressure_to_altitude
+from streaming_stats import RunningStats, SlidingWindow, Debounce
+
+# ==========================================
+# 飛行イベントの検知 (上昇・頂点・降下・開傘衝撃・分離条件・着地)
+# ==========================================
+# 気圧高度・加速度の大きさ・下向き ToF を届いた順に update_*() へ渡すと、
+# streaming_stats の窓と Debounce で1サンプルずつ O(1) で判定し、イベントを溜める。
+#   arm      … 相対高度が arm_altitude を超えた (ロック解除)
+#   apogee   … 最高高度から APOGEE_MARGIN 下がった (値は最高高度)
+#   drop     … 最高高度から drop_threshold 以上降下した
+#   shock    … 加速度が SHOCK_HIGH を超えた / SHOCK_LOW を下回った (開傘衝撃・自由落下)
+#   release  … 分離 (ニクロム線加熱) の条件が揃った (値は "baro" / "tof")
+#                baro: 降下済み かつ target_altitude 未満 かつ (衝撃検知済み or BELOW_COUNT 回連続)
+#                tof : 降下済み かつ 下向き ToF が TOF_NEAR 未満で TOF_COUNT 回 (TOF_HOLD 秒) 連続
+#   landing  … 分離後、高度が ±LANDING_BAND の中 または 加速度が STATIC_LOW〜STATIC_HIGH の中に
+#              LANDING_HOLD 秒とどまった (窓の最小・最大で判定)
+# 分離したことはミッション側が separated() で知らせる (着地の判定はそこから始める)。
+#
+# attach() で SensorService に登録すると、センサーのスレッドが読むたびに判定する
+# (BNO055 50Hz・ToF 50Hz・DPS310 は読み出し周期のまま)。ミッションのループは poll() で
+# イベントを受け取るだけなので、判定の細かさがループの周期 (10Hz) に縛られない。
+# 窓・連続判定は時刻で区切るので、サンプルの周期が変わっても意味は同じ。
+
+APOGEE_MARGIN = 1.0       # 最高高度からこれだけ下がったら頂点を過ぎたとみなす [m]
+SHOCK_HIGH = 19.6         # 開傘衝撃 [m/s^2] (2G)
+SHOCK_LOW = 5.0           # 自由落下 [m/s^2]
+BELOW_COUNT = 3           # target_altitude 未満がこの回数続いたら (気圧のサンプル数)
+BELOW_HOLD = 0.2          #   かつこの時間続いたら [s]
+TOF_NEAR = 300            # 下向き ToF の分離距離 [cm]
+TOF_COUNT = 5             # TOF_NEAR 未満がこの回数続いたら (ToF のサンプル数)
+TOF_HOLD = 0.4            #   かつこの時間続いたら [s]
+LANDING_BAND = 3.0        # 着地: 相対高度がこの幅 (±) の中 [m]
+STATIC_LOW = 9.0          # 着地: 加速度の大きさがこの範囲の中 [m/s^2]
+STATIC_HIGH = 11.0
+LANDING_HOLD = 5.0        # 着地: この時間とどまったら [s]
+
+
+class FlightEventDetector:
+    def __init__(self, arm_altitude, target_altitude, drop_threshold, base_altitude=0.0):
+        self.arm_altitude = arm_altitude
+        self.target_altitude = target_altitude
+        self.drop_threshold = drop_threshold
+        self.base_altitude = base_altitude
+        self.armed = False
+        self.apogee = False
+        self.dropped = False          # 最新の気圧サンプルで降下済みか (前回の判定と同じく毎回見直す)
+        self.deployed = False
+        self.released = False         # release を出した (ミッション側が加熱する)
+        self.release_altitude = None  # release を出した時の相対高度
+        self.separated_at = None
+        self.landed = False
+        self.rel_alt = 0.0
+        self.max_altitude = 0.0
+        self.accel_norm = 9.8
+        self.below = Debounce(BELOW_HOLD, BELOW_COUNT)
+        self.tof_near = Debounce(TOF_HOLD, TOF_COUNT)
+        self.alt_window = SlidingWindow(LANDING_HOLD)
+        self.accel_window = SlidingWindow(LANDING_HOLD)
+        self.ground = RunningStats()  # ロック解除前・地上 (±LANDING_BAND) の相対高度 (気圧のばらつき)
+        self.samples = {"baro": 0, "accel": 0, "tof": 0}
+        self.log = []                 # (名前, 時刻, 値) … 出したイベント全部 (report 用)
+        self._events = deque()
+        self._lock = threading.Lock()
+        self._subscriptions = []
+
+    # --- サンプルを渡す (どのスレッドから呼んでもよい) ---
+    def update_pressure(self, t, pressure):
+        if pressure is not None:
+            self.update_altitude(t, pressure_to_altitude(pressure) - self.base_altitude)
+
+    def update_altitude(self, t, rel_alt):
+        with self._lock:
+            self.samples["baro"] += 1
+            self.rel_alt = rel_alt
+            if rel_alt > self.max_altitude:
+                self.max_altitude = rel_alt
+            if not self.armed:
+                if abs(rel_alt) <= LANDING_BAND:
+                    self.ground.add(rel_alt)
+                if rel_alt > self.arm_altitude:
+                    self.armed = True
+                    self._emit("arm", t, rel_alt)
+                return
+            fall = self.max_altitude - rel_alt
+            if not self.apogee and fall >= APOGEE_MARGIN:
+                self.apogee = True
+                self._emit("apogee", t, self.max_altitude)
+            was_dropped = self.dropped
+            self.dropped = fall >= self.drop_threshold
+            if self.dropped and not was_dropped and not self.released:
+                self._emit("drop", t, fall)
+            if not self.released:
+                low = self.below.update(t, rel_alt < self.target_altitude)
+                if self.dropped and rel_alt < self.target_altitude and (self.deployed or low):
+                    self._release(t, "baro")
+            elif self.separated_at is not None:
+                self.alt_window.push(t, rel_alt)
+                self._check_landing(t)
+
+    def update_accel(self, t, norm):
+        with self._lock:
+            self.samples["accel"] += 1
+            self.accel_norm = norm
+            if not self.armed:
+                return
+            if not self.released:
+                if not self.deployed and (norm > SHOCK_HIGH or norm < SHOCK_LOW):
+                    self.deployed = True
+                    self._emit("shock", t, norm)
+            elif self.separated_at is not None:
+                self.accel_window.push(t, norm)
+                self._check_landing(t)
+
+    def update_tof(self, t, distance):
+        """下向き ToF の新しい測定値 (測れなかった時は None)"""
+        with self._lock:
+            self.samples["tof"] += 1
+            near = self.tof_near.update(t, distance is not None and distance < TOF_NEAR)
+            if self.armed and not self.released and self.dropped and near:
+                self._release(t, "tof")
+
+    def separated(self, t):
+        """分離 (加熱) が終わった。ここから着地の判定を始める"""
+        with self._lock:
+            self.released = True
+            self.separated_at = t
+            self.alt_window.clear()
+            self.accel_window.clear()
+
+    # --- ミッションのループから呼ぶ ---
+    def poll(self):
+        """前回から出たイベント [(名前, 時刻, 値)]"""
+        events = []
+        while self._events:
+            events.append(self._events.popleft())
+        return events
+
+    @property
+    def state(self):
+        if self.landed:
+            return "LANDED"
+        if not self.armed:
+            return "STANDBY"
+        if self.deployed or self.released:
+            return "DEPLOYED"
+        return "ARMED"
+
+    # --- SensorService につなぐ ---
+    def attach(self, service):
+        """気圧・IMU・下向き ToF のチャンネルが更新されるたびに判定する"""
+        subs = []
+        if "baro" in service.channels:
+            subs.append(("baro", lambda r: self.update_pressure(r.stamp, r.value[0])))
+        if "imu" in service.channels:
+            subs.append(("imu", self._on_imu))
+        if "tof_bottom" in service.channels:
+            subs.append(("tof_bottom", lambda r: self.update_tof(r.stamp, r.value)))
+        for name, fn in subs:
+            service.subscribe(name, fn)
+            self._subscriptions.append((service, name, fn))
+        return bool(subs)
+
+    def detach(self):
+        for service, name, fn in self._subscriptions:
+            service.unsubscribe(name, fn)
+        self._subscriptions = []
+
+    def _on_imu(self, reading):
+        accel = reading.value[1]
+        if accel[0] is not None:
+            self.update_accel(reading.stamp, math.sqrt(accel[0] ** 2 + accel[1] ** 2 + accel[2] ** 2))
+
+    # --- 内部 ---
+    def _emit(self, name, t, value):
+        event = (name, t, value)
+        self.log.append(event)
+        self._events.append(event)
+
+    def _release(self, t, reason):
+        self.released = True
+        self.release_altitude = self.rel_alt
+        self._emit("release", t, reason)
+
+    def _check_landing(self, t):
+        if self.landed:
+            return
+        alt, acc = self.alt_window, self.accel_window
+        settled = alt.full and -LANDING_BAND <= alt.min and alt.max <= LANDING_BAND
+        static = acc.full and STATIC_LOW <= acc.min and acc.max <= STATIC_HIGH
+        if settled or static:
+            self.landed = True
+            self._emit("landing", t, "baro" if settled else "accel")
+
+    def report(self):
+        lines = [f"🪂 飛行イベント | 状態 {self.state} | 最高高度 {self.max_altitude:.1f}m | "
+                 f"サンプル 気圧 {self.samples['baro']} / 加速度 {self.samples['accel']} / ToF {self.samples['tof']}"]
+        if self.ground.count:
+            lines.append(f"  地上の相対高度 {self.ground.mean:+.2f} ± {self.ground.std:.2f}m "
+                         f"({self.ground.count}サンプル)")
+        t0 = self.log[0][1] if self.log else 0.0
+        for name, t, value in self.log:
+            shown = f"{value:.2f}" if isinstance(value, float) else value
+            lines.append(f"  {t - t0:8.2f}s  {name:<8} {shown}")
+        return "\n".join(lines)
@@ -0,0 +1,225 @@
+import os
+import time
+import signal
+import atexit
+import threading
+
+# ==========================================
+# フライトロガー (リングバッファ + 書き込みスレッド)
+# ==========================================
+# 制御ループは log() でレコードを積むだけ。整形・write・fsync は
+# バックグラウンドスレッドがまとめて行う。
+# fsync は「前回から FSYNC_INTERVAL 秒経過」または「FSYNC_BYTES 溜まった」で実行。
+# フェーズ移行時は flush() を呼べば、その時点までのデータが確実にSDへ書かれる。
+
+DEFAULT_CAPACITY = 1024     # リングバッファのレコード数 (5Hzなら約3分ぶん)
+FSYNC_INTERVAL = 2.0        # fsync の時間予算 (秒)
+FSYNC_BYTES = 16384         # fsync のバイト予算
+WRITER_PERIOD = 0.5         # 書き込みスレッドの起床間隔 (秒)
+
+
+def csv_encoder(fmt):
+    """フォーマット文字列からCSV1行を作るエンコーダを返す"""
+    line = fmt + "\n"
+    def encode(row):
+        return line.format(*row).encode("utf-8")
+    return encode
+
+
+class FlightLogger:
+    """リングバッファに溜めたレコードを別スレッドでまとめ書きするロガー"""
+
+    def __init__(self, path, header=None, fmt=None, encoder=None,
+                 capacity=DEFAULT_CAPACITY,
+                 fsync_interval=FSYNC_INTERVAL, fsync_bytes=FSYNC_BYTES):
+        self.path = path
+        self.capacity = capacity
+        self.fsync_interval = fsync_interval
+        self.fsync_bytes = fsync_bytes
+
+        if encoder is None:
+            encoder = csv_encoder(fmt) if fmt else csv_encoder("{}")
+        self._encode = encoder
+
+        # 事前確保したリングバッファ (ループ中にリストを伸ばさない)
+        self._ring = [None] * capacity
+        self._head = 0   # 次に書き込みスレッドが読む位置
+        self._count = 0  # 未書き込みのレコード数
+        self._seq = 0         # これまでに積まれた総数
+        self._written_seq = 0 # これまでにファイルへ出した総数
+        self._synced_seq = 0  # これまでに fsync 済みの総数
+
+        # シグナルハンドラ内から flush() しても詰まらないよう RLock を使う
+        self._cond = threading.Condition(threading.RLock())
+        self._closed = False
+        self._sync_request = False
+
+        # 統計
+        self.dropped = 0
+        self.encode_errors = 0
+        self.fsync_count = 0
+        self.bytes_written = 0
+        self.log_calls = 0
+        self.log_time_total = 0.0
+        self.log_time_max = 0.0
+        self.write_time_max = 0.0
+        self.fsync_time_max = 0.0
+
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        if header and new_file:
+            # bytes はバイナリ形式のヘッダーとしてそのまま書く
+            if isinstance(header, str):
+                header = (header.rstrip("\n") + "\n").encode("utf-8")
+            os.write(self._fd, header)
+        self._unsynced_bytes = 0
+        self._last_sync = time.monotonic()
+
+        self._thread = threading.Thread(target=self._writer_loop, name="flight-logger", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ------------------------------------------------
+    # 制御ループ側
+    # ------------------------------------------------
+    def log(self, *row):
+        """レコードを1件積む (I/Oはしない)"""
+        t0 = time.perf_counter()
+        with self._cond:
+            if self._closed:
+                return
+            if self._count == self.capacity:
+                # 書き込みが追いつかない場合は最古のレコードを捨てる (制御ループは止めない)
+                self._head = (self._head + 1) % self.capacity
+                self._count -= 1
+                self.dropped += 1
+            self._ring[(self._head + self._count) % self.capacity] = row
+            self._count += 1
+            self._seq += 1
+        dt = time.perf_counter() - t0
+        self.log_calls += 1
+        self.log_time_total += dt
+        if dt > self.log_time_max:
+            self.log_time_max = dt
+
+    def flush(self, sync=True, timeout=5.0):
+        """ここまでに積んだレコードを書き出す (sync=True なら fsync まで待つ)"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            target = self._seq
+            if sync:
+                self._sync_request = True
+            self._cond.notify_all()
+            while not self._closed:
+                done = self._synced_seq if sync else self._written_seq
+                if done >= target:
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self):
+        """残りを全て書いて fsync し、ファイルを閉じる"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5.0)
+
+    def install_signal_handlers(self, signums=(signal.SIGINT, signal.SIGTERM, signal.SIGHUP)):
+        """シグナル受信時に flush してから元のハンドラへ渡す (メインスレッドから呼ぶこと)"""
+        for signum in signums:
+            previous = signal.getsignal(signum)
+
+            def handler(num, frame, previous=previous):
+                self.flush(sync=True, timeout=2.0)
+                if callable(previous):
+                    previous(num, frame)
+                elif previous == signal.SIG_IGN:
+                    return
+                else:
+                    # SIG_DFL: finally節 (モーター停止など) を通すため SystemExit で抜ける
+                    raise SystemExit(128 + num)
+
+            signal.signal(signum, handler)
+
+    def report(self):
+        """ループに加わった遅延と書き込み状況の要約文字列"""
+        mean_us = (self.log_time_total / self.log_calls * 1e6) if self.log_calls else 0.0
+        return (f"log():{self.log_calls}回 平均{mean_us:.1f}us 最大{self.log_time_max * 1e6:.1f}us | "
+                f"write最大{self.write_time_max * 1e3:.1f}ms fsync最大{self.fsync_time_max * 1e3:.1f}ms "
+                f"({self.fsync_count}回) | {self.bytes_written}B 破棄{self.dropped}件 変換失敗{self.encode_errors}件")
+
+    # ------------------------------------------------
+    # 書き込みスレッド側
+    # ------------------------------------------------
+    def _take_batch(self):
+        batch = []
+        while self._count:
+            batch.append(self._ring[self._head])
+            self._ring[self._head] = None
+            self._head = (self._head + 1) % self.capacity
+            self._count -= 1
+        return batch
+
+    def _encode_safe(self, row):
+        # 1件の不正レコードで書き込みスレッドを止めない
+        try:
+            return self._encode(row)
+        except Exception:
+            self.encode_errors += 1
+            return b""
+
+    def _writer_loop(self):
+        while True:
+            with self._cond:
+                if not self._count and not self._closed and not self._sync_request:
+                    self._cond.wait(WRITER_PERIOD)
+                batch = self._take_batch()
+                # 破棄分も含めて「ここまで処理済み」の通し番号
+                seq = self._seq - self._count
+                want_sync = self._sync_request or self._closed
+                self._sync_request = False
+                closing = self._closed
+
+            if batch:
+                data = b"".join(self._encode_safe(row) for row in batch)
+                t0 = time.perf_counter()
+                os.write(self._fd, data)
+                dt = time.perf_counter() - t0
+                if dt > self.write_time_max:
+                    self.write_time_max = dt
+                self.bytes_written += len(data)
+                self._unsynced_bytes += len(data)
+
+            now = time.monotonic()
+            if self._unsynced_bytes and (want_sync
+                                         or self._unsynced_bytes >= self.fsync_bytes
+                                         or now - self._last_sync >= self.fsync_interval):
+                t0 = time.perf_counter()
+                os.fsync(self._fd)
+                dt = time.perf_counter() - t0
+                if dt > self.fsync_time_max:
+                    self.fsync_time_max = dt
+                self.fsync_count += 1
+                self._unsynced_bytes = 0
+                self._last_sync = now
+                synced = True
+            else:
+                synced = not self._unsynced_bytes
+
+            with self._cond:
+                self._written_seq = seq
+                if synced:
+                    self._synced_seq = seq
+                self._cond.notify_all()
+
+            if closing:
+                with self._cond:
+                    if self._count:
+                        continue
+                os.close(self._fd)
+                return
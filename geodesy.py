@@ -0,0 +1,126 @@
+import math
+
+# ==========================================
+# 測地計算 (球面近似, R = 6371 km)
+# ==========================================
+# 機上のループ: math だけで書いたスカラー版 (numpy の import 時間を避ける)
+# 解析・シミュレーション: 配列をまとめて処理する numpy 版 (*_array)
+#
+# LocalFrame (正距円筒図法の局所平面) は基準点まわり 1 km 以内なら
+# ハバーサインとの差が距離で 0.003% 未満 (北緯35度・1 km で 2 cm 程度)、
+# 方位で 0.01度未満で、三角関数を使わずに距離・方位が出る。
+# 誤差は基準点からの南北距離とともに増える (東西成分に tan(緯度)×南北差[rad] の
+# 相対誤差) ので、広い範囲には使わないこと。
+
+EARTH_RADIUS = 6371000.0
+
+
+# ==========================================
+# スカラー版
+# ==========================================
+def calculate_distance_meters(lat1, lon1, lat2, lon2):
+    """2点間の大円距離 [m] (ハバーサイン)"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    delta_lambda = math.radians(lon2 - lon1)
+    a = math.sin((phi2 - phi1)/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(delta_lambda/2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+    return EARTH_RADIUS * c
+
+
+def calculate_bearing(lat1, lon1, lat2, lon2):
+    """点1から点2への初期方位 [deg] (北=0, 時計回り, 0〜360)"""
+    lon1, lat1, lon2, lat2 = map(math.radians, [lon1, lat1, lon2, lat2])
+    dLon = lon2 - lon1
+    y = math.sin(dLon) * math.cos(lat2)
+    x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(dLon)
+    return (math.degrees(math.atan2(y, x)) + 360) % 360
+
+
+def destination_point(lat, lon, bearing_deg, dist_m):
+    """点から方位 bearing_deg へ dist_m 進んだ地点の (緯度, 経度)"""
+    phi1, lam1 = math.radians(lat), math.radians(lon)
+    theta = math.radians(bearing_deg)
+    delta = dist_m / EARTH_RADIUS
+    phi2 = math.asin(math.sin(phi1) * math.cos(delta) + math.cos(phi1) * math.sin(delta) * math.cos(theta))
+    lam2 = lam1 + math.atan2(math.sin(theta) * math.sin(delta) * math.cos(phi1),
+                             math.cos(delta) - math.sin(phi1) * math.sin(phi2))
+    return math.degrees(phi2), math.degrees(lam2)
+
+
+class LocalFrame:
+    """基準点 (lat0, lon0) を原点とする東(x)・北(y) [m] の局所平面"""
+
+    def __init__(self, lat0, lon0):
+        self.lat0 = lat0
+        self.lon0 = lon0
+        self.m_per_deg_lat = math.radians(1.0) * EARTH_RADIUS
+        self.m_per_deg_lon = self.m_per_deg_lat * math.cos(math.radians(lat0))
+
+    def to_enu(self, lat, lon):
+        return ((lon - self.lon0) * self.m_per_deg_lon, (lat - self.lat0) * self.m_per_deg_lat)
+
+    def to_latlon(self, x, y):
+        return (self.lat0 + y / self.m_per_deg_lat, self.lon0 + x / self.m_per_deg_lon)
+
+    def distance_to_origin(self, lat, lon):
+        x, y = self.to_enu(lat, lon)
+        return math.hypot(x, y)
+
+    def bearing_to_origin(self, lat, lon):
+        """点から基準点を見た方位 [deg]"""
+        x, y = self.to_enu(lat, lon)
+        return math.degrees(math.atan2(-x, -y)) % 360
+
+
+# ==========================================
+# 配列版 (numpy)
+# ==========================================
+# 引数は緯度経度の配列 (スカラーとの混在可, ブロードキャストされる)
+def haversine_array(lat1, lon1, lat2, lon2):
+    import numpy as np
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    dphi = phi2 - phi1
+    dlam = np.radians(np.subtract(lon2, lon1))
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlam / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def bearing_array(lat1, lon1, lat2, lon2):
+    import numpy as np
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    dlam = np.radians(np.subtract(lon2, lon1))
+    y = np.sin(dlam) * np.cos(phi2)
+    x = np.cos(phi1) * np.sin(phi2) - np.sin(phi1) * np.cos(phi2) * np.cos(dlam)
+    return np.degrees(np.arctan2(y, x)) % 360
+
+
+def destination_array(lat, lon, bearing_deg, dist_m):
+    import numpy as np
+    phi1 = np.radians(lat)
+    lam1 = np.radians(lon)
+    theta = np.radians(bearing_deg)
+    delta = np.divide(dist_m, EARTH_RADIUS)
+    sin_phi2 = np.sin(phi1) * np.cos(delta) + np.cos(phi1) * np.sin(delta) * np.cos(theta)
+    phi2 = np.arcsin(np.clip(sin_phi2, -1.0, 1.0))
+    lam2 = lam1 + np.arctan2(np.sin(theta) * np.sin(delta) * np.cos(phi1),
+                             np.cos(delta) - np.sin(phi1) * sin_phi2)
+    return np.degrees(phi2), np.degrees(lam2)
+
+
+def enu_array(lat, lon, lat0, lon0):
+    """(lat0, lon0) 基準の局所平面 (x=東, y=北) [m]。LocalFrame の配列版"""
+    import numpy as np
+    k = math.radians(1.0) * EARTH_RADIUS
+    x = np.subtract(lon, lon0) * (k * math.cos(math.radians(lat0)))
+    y = np.subtract(lat, lat0) * k
+    return x, y
+
+
+def path_length_array(lat, lon):
+    """軌跡の区間距離 (長さ n-1) [m]。累積は .cumsum()"""
+    import numpy as np
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    return haversine_array(lat[:-1], lon[:-1], lat[1:], lon[1:])
@@ -0,0 +1,256 @@
+import time
+import operator
+import functools
+import threading
+from collections import deque
+
+from hal import Gps
+
+# ==========================================
+# GPS 受信スレッド (NMEA: RMC / GGA)
+# ==========================================
+# 専用スレッドが UART を溜まっている分まとめて読み、行単位で RMC/GGA を解析して
+# 測位結果 (GpsFix) をリングバッファに積む。ナビのループは update() で最新の
+# 測位を見るだけなので UART で待たされず、溜まったデータを捨てる必要もない。
+#
+# 同じ UTC 時刻の RMC と GGA は1つの GpsFix にまとめる
+# (RMC: 有効/無効・速度・進行方向, GGA: 品質・衛星数・HDOP・高度)。
+
+FIX_RING_SIZE = 64
+FIX_TIMEOUT = 3.0        # これ以上新しい測位が無ければ has_fix=False [s]
+READ_TIMEOUT = 0.2       # UART 読み出しの最大待ち (停止要求への反応時間) [s]
+KNOT = 0.514444          # [m/s]
+
+
+class GpsFix:
+    __slots__ = ("stamp", "utc", "valid", "lat", "lon", "speed", "course",
+                 "quality", "sats", "hdop", "altitude", "seq")
+
+    def __init__(self, utc):
+        self.stamp = 0.0
+        self.utc = utc
+        self.valid = False
+        self.lat = None
+        self.lon = None
+        self.speed = None      # [m/s]
+        self.course = None     # [deg]
+        self.quality = 0
+        self.sats = 0
+        self.hdop = None
+        self.altitude = None   # [m]
+        self.seq = 0
+
+
+def nmea_checksum(body):
+    return functools.reduce(operator.xor, body, 0)
+
+
+def _coord(value, hemi):
+    """ddmm.mmmm / dddmm.mmmm -> 度"""
+    if not value:
+        return None
+    dot = value.find(".")
+    if dot < 0:
+        dot = len(value)
+    deg = float(value[:dot - 2]) + float(value[dot - 2:]) / 60.0
+    return -deg if hemi in ("S", "W") else deg
+
+
+def _float(value):
+    return float(value) if value else None
+
+
+class NmeaParser:
+    """バイト列を順に食わせると、まとまった GpsFix を on_fix に渡す"""
+
+    def __init__(self, on_fix):
+        self.on_fix = on_fix
+        self._pending = b""
+        self._epoch = None
+        self._seen = set()
+        self.sentences = 0
+        self.bad_checksum = 0
+
+    def feed(self, data):
+        lines = (self._pending + data).split(b"\n")
+        self._pending = lines.pop()   # 最後の行は途中かもしれないので次回へ回す
+        for line in lines:
+            self._sentence(line.strip())
+
+    def _sentence(self, line):
+        if not line.startswith(b"$"):
+            return
+        star = line.rfind(b"*")
+        if star < 0:
+            return
+        body = line[1:star]
+        try:
+            if nmea_checksum(body) != int(line[star + 1:star + 3], 16):
+                self.bad_checksum += 1
+                return
+        except ValueError:
+            self.bad_checksum += 1
+            return
+        self.sentences += 1
+        f = body.decode("ascii", "replace").split(",")
+        kind = f[0][2:]
+        try:
+            if kind == "RMC" and len(f) >= 9:
+                fix = self._fix_for(f[1])
+                fix.valid = (f[2] == "A")
+                fix.lat = _coord(f[3], f[4])
+                fix.lon = _coord(f[5], f[6])
+                speed = _float(f[7])
+                fix.speed = speed * KNOT if speed is not None else None
+                fix.course = _float(f[8])
+            elif kind == "GGA" and len(f) >= 10:
+                fix = self._fix_for(f[1])
+                fix.quality = int(f[6] or 0)
+                fix.sats = int(f[7] or 0)
+                fix.hdop = _float(f[8])
+                fix.altitude = _float(f[9])
+                if fix.lat is None:
+                    fix.lat = _coord(f[2], f[3])
+                    fix.lon = _coord(f[4], f[5])
+            else:
+                return
+        except ValueError:
+            return
+        self._seen.add(kind)
+        if "RMC" in self._seen and "GGA" in self._seen:
+            self._publish()
+
+    def _fix_for(self, utc):
+        if self._epoch is not None and self._epoch.utc != utc:
+            self._publish()
+        if self._epoch is None:
+            self._epoch = GpsFix(utc)
+        return self._epoch
+
+    def _publish(self):
+        fix = self._epoch
+        self._epoch = None
+        self._seen = set()
+        if fix is not None:
+            self.on_fix(fix)
+
+
+class GpsReader:
+    """UART を読むスレッドと測位のリングバッファ"""
+
+    def __init__(self, uart, clock, ring_size=FIX_RING_SIZE):
+        self.uart = uart
+        self.clock = clock
+        self.fixes = deque(maxlen=ring_size)
+        self.latest = None
+        self.seq = 0
+        self.bytes_read = 0
+        self.parser = NmeaParser(self._on_fix)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _on_fix(self, fix):
+        fix.stamp = self.clock.monotonic()
+        self.seq += 1
+        fix.seq = self.seq
+        self.fixes.append(fix)
+        self.latest = fix
+
+    def start(self):
+        self.uart.timeout = READ_TIMEOUT
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="gps-reader", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                # 溜まっている分を一度に読む (無ければ1バイト目を READ_TIMEOUT まで待つ)
+                data = self.uart.read(self.uart.in_waiting or 1)
+            except Exception:
+                time.sleep(READ_TIMEOUT)
+                continue
+            if data:
+                self.bytes_read += len(data)
+                self.parser.feed(data)
+
+    def fixes_since(self, seq):
+        """seq より新しい測位を古い順に返す (リングから溢れた分は含まれない)"""
+        return [f for f in list(self.fixes) if f.seq > seq]
+
+
+class NmeaGps(Gps):
+    """GpsReader の最新測位を Gps インターフェースで見せる"""
+
+    def __init__(self, reader):
+        self.reader = reader
+        self._seen_seq = 0
+        self._fix = None
+
+    @property
+    def fix(self):
+        """update() で受け取った最新の GpsFix (位置が無い・古い測位なら None)
+
+        受信スレッドは測位ごとに別の GpsFix を置くので、1回取り出せば
+        lat / lon / hdop / speed / course は必ず同じ測位の値になる。
+        """
+        fix = self._fix
+        if (fix is None or not fix.valid or fix.lat is None
+                or self.reader.clock.monotonic() - fix.stamp >= FIX_TIMEOUT):
+            return None
+        return fix
+
+    def update(self):
+        """前回から新しい測位が届いていれば True (UART には触らない)"""
+        fix = self.reader.latest
+        if fix is None or fix.seq == self._seen_seq:
+            return False
+        self._seen_seq = fix.seq
+        self._fix = fix
+        return True
+
+    @property
+    def has_fix(self):
+        fix = self.reader.latest
+        return (fix is not None and fix.valid and fix.lat is not None
+                and self.reader.clock.monotonic() - fix.stamp < FIX_TIMEOUT)
+
+    @property
+    def latitude(self):
+        fix = self.reader.latest
+        return fix.lat if fix is not None else None
+
+    @property
+    def longitude(self):
+        fix = self.reader.latest
+        return fix.lon if fix is not None else None
+
+    @property
+    def hdop(self):
+        fix = self.reader.latest
+        return fix.hdop if fix is not None else None
+
+    @property
+    def speed(self):
+        fix = self.reader.latest
+        return fix.speed if fix is not None else None
+
+    @property
+    def course(self):
+        fix = self.reader.latest
+        return fix.course if fix is not None else None
+
+    def reset_input_buffer(self):
+        # 受信スレッドが常に読み切っているので、捨てるデータは無い
+        pass
+
+
+def send_command(uart, command):
+    """PMTK などの設定コマンドをチェックサム付きで送る"""
+    uart.write(b"$" + command + b"*%02X\r\n" % nmea_checksum(command))
@@ -0,0 +1,293 @@
+import time
+
+# ==========================================
+# ハードウェア抽象化レイヤ (HAL)
+# ==========================================
+# ミッションの各フェーズは Hardware (下の入れ物) を引数で受け取り、
+# 実機 (hal_real) / シミュレーション (hal_sim) / ログ再生 (hal_replay) を差し替えて動かす。
+# 各インターフェースのメソッド・属性名は adafruit ライブラリに合わせてある。
+
+ALTITUDE_SEA_LEVEL_HPA = 1013.25
+
+
+def pressure_to_altitude(press):
+    """気圧[hPa] -> 高度[m] (国際標準大気の近似式)"""
+    return 44330 * (1.0 - (press / ALTITUDE_SEA_LEVEL_HPA) ** 0.1903)
+
+
+# ==========================================
+# 時計
+# ==========================================
+class RealClock:
+    """実時間の時計"""
+
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class VirtualClock:
+    """sleep() で時刻を進めるだけの仮想時計 (シミュレーション・再生用)
+
+    時刻が進むたびに add_listener() で登録した関数へ経過時間を渡す。
+    ループ側は必ずどこかで sleep() すること (しないと時刻が進まない)。
+    """
+
+    def __init__(self, start=1.0e9, step=0.01):
+        self._epoch = start
+        self._mono = 0.0
+        self.step = step
+        self._listeners = []
+
+    def add_listener(self, fn):
+        self._listeners.append(fn)
+
+    def time(self):
+        return self._epoch + self._mono
+
+    def monotonic(self):
+        return self._mono
+
+    def sleep(self, seconds):
+        # 物理モデルが粗くならないよう step 以下に刻んで進める
+        while seconds > 1e-12:
+            dt = min(self.step, seconds)
+            self._mono += dt
+            seconds -= dt
+            for fn in self._listeners:
+                fn(dt)
+
+
+# ==========================================
+# デバイスのインターフェース
+# ==========================================
+class Motors:
+    """左右2chのモーター ('A'=左, 'B'=右)。_write() を各バックエンドが実装する
+
+    ミッションには motor_driver.MotorDriver (ランプ・トリム) で包んで渡す。
+    speed() は指令した値、output() はいま出ている値 (ここでは同じ)。
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self._speed = {'A': 0.0, 'B': 0.0}
+
+    def set_speed(self, motor, throttle):
+        throttle = max(-1.0, min(1.0, throttle))
+        if motor not in self._speed:
+            return
+        self._speed[motor] = throttle
+        self._write(motor, throttle)
+
+    def speed(self, motor):
+        return self._speed[motor]
+
+    def output(self, motor):
+        return self._speed[motor]
+
+    def close(self):
+        pass
+
+    def stop(self, duration=0.5, steps=10):
+        """現在の出力から duration 秒かけて段階的に停止する"""
+        for dt in self.stop_steps(duration, steps):
+            self.clock.sleep(dt)
+
+    def stop_steps(self, duration=0.5, steps=10):
+        """stop() のコルーチン版。待ち時間 [s] を yield する (mission_engine 用)"""
+        start_A = self._speed['A']
+        start_B = self._speed['B']
+        if start_A == 0.0 and start_B == 0.0:
+            return
+        for i in range(1, steps + 1):
+            ratio = 1.0 - (i / steps)
+            self.set_speed('A', start_A * ratio)
+            self.set_speed('B', start_B * ratio)
+            yield duration / steps
+        self.set_speed('A', 0.0)
+        self.set_speed('B', 0.0)
+
+    def _write(self, motor, throttle):
+        raise NotImplementedError
+
+
+class Imu:
+    """9軸IMU (BNO055 互換)
+
+    euler              : (heading, roll, pitch) [deg] 取得失敗時は要素が None
+    acceleration       : (ax, ay, az) [m/s^2]
+    gyro               : (gx, gy, gz) [rad/s]
+    calibration_status : (sys, gyro, accel, mag) 各 0〜3
+    read_motion()      : (euler, acceleration, gyro) をまとめて返す
+    restart_fusion()   : フュージョンを再起動して自動校正をやり直す
+    """
+
+    euler = (None, None, None)
+    acceleration = (None, None, None)
+    gyro = (None, None, None)
+    calibration_status = (0, 0, 0, 0)
+
+    def read_motion(self):
+        # 実機ドライバは1回のバースト読み出しで上書きする
+        return self.euler, self.acceleration, self.gyro
+
+    def restart_fusion(self):
+        pass
+
+
+class Barometer:
+    """気圧センサ (DPS310 互換)。pressure [hPa], temperature [℃]"""
+
+    pressure = ALTITUDE_SEA_LEVEL_HPA
+    temperature = 20.0
+
+
+class RangeSensor:
+    """ToF測距 (VL53L1X 互換)。distance [cm] (範囲外は None)"""
+
+    data_ready = False
+    distance = None
+
+    def clear_interrupt(self):
+        pass
+
+
+class GpsReading:
+    """1回分の測位 (lat / lon / hdop / speed / course をまとめて取り出す用)"""
+
+    __slots__ = ("lat", "lon", "hdop", "speed", "course")
+
+    def __init__(self, lat, lon, hdop=None, speed=None, course=None):
+        self.lat = lat
+        self.lon = lon
+        self.hdop = hdop
+        self.speed = speed
+        self.course = course
+
+
+class Gps:
+    """GPS受信機 (adafruit_gps 互換)
+
+    update() は前回から新しい測位が届いていれば True。
+    hdop / speed [m/s] / course [deg] は受信機が出していなければ None。
+    fix は update() で受け取った測位を1つのオブジェクトにしたもの (使える位置が無ければ None)。
+    別スレッドで受信する実装 (gps_reader) では latitude と longitude を別々に読むと
+    違う測位の値が混ざることがあるので、位置は fix から取る。
+    """
+
+    has_fix = False
+    latitude = None
+    longitude = None
+    hdop = None
+    speed = None
+    course = None
+
+    @property
+    def fix(self):
+        if not self.has_fix or self.latitude is None:
+            return None
+        return GpsReading(self.latitude, self.longitude, self.hdop, self.speed, self.course)
+
+    def update(self):
+        return False
+
+    def reset_input_buffer(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class AiCamera:
+    """AIカメラ (IMX500)。capture_metadata() は次フレームの推論結果まで待つ
+
+    poll_metadata() は待たずに、前回から新しいフレームがあればその結果を返す (無ければ None)。
+    exposure_time(metadata) はそのフレームの露光開始時刻 (clock.monotonic() の時間軸)。
+    start() は推論を始める (起動直後は止めておき、使う直前に呼ぶカメラ向け。戻るまで待ってよい)。
+    """
+
+    def start(self):
+        pass
+
+    def capture_metadata(self):
+        return {}
+
+    def poll_metadata(self):
+        return None
+
+    def exposure_time(self, metadata):
+        return None
+
+    def stop(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class Output:
+    """PWM/GPIO 出力 (ニクロム線・LED)。duty_cycle / value を書くだけ"""
+
+    duty_cycle = 0
+    value = False
+
+
+class Hardware:
+    """ミッションに渡すデバイス一式 + 時計 + ログ出力先
+
+    接続できなかったセンサー (imu, baro) は None のまま渡す。
+    log は FlightLogger 互換 (log(*row), flush()) のオブジェクトか None。
+    sensors は attach_sensor_service() で付けた SensorService (無ければ None)。
+    frames は attach_camera_pipeline() で付けた CameraPipeline (無ければ None)。
+    engine は run_mission() が実行中 (実行後) の mission_engine.Engine。
+    pose は run_mission() が付ける pose_filter.PoseFilter (GPS + IMU + モーター指令の位置推定)。
+    route は run_mission() が付ける route.Route (経由点 → ゴールの経路)。
+    timing は各ループの周期・処理時間 (loop_timing.LoopTimings)。無ければ run_mission() が付ける。
+    """
+
+    def __init__(self, clock, motors, imu=None, baro=None, tof_front=None, tof_bottom=None,
+                 gps=None, camera=None, nicrome=None, led=None, base_altitude=0.0, log=None):
+        self.clock = clock
+        self.motors = motors
+        self.imu = imu
+        self.baro = baro
+        self.tof_front = tof_front
+        self.tof_bottom = tof_bottom
+        self.gps = gps
+        self.camera = camera
+        self.nicrome = nicrome if nicrome is not None else Output()
+        self.led = led if led is not None else Output()
+        self.base_altitude = base_altitude
+        self.log = log
+        self.sensors = None
+        self.frames = None
+        self.engine = None
+        self.pose = None
+        self.route = None
+        self.timing = None
+
+    def close(self):
+        """センサー・カメラ取得、GPS受信の停止、モーター停止、カメラ解放"""
+        if self.sensors is not None:
+            self.sensors.stop()
+        if self.frames is not None:
+            self.frames.stop()
+        if self.gps is not None:
+            self.gps.close()
+        try:
+            self.motors.stop()
+            self.motors.close()
+        except Exception:
+            pass
+        if self.camera is not None:
+            try:
+                self.camera.stop()
+                self.camera.close()
+            except Exception:
+                pass
@@ -0,0 +1,378 @@
+import time
+import struct
+import threading
+import board
+import digitalio
+import pwmio
+import serial
+import adafruit_bno055
+import adafruit_dps310
+import adafruit_vl53l1x
+from digitalio import DigitalInOut, Direction
+
+from bno055_burst import Bno055Burst
+from bringup import Bringup
+from motor_driver import MotorDriver
+from gps_reader import GpsReader, NmeaGps, send_command
+from i2c_bus import I2CArbiter, PRIO_IMU, PRIO_TOF, PRIO_BARO
+from live_view import LiveView, capture_with_preview
+from hal import (RealClock, Motors, Imu, Barometer, RangeSensor, AiCamera,
+                 Hardware, pressure_to_altitude)
+
+# ==========================================
+# 実機バックエンド (Raspberry Pi + 各センサー)
+# ==========================================
+# ピン配置
+PIN_AIN1, PIN_AIN2, PIN_PWMA = board.D6, board.D5, board.D12
+PIN_BIN1, PIN_BIN2, PIN_PWMB = board.D22, board.D23, board.D13
+PIN_XSHUT_FRONT = board.D27
+PIN_XSHUT_BOTTOM = board.D17
+NICROME_PIN = board.D4
+LED_PIN = board.D21
+
+TOF_FRONT_ADDRESS = 0x30
+CALIB_FILE = "/home/yuki/cansat_raspi/bno_offsets.bin"
+NETWORK_FILE = "network.rpk"
+GPS_PORT = "/dev/serial0"
+MOTOR_TRIM = {'A': 1.0, 'B': 0.995015}   # 左右のモーターの個体差 (navi/kikan.py の MOTOR_B_SCALE)
+CAMERA_SETTLE = 2.0     # カメラ起動後、露出が落ち着くまで待つ時間 / 起動電流のスパイクを次の起動と離す時間 [s]
+
+
+class PwmMotors(Motors):
+    """TB6612系 H ブリッジ 2ch"""
+
+    def __init__(self, clock):
+        super().__init__(clock)
+        print("モーター初期化中...")
+        self.ain1 = digitalio.DigitalInOut(PIN_AIN1)
+        self.ain2 = digitalio.DigitalInOut(PIN_AIN2)
+        self.ain1.direction = digitalio.Direction.OUTPUT
+        self.ain2.direction = digitalio.Direction.OUTPUT
+        self.pwma = pwmio.PWMOut(PIN_PWMA, frequency=20000)
+
+        self.bin1 = digitalio.DigitalInOut(PIN_BIN1)
+        self.bin2 = digitalio.DigitalInOut(PIN_BIN2)
+        self.bin1.direction = digitalio.Direction.OUTPUT
+        self.bin2.direction = digitalio.Direction.OUTPUT
+        self.pwmb = pwmio.PWMOut(PIN_PWMB, frequency=20000)
+
+    def _write(self, motor, throttle):
+        duty = int(abs(throttle) * 65535)
+        if motor == 'A':
+            self.ain1.value = (throttle > 0)
+            self.ain2.value = (throttle < 0)
+            self.pwma.duty_cycle = duty
+        elif motor == 'B':
+            self.bin1.value = (throttle > 0)
+            self.bin2.value = (throttle < 0)
+            self.pwmb.duty_cycle = duty
+
+
+class Bno055Imu(Imu):
+    def __init__(self, i2c, address=0x28):
+        self.dev = adafruit_bno055.BNO055_I2C(i2c, address=address)
+        self.burst = Bno055Burst(self.dev.i2c_device)
+
+    @property
+    def euler(self):
+        return self.dev.euler
+
+    @property
+    def acceleration(self):
+        return self.dev.acceleration
+
+    @property
+    def gyro(self):
+        return self.dev.gyro
+
+    def read_motion(self):
+        """加速度〜オイラー角の 24 バイトを1回の取引で読む (プロパティ3回分)"""
+        return self.burst.read_motion()
+
+    @property
+    def calibration_status(self):
+        return self.dev.calibration_status
+
+    def restart_fusion(self):
+        try:
+            self.dev.mode = adafruit_bno055.CONFIG_MODE
+            time.sleep(0.05)
+            self.dev.mode = adafruit_bno055.NDOF_MODE
+            time.sleep(0.05)
+        except Exception:
+            pass
+
+    def save_offsets(self, path=CALIB_FILE):
+        offsets = self.dev.offsets_accelerometer + \
+                  self.dev.offsets_gyroscope + \
+                  self.dev.offsets_magnetometer + \
+                  (self.dev.radius_accelerometer, self.dev.radius_magnetometer)
+        with open(path, "wb") as f:
+            f.write(struct.pack("<hhhhhhhhhHH", *offsets))
+
+    def load_offsets(self, path=CALIB_FILE):
+        """保存されたオフセットをセンサーに流し込む"""
+        with open(path, "rb") as f:
+            data = struct.unpack("<hhhhhhhhhHH", f.read())
+        self.dev.offsets_accelerometer = data[0:3]
+        self.dev.offsets_gyroscope = data[3:6]
+        self.dev.offsets_magnetometer = data[6:9]
+        self.dev.radius_accelerometer = data[9]
+        self.dev.radius_magnetometer = data[10]
+
+
+class Dps310Barometer(Barometer):
+    def __init__(self, i2c, address=0x77):
+        self.dev = adafruit_dps310.DPS310(i2c, address=address)
+
+    @property
+    def pressure(self):
+        return self.dev.pressure
+
+    @property
+    def temperature(self):
+        return self.dev.temperature
+
+
+class Vl53l1xRange(RangeSensor):
+    def __init__(self, dev):
+        self.dev = dev
+
+    @property
+    def data_ready(self):
+        return self.dev.data_ready
+
+    @property
+    def distance(self):
+        return self.dev.distance
+
+    def clear_interrupt(self):
+        self.dev.clear_interrupt()
+
+
+class UartGps(NmeaGps):
+    """UART の NMEA を受信スレッドで読み続ける GPS"""
+
+    def __init__(self, clock, port=GPS_PORT):
+        self.uart = serial.Serial(port, baudrate=9600, timeout=1)
+        send_command(self.uart, b"PMTK314,0,1,0,1,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0") # RMC と GGA のみ
+        send_command(self.uart, b"PMTK220,500") # 2Hz更新 (GPSの取得頻度を上げる)
+        super().__init__(GpsReader(self.uart, clock))
+        self.reader.start()
+
+    def close(self):
+        self.reader.stop()
+        self.uart.close()
+
+
+class Imx500Camera(AiCamera):
+    """IMX500 + Picamera2
+
+    起動時に load() でネットワーク (network.rpk) をセンサーへ書き込んで止めておき、
+    推論は start() (Phase 3 の直前にカメラ取得スレッドが呼ぶ) から始める。
+    """
+
+    def __init__(self, network=NETWORK_FILE, live=None):
+        # picamera2 は import だけで時間がかかるので、起動スレッドの中で読む
+        from picamera2 import Picamera2
+        from picamera2.devices import IMX500
+        print("AIカメラ初期化中...")
+        self.imx500 = IMX500(network)
+        self.picam2 = Picamera2(self.imx500.camera_num)
+        self.live = live    # LiveView (地上試験用の映像配信)。None なら画像は取り出さない
+        config = self.picam2.create_preview_configuration(main={"size": (320, 240)},
+                                                          lores={"size": (320, 240)})
+        self.picam2.configure(config)
+        self.running = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        """ストリームを1度流してネットワークの書き込み (数秒) を済ませ、止めておく"""
+        self.picam2.start()
+        self.picam2.capture_metadata()   # 最初の推論結果が出た = 書き込み完了
+        self.picam2.stop()
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            self.picam2.start()
+            self.running = True
+        time.sleep(CAMERA_SETTLE)   # 露出が落ち着くまでのフレームは使わない
+
+    def capture_metadata(self):
+        return capture_with_preview(self.picam2, self.live, self.imx500)
+
+    def exposure_time(self, metadata):
+        # SensorTimestamp は露光開始の CLOCK_BOOTTIME [ns]。time.monotonic() の時間軸へ直す
+        ts = metadata.get('SensorTimestamp')
+        if ts is None:
+            return None
+        return ts * 1e-9 - time.clock_gettime(time.CLOCK_BOOTTIME) + time.monotonic()
+
+    def stop(self):
+        with self._lock:
+            self.picam2.stop()
+            self.running = False
+
+    def close(self):
+        if self.live is not None:
+            self.live.stop()
+            print(self.live.report())
+        self.picam2.close()
+
+
+# ==========================================
+# 起動シーケンス
+# ==========================================
+def init_tof_pair(i2c_front, i2c_bottom):
+    """XSHUT で片方ずつ起こし、Front を 0x30 へ移してから Bottom を起動する"""
+    xshut_front = digitalio.DigitalInOut(PIN_XSHUT_FRONT)
+    xshut_front.direction = digitalio.Direction.OUTPUT
+    xshut_bottom = digitalio.DigitalInOut(PIN_XSHUT_BOTTOM)
+    xshut_bottom.direction = digitalio.Direction.OUTPUT
+    # 両方一度眠らせる（リセット）
+    xshut_front.value = False
+    xshut_bottom.value = False
+    time.sleep(0.1)
+    # Frontだけ起こしてアドレス変更
+    xshut_front.value = True
+    time.sleep(0.1)
+    tof_front = adafruit_vl53l1x.VL53L1X(i2c_front)
+    with tof_front.i2c_device as i2c_dev:
+        i2c_dev.write(bytes([0x00, 0x01, TOF_FRONT_ADDRESS])) # 0x30へ書き換え
+    tof_front.i2c_device.device_address = TOF_FRONT_ADDRESS
+    # Bottomを起こす (デフォルト0x29で起動)
+    xshut_bottom.value = True
+    time.sleep(0.1)
+    tof_bottom = adafruit_vl53l1x.VL53L1X(i2c_bottom)
+    # 計測設定
+    for t in [tof_front, tof_bottom]:
+        t.distance_mode = 2
+        t.timing_budget = 50
+        t.start_ranging()
+    return Vl53l1xRange(tof_front), Vl53l1xRange(tof_bottom)
+
+
+def wait_mag_calibration(imu, cancel=None):
+    """Mag:3 になるまで待ち、オフセットを保存する (Ctrl+C / cancel で中断)"""
+    print("--- BNO055 手動キャリブレーション保存モード ---")
+    print("機体をゆっくり8の字に回して、Mag: 3 を目指してください。")
+    try:
+        while True:
+            sys_cal, gyro, accel, mag = imu.calibration_status
+            print(f"ステータス - Sys:{sys_cal} Gyro:{gyro} Accel:{accel} Mag:{mag}", end="\r")
+            # Magが3になったら保存して終了
+            if mag == 3:
+                print("\n\n✅ Mag:3 到達！ データを保存します...")
+                imu.save_offsets(CALIB_FILE)
+                print(f"保存完了: {CALIB_FILE}")
+                break
+            # 起動シーケンスの中 (別スレッド) では Ctrl+C が届かないので cancel で止める
+            if cancel is not None and cancel.wait(0.2):
+                print("\n中断されました。")
+                break
+            if cancel is None:
+                time.sleep(0.2)
+    except KeyboardInterrupt:
+        print("\n中断されました。")
+
+
+def calibrate_base_altitude(baro, samples=10):
+    """地上で気圧を平均して基準高度を求める"""
+    print("--- 初期高度(オフセット)のキャリブレーション ---")
+    try:
+        calib_alts = []
+        for _ in range(samples):
+            calib_alts.append(pressure_to_altitude(baro.pressure))
+            time.sleep(0.1)
+        base_altitude = sum(calib_alts) / samples
+        print(f"✅ 基準高度設定完了: {base_altitude:.2f} m")
+        return base_altitude
+    except Exception as e:
+        print(f"⚠️ オフセット設定失敗。基準=0.0mで開始: {e}")
+        return 0.0
+
+
+def open_imu(bus):
+    try:
+        imu = Bno055Imu(bus.client("bno055", PRIO_IMU), address=0x28)
+        print("✅ BNO055 接続成功 (0x28)")
+        return imu
+    except Exception as e:
+        print(f"❌ BNO055が見つかりません: {e}")
+        return None
+
+
+def open_barometer(bus):
+    try:
+        baro = Dps310Barometer(bus.client("dps310", PRIO_BARO), address=0x77)
+        print("✅ 気圧センサ接続成功 (Address: 0x77)")
+        return baro
+    except Exception as e:
+        print(f"❌ 気圧センサが見つかりません: {e}")
+        return None
+
+
+def open_camera(live):
+    camera = Imx500Camera(live=live)
+    camera.load()
+    return camera
+
+
+def open_live_view(port):
+    if not port:
+        return None
+    live = LiveView(port=port)
+    live.start()
+    print(f"🌐 ライブビュー配信開始 (ポート {port})")
+    return live
+
+
+def open_led():
+    led = DigitalInOut(LED_PIN)
+    led.direction = Direction.OUTPUT
+    led.value = False
+    return led
+
+
+def build_real_hardware(log=None, live_view_port=None):
+    """実機のデバイスを依存関係に沿って並列に初期化して Hardware にまとめる
+
+    - IMX500 のネットワーク書き込み (数秒) は ToF・IMU・気圧・GPS の初期化と重ねる
+    - カメラの推論はここでは始めない (attach_camera_pipeline(lazy=True) で Phase 3 の直前に起動)
+    - 起動電流の大きいもの (ToF・カメラ) は1つずつ、カメラの後は CAMERA_SETTLE 秒空ける
+    live_view_port を指定すると、そのポートで映像と検出枠を MJPEG 配信する。
+    """
+    clock = RealClock()
+    boot = Bringup()
+    boot.add("motors", lambda: MotorDriver(PwmMotors(clock), clock, trim=MOTOR_TRIM), required=True)
+    boot.add("nicrome", lambda: pwmio.PWMOut(NICROME_PIN, frequency=100, duty_cycle=0), required=True)
+    boot.add("led", open_led, required=True)
+    # バスは調停役が持ち、各デバイスには優先度付きの窓口を渡す (同時に初期化しても取引は1つずつ)
+    boot.add("i2c", lambda: I2CArbiter(board.I2C()), required=True)
+    boot.add("tof", lambda bus: init_tof_pair(bus.client("tof_front", PRIO_TOF),
+                                              bus.client("tof_bottom", PRIO_TOF)),
+             after=("i2c",), required=True, power=True)
+    boot.add("imu", open_imu, after=("i2c",))
+    boot.add("baro", open_barometer, after=("i2c",))
+    boot.add("base_alt", lambda baro: calibrate_base_altitude(baro) if baro else 0.0, after=("baro",))
+    boot.add("live_view", lambda: open_live_view(live_view_port))
+    boot.add("camera", open_camera, after=("live_view",), required=True, power=True,
+             settle=CAMERA_SETTLE)
+    boot.add("gps", lambda: UartGps(clock), required=True)
+    # 手動の 8の字キャリブレーションは他の初期化を待たせない
+    # (Ctrl+C は boot.cancel 経由でこの待ちだけを止める)
+    boot.add("mag_calib", lambda imu: wait_mag_calibration(imu, boot.cancel) if imu else None,
+             after=("imu",))
+    dev = boot.run()
+    print(boot.report())
+
+    tof_front, tof_bottom = dev["tof"]
+    hw = Hardware(clock, dev["motors"], imu=dev["imu"], baro=dev["baro"],
+                  tof_front=tof_front, tof_bottom=tof_bottom,
+                  gps=dev["gps"], camera=dev["camera"], nicrome=dev["nicrome"], led=dev["led"],
+                  base_altitude=dev["base_alt"], log=log)
+    hw.i2c = dev["i2c"]
+    hw.bringup = boot
+    return hw
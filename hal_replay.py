@@ -0,0 +1,452 @@
+import io
+import os
+import csv
+import sys
+import math
+import time
+import bisect
+import argparse
+import contextlib
+from datetime import datetime
+
+from geodesy import destination_array
+from imx500_detect import encode_detections, CONE_CLASS
+from camera_pipeline import attach_camera_pipeline
+from motor_driver import MotorDriver
+from hal import (VirtualClock, Motors, Imu, Barometer, RangeSensor, Gps, AiCamera, Output,
+                 Hardware, ALTITUDE_SEA_LEVEL_HPA)
+
+# ==========================================
+# ログ再生バックエンド
+# ==========================================
+# 記録済みの navi_*.csv (または .bin) の各行を仮想時計の時刻に合わせて
+# GPS/IMU/気圧/ToF/カメラの読み値として返す。モーター指令は記録するだけで
+# センサー値には反映しない (開ループ再生)。
+# 再生後、ミッションが出した判断 (Phase, State, L/R) を記録と突き合わせる。
+
+CAMERA_FPS = 10.0
+END_MARGIN = 2.0   # 記録の最終行からこの秒数で再生を打ち切る
+
+
+class RecordedRow:
+    __slots__ = ("t", "phase", "state", "lat", "lon", "heading", "target_ang", "dist",
+                 "roll", "pitch", "l_val", "r_val", "fix", "rel_alt", "accel_norm", "ai_cx", "tof")
+
+
+def _num(v, default=0.0):
+    if v is None or v == "":
+        return default
+    try:
+        return float(v)
+    except ValueError:
+        return default
+
+
+def load_recording(path):
+    """navi_*.csv / navi_*.bin を RecordedRow のリストにする (時刻順)"""
+    if path.endswith(".bin"):
+        return _load_bin(path)
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        header = None
+        raw = []
+        for rec in reader:
+            if not rec:
+                continue
+            if rec[0] in ("Timestamp", "Phase"):
+                header = rec  # 途中に重複したヘッダー行があっても読み飛ばす
+                continue
+            if header is None or len(rec) != len(header):
+                continue  # GOAL REACHED などの注記行
+            raw.append(dict(zip(header, rec)))
+
+    rows = []
+    for r in raw:
+        row = RecordedRow()
+        try:
+            stamp = datetime.strptime(r["Timestamp"], "%Y-%m-%d %H:%M:%S").timestamp()
+        except (KeyError, ValueError):
+            continue
+        row.t = stamp
+        row.lat = _num(r.get("Lat"))
+        row.lon = _num(r.get("Lon"))
+        row.heading = _num(r.get("Heading"))
+        row.target_ang = _num(r.get("TargetAngle"))
+        row.dist = _num(r.get("Dist"))
+        row.roll = _num(r.get("Roll"))
+        row.pitch = _num(r.get("Pitch"))
+        row.l_val = _num(r.get("L_Speed"))
+        row.r_val = _num(r.get("R_Speed"))
+        row.fix = int(_num(r.get("Fix")))
+        row.rel_alt = _num(r.get("RelAlt"))
+        row.accel_norm = _num(r.get("AccelNorm"), 9.8) or 9.8
+        row.ai_cx = _num(r.get("AI_CX"), None)
+        # 旧ロガーは未取得を 0 で書いていたので、0 も未取得として扱う
+        row.tof = _num(r.get("ToF_Dist"), None) or None
+        if "Phase" in r:
+            row.phase = int(_num(r["Phase"]))
+            row.state = r.get("State", "")
+        else:
+            # 旧形式 (9列): Phase 2 のみ。State は左右の出力から復元する
+            row.phase = 2
+            if not row.fix:
+                row.state = "NOFIX"
+            elif row.l_val == row.r_val:
+                row.state = "DRIVE"
+            else:
+                row.state = "TURN"
+        rows.append(row)
+
+    _spread_within_second(rows)
+    return rows
+
+
+def _load_bin(path):
+    from telemetry_bin import load
+    _, data = load(path)
+    rows = []
+    for rec in data.tolist():
+        row = RecordedRow()
+        # 先頭17列だけ使う (後から足した FrameSeq などは見ない)
+        (row.phase, row.t, state, row.lat, row.lon, row.heading, row.target_ang, row.dist,
+         row.roll, row.pitch, row.l_val, row.r_val, row.fix, row.rel_alt, row.accel_norm,
+         cx, tof) = rec[:17]
+        row.state = state.rstrip(b"\0").decode()
+        row.ai_cx = None if math.isnan(cx) else cx
+        row.tof = None if math.isnan(tof) else tof
+        rows.append(row)
+    return rows
+
+
+def _spread_within_second(rows):
+    """CSVの時刻は1秒単位なので、同じ秒の行を等間隔に並べ直す"""
+    i = 0
+    while i < len(rows):
+        j = i
+        while j < len(rows) and rows[j].t == rows[i].t:
+            j += 1
+        n = j - i
+        for k in range(i, j):
+            rows[k].t += (k - i) / n
+        i = j
+
+
+def infer_target(rows):
+    """記録された Dist/TargetAngle から、その走行で使っていた目標地点を推定する"""
+    import numpy as np
+    sel = [r for r in rows if r.phase == 2 and r.fix and r.lat and r.dist > 0]
+    if not sel:
+        return None
+    lat, lon = destination_array([r.lat for r in sel], [r.lon for r in sel],
+                                 [r.target_ang for r in sel], [r.dist for r in sel])
+    return float(np.median(lat)), float(np.median(lon))
+
+
+# ==========================================
+# 再生用デバイス
+# ==========================================
+class ReplayFinished(Exception):
+    pass
+
+
+class Recording:
+    """仮想時計の現在時刻に対応する記録行を返す"""
+
+    def __init__(self, clock, rows):
+        self.clock = clock
+        self.rows = rows
+        self.times = [r.t for r in rows]
+        self.end = self.times[-1] + END_MARGIN
+
+        def stop_at_end(dt):
+            if clock.time() > self.end:
+                raise ReplayFinished()
+        clock.add_listener(stop_at_end)
+
+    def current(self):
+        i = bisect.bisect_right(self.times, self.clock.time()) - 1
+        return self.rows[max(i, 0)]
+
+
+class ReplayMotors(Motors):
+    def _write(self, motor, throttle):
+        pass
+
+
+class ReplayImu(Imu):
+    def __init__(self, rec, mounting_offset):
+        self.rec = rec
+        self.mounting_offset = mounting_offset
+
+    @property
+    def euler(self):
+        r = self.rec.current()
+        # 記録値は取り付け補正後なので、生の読み値に戻して渡す
+        return ((r.heading - self.mounting_offset) % 360, r.roll, r.pitch)
+
+    @property
+    def acceleration(self):
+        return (0.0, 0.0, self.rec.current().accel_norm)
+
+    @property
+    def calibration_status(self):
+        return (3, 3, 3, 3)
+
+
+class ReplayBarometer(Barometer):
+    def __init__(self, rec):
+        self.rec = rec
+
+    @property
+    def pressure(self):
+        h = self.rec.current().rel_alt
+        return ALTITUDE_SEA_LEVEL_HPA * (1.0 - h / 44330.0) ** (1.0 / 0.1903)
+
+
+class ReplayTof(RangeSensor):
+    """ToF_Dist 列を Phase 1 では下向き、Phase 3 では前方の値として返す"""
+
+    def __init__(self, rec, phase):
+        self.rec = rec
+        self.phase = phase
+
+    @property
+    def data_ready(self):
+        return self.rec.current().phase == self.phase
+
+    @property
+    def distance(self):
+        return self.rec.current().tof
+
+
+class ReplayGps(Gps):
+    def __init__(self, rec):
+        self.rec = rec
+        self._last = None
+
+    def update(self):
+        """ログの位置が変わったら新しい測位とみなす"""
+        r = self.rec.current()
+        if not self.has_fix or (r.lat, r.lon) == self._last:
+            return False
+        self._last = (r.lat, r.lon)
+        return True
+
+    @property
+    def has_fix(self):
+        r = self.rec.current()
+        return bool(r.fix) and r.lat != 0
+
+    @property
+    def latitude(self):
+        return self.rec.current().lat
+
+    @property
+    def longitude(self):
+        return self.rec.current().lon
+
+
+class ReplayCamera(AiCamera):
+    def __init__(self, rec):
+        self.rec = rec
+        self._last_index = -1
+
+    def capture_metadata(self):
+        clock = self.rec.clock
+        clock.sleep(1.0 / CAMERA_FPS)
+        return self._render()
+
+    def poll_metadata(self):
+        if int(self.rec.clock.monotonic() * CAMERA_FPS + 1e-6) == self._last_index:
+            return None
+        return self._render()
+
+    def _render(self):
+        self._last_index = int(self.rec.clock.monotonic() * CAMERA_FPS + 1e-6)
+        detections = []
+        cx = self.rec.current().ai_cx
+        if cx is not None:
+            # ログには中心Xしか無いので、大きさ・スコアは固定値
+            detections.append((cx, 0.5, 0.1, 0.2, 0.9, CONE_CLASS))
+        return {'CnnOutputTensor': encode_detections(detections)}
+
+
+class DecisionRecorder:
+    """ミッションが log_tick() で出した行をメモリに溜める (FlightLogger 互換)"""
+
+    def __init__(self):
+        self.rows = []
+
+    def log(self, *row):
+        self.rows.append(row)
+
+    def flush(self, sync=True, timeout=None):
+        return True
+
+    def close(self):
+        pass
+
+
+def build_replay_hardware(rows, mounting_offset=180.0, log=None):
+    clock = VirtualClock(start=rows[0].t - 0.5)
+    rec = Recording(clock, rows)
+    hw = Hardware(clock, MotorDriver(ReplayMotors(clock), clock, threaded=False),
+                  imu=ReplayImu(rec, mounting_offset), baro=ReplayBarometer(rec),
+                  tof_front=ReplayTof(rec, phase=3), tof_bottom=ReplayTof(rec, phase=1),
+                  gps=ReplayGps(rec), camera=ReplayCamera(rec),
+                  nicrome=Output(), led=Output(), base_altitude=0.0, log=log)
+    hw.recording = rec
+    attach_camera_pipeline(hw, threaded=False)
+    return hw
+
+
+# ==========================================
+# 判断の比較
+# ==========================================
+class RunDiff:
+    """1走行ぶんの比較結果"""
+
+    def __init__(self, path, rows, decisions, target, wall_time):
+        self.path = path
+        self.rows = rows
+        self.decisions = decisions
+        self.target = target
+        self.wall_time = wall_time
+        self.pairs = self._pair()
+
+    def _pair(self):
+        # 記録の各行について、その時刻に有効だった再生側の判断を対応させる
+        times = [d[1] for d in self.decisions]
+        pairs = []
+        for r in self.rows:
+            i = bisect.bisect_right(times, r.t) - 1
+            pairs.append((r, self.decisions[i] if i >= 0 else None))
+        return pairs
+
+    @staticmethod
+    def _transitions(seq):
+        out = []
+        last = None
+        for t, phase in seq:
+            if phase != last:
+                out.append((t, phase))
+                last = phase
+        return out
+
+    def recorded_transitions(self):
+        return self._transitions((r.t, r.phase) for r in self.rows)
+
+    def replayed_transitions(self):
+        return self._transitions((d[1], d[0]) for d in self.decisions)
+
+    def summary(self):
+        n = len(self.pairs)
+        matched = [(r, d) for r, d in self.pairs if d is not None]
+        same_state = sum(1 for r, d in matched if d[0] == r.phase and d[2] == r.state)
+        l_err = [abs(d[10] - r.l_val) for r, d in matched]
+        r_err = [abs(d[11] - r.r_val) for r, d in matched]
+        return {
+            "rows": n,
+            "covered": len(matched),
+            "state_agree": same_state / len(matched) if matched else 0.0,
+            "lr_mae": (sum(l_err) + sum(r_err)) / (2 * len(matched)) if matched else 0.0,
+            "rec_phases": "→".join(str(p) for _, p in self.recorded_transitions()),
+            "rep_phases": "→".join(str(p) for _, p in self.replayed_transitions()),
+        }
+
+    def mismatches(self):
+        for r, d in self.pairs:
+            if d is None:
+                yield r, None
+            elif d[0] != r.phase or d[2] != r.state or abs(d[10] - r.l_val) > 0.05 or abs(d[11] - r.r_val) > 0.05:
+                yield r, d
+
+    def write_csv(self, out_path):
+        with open(out_path, "w") as f:
+            f.write("Time,RecPhase,RepPhase,RecState,RepState,RecL,RepL,RecR,RepR,Match\n")
+            for r, d in self.pairs:
+                if d is None:
+                    f.write(f"{r.t:.2f},{r.phase},,{r.state},,{r.l_val:.2f},,{r.r_val:.2f},,0\n")
+                    continue
+                match = int(d[0] == r.phase and d[2] == r.state
+                            and abs(d[10] - r.l_val) <= 0.05 and abs(d[11] - r.r_val) <= 0.05)
+                f.write(f"{r.t:.2f},{r.phase},{d[0]},{r.state},{d[2]},"
+                        f"{r.l_val:.2f},{d[10]:.2f},{r.r_val:.2f},{d[11]:.2f},{match}\n")
+
+
+@contextlib.contextmanager
+def _mission_overrides(module, **values):
+    saved = {k: getattr(module, k) for k in values}
+    for k, v in values.items():
+        setattr(module, k, v)
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            setattr(module, k, v)
+
+
+def replay_run(path, quiet=True, phase3_mode="stopgo"):
+    """1ファイルを再生して RunDiff を返す (記録が無ければ None)
+
+    記録済みのログは Stop & Go 時代のものなので、Phase 3 は既定で stopgo に揃えて比べる。
+    """
+    import main_0306
+
+    rows = load_recording(path)
+    if not rows:
+        return None
+    target = infer_target(rows) or (main_0306.TARGET_LATITUDE, main_0306.TARGET_LONGITUDE)
+    recorder = DecisionRecorder()
+    hw = build_replay_hardware(rows, mounting_offset=main_0306.MOUNTING_OFFSET, log=recorder)
+
+    out = io.StringIO() if quiet else sys.stdout
+    wall_start = time.perf_counter()
+    with _mission_overrides(main_0306, TARGET_LATITUDE=target[0], TARGET_LONGITUDE=target[1],
+                            PHASE3_MODE=phase3_mode):
+        try:
+            with contextlib.redirect_stdout(out):
+                main_0306.run_mission(hw, with_phase1=rows[0].phase == 1,
+                                      resume_scan=rows[0].phase == 3)
+        except ReplayFinished:
+            pass
+    wall = time.perf_counter() - wall_start
+    return RunDiff(path, rows, recorder.rows, target, wall)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="記録ログを再生して、現在のコードの判断と比較する")
+    parser.add_argument("inputs", nargs="+", help="navi_*.csv / navi_*.bin")
+    parser.add_argument("--diff-dir", help="行ごとの比較CSVを書き出すディレクトリ")
+    parser.add_argument("--show", type=int, default=0, help="不一致の先頭N行を表示する")
+    parser.add_argument("-v", "--verbose", action="store_true", help="ミッションの表示をそのまま出す")
+    parser.add_argument("--phase3", choices=("servo", "stopgo"), default="stopgo",
+                        help="Phase 3 の方式 (記録と比べるなら stopgo)")
+    args = parser.parse_args(argv)
+
+    if args.diff_dir:
+        os.makedirs(args.diff_dir, exist_ok=True)
+
+    print("run,rows,covered,state_agree,lr_mae,rec_phases,rep_phases,replay_ms")
+    for path in args.inputs:
+        diff = replay_run(path, quiet=not args.verbose, phase3_mode=args.phase3)
+        name = os.path.basename(path)
+        if diff is None:
+            print(f"{name},0,0,,,,,")
+            continue
+        s = diff.summary()
+        print(f"{name},{s['rows']},{s['covered']},{s['state_agree']:.3f},{s['lr_mae']:.3f},"
+              f"{s['rec_phases']},{s['rep_phases']},{diff.wall_time * 1000:.0f}")
+        if args.show:
+            for k, (r, d) in enumerate(diff.mismatches()):
+                if k >= args.show:
+                    break
+                rep = f"P{d[0]} {d[2]} L{d[10]:.2f} R{d[11]:.2f}" if d else "(判断なし)"
+                print(f"    {datetime.fromtimestamp(r.t):%H:%M:%S}  記録: P{r.phase} {r.state} "
+                      f"L{r.l_val:.2f} R{r.r_val:.2f}  再生: {rep}")
+        if args.diff_dir:
+            diff.write_csv(os.path.join(args.diff_dir, os.path.splitext(name)[0] + "_diff.csv"))
+
+
+if __name__ == "__main__":
+    main()
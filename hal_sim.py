@@ -0,0 +1,512 @@
+import io
+import os
+import sys
+import math
+import time
+import random
+import argparse
+import tempfile
+import contextlib
+
+from geodesy import LocalFrame
+from pose_filter import GPS_UERE
+from imx500_detect import encode_detections, CONE_CLASS
+from sensor_service import attach_sensor_service
+from camera_pipeline import attach_camera_pipeline
+from motor_driver import MotorDriver
+from hal import (VirtualClock, Motors, Imu, Barometer, RangeSensor, Gps, AiCamera, Output,
+                 Hardware, ALTITUDE_SEA_LEVEL_HPA)
+
+# ==========================================
+# シミュレーションバックエンド
+# ==========================================
+# 仮想時計で動く簡易物理モデル。sleep() した分だけ世界が進むので、
+# 実機で数分かかるミッションがノートPCで数秒で終わる。
+#
+# 座標はコーン(目標地点)を原点とした東(x)・北(y) [m]。
+# 旋回の向きは記録ログ (TURN: L=0/R=1 で方位が増える) に合わせてある。
+
+# --- 機体モデル ---
+MAX_SPEED = 0.5          # 両輪1.0の時の前進速度 [m/s]
+TURN_RATE = 15.0         # 左右差1.0の時の旋回速度 [deg/s] (記録ログの TURN から推定)
+MOTOR_TAU = 0.3          # 指令に対する車輪速度の一次遅れ [s]
+
+# --- フライトプロファイル (Phase 1) ---
+GROUND_WAIT = 3.0        # 吊り上げ開始までの地上待機 [s]
+ASCENT_RATE = 3.0        # 上昇速度 [m/s]
+RELEASE_ALTITUDE = 35.0  # 放出高度 [m]
+FREE_FALL_TIME = 1.0     # 放出から開傘までの自由落下 [s]
+DESCENT_RATE = 5.0       # 開傘後の降下速度 [m/s]
+SHOCK_ACCEL = 25.0       # 開傘衝撃 [m/s^2]
+
+# --- センサーモデル ---
+GROUND_ELEVATION = 10.0  # 地面の標高 [m]
+BARO_NOISE = 0.05        # 高度換算のノイズ [m]
+GPS_NOISE = 1.0          # 測位ノイズ [m]
+GPS_PERIOD = 0.5         # 測位更新周期 [s] (PMTK220,500 と同じ)
+GPS_FIX_DELAY = 2.0      # 着地からFixまで [s]
+HEADING_NOISE = 1.0      # 方位ノイズ [deg]
+TOF_MAX_RANGE = 400.0    # ToF の最大測距 [cm]
+TOF_FRONT_FOV = 13.0     # 前方ToFの半視野角 [deg]
+CAMERA_FPS = 15.0
+CAMERA_HFOV = 66.3       # カメラ水平画角 [deg] (Raspberry Pi AI Camera)
+CAMERA_RANGE = 30.0      # コーンを検出できる距離 [m]
+
+
+class SimWorld:
+    """機体の位置・姿勢・高度を進める物理モデル (仮想時計のリスナー)"""
+
+    def __init__(self, clock, target_lat, target_lon, start_x=-20.0, start_y=-35.0,
+                 start_yaw=0.0, in_flight=False, seed=0):
+        self.clock = clock
+        self.rng = random.Random(seed)
+        self.lat0, self.lon0 = target_lat, target_lon
+        self.frame = LocalFrame(target_lat, target_lon)
+        self.x, self.y = start_x, start_y
+        self.yaw = start_yaw % 360
+        self.motors = None
+        self.wheel_a = 0.0  # 実際の車輪速度 (指令に遅れて追従)
+        self.wheel_b = 0.0
+        self.in_flight = in_flight
+        self.flight_t = 0.0
+        self.altitude = 0.0
+        self.accel_norm = 9.8
+        self.landed_at = None if in_flight else 0.0
+        self.path_length = 0.0
+        clock.add_listener(self.step)
+
+    def step(self, dt):
+        if self.in_flight:
+            self._step_flight(dt)
+            return
+        if self.landed_at is None:
+            self.landed_at = self.clock.monotonic()
+        if self.motors is None:
+            return
+        k = min(1.0, dt / MOTOR_TAU)
+        self.wheel_a += (self.motors.speed('A') - self.wheel_a) * k
+        self.wheel_b += (self.motors.speed('B') - self.wheel_b) * k
+        a, b = self.wheel_a, self.wheel_b
+        v = MAX_SPEED * (a + b) / 2.0
+        self.yaw = (self.yaw + TURN_RATE * (b - a) * dt) % 360
+        rad = math.radians(self.yaw)
+        self.x += v * math.sin(rad) * dt
+        self.y += v * math.cos(rad) * dt
+        self.path_length += abs(v) * dt
+
+    def _step_flight(self, dt):
+        self.flight_t += dt
+        t = self.flight_t
+        t_climb = RELEASE_ALTITUDE / ASCENT_RATE
+        t_release = GROUND_WAIT + t_climb
+        self.accel_norm = 9.8
+        if t < GROUND_WAIT:
+            self.altitude = 0.0
+        elif t < t_release:
+            self.altitude = (t - GROUND_WAIT) * ASCENT_RATE
+        elif t < t_release + FREE_FALL_TIME:
+            tf = t - t_release
+            self.altitude = RELEASE_ALTITUDE - 0.5 * 9.8 * tf * tf
+            self.accel_norm = 0.5
+        else:
+            fall = 0.5 * 9.8 * FREE_FALL_TIME ** 2
+            td = t - t_release - FREE_FALL_TIME
+            if td < 0.3:
+                self.accel_norm = SHOCK_ACCEL
+            self.altitude = RELEASE_ALTITUDE - fall - DESCENT_RATE * td
+            if self.altitude <= 0.0:
+                self.altitude = 0.0
+                self.in_flight = False
+
+    # --- 観測 ---
+    def distance_to_cone(self):
+        return math.hypot(self.x, self.y)
+
+    def bearing_to_cone(self):
+        return math.degrees(math.atan2(-self.x, -self.y)) % 360
+
+    def relative_cone_bearing(self):
+        err = self.bearing_to_cone() - self.yaw
+        return (err + 180) % 360 - 180
+
+    def since_landing(self):
+        if self.landed_at is None:
+            return -1.0
+        return self.clock.monotonic() - self.landed_at
+
+
+# ==========================================
+# シミュレーション用デバイス
+# ==========================================
+class SimMotors(Motors):
+    def __init__(self, clock, world):
+        super().__init__(clock)
+        self.world = world
+        world.motors = self
+        self.energy = 0.0  # ∫(|L|+|R|)dt
+        clock.add_listener(self._integrate)
+
+    def _integrate(self, dt):
+        self.energy += (abs(self._speed['A']) + abs(self._speed['B'])) * dt
+
+    def _write(self, motor, throttle):
+        pass
+
+
+class SimImu(Imu):
+    def __init__(self, world, mounting_offset=180.0):
+        self.world = world
+        self.mounting_offset = mounting_offset
+
+    @property
+    def euler(self):
+        w = self.world
+        heading = (w.yaw - self.mounting_offset + w.rng.gauss(0, HEADING_NOISE)) % 360
+        return (heading, 0.0, 0.0)
+
+    @property
+    def acceleration(self):
+        return (0.0, 0.0, self.world.accel_norm)
+
+    @property
+    def calibration_status(self):
+        return (3, 3, 3, 3)
+
+
+class SimBarometer(Barometer):
+    def __init__(self, world):
+        self.world = world
+
+    @property
+    def pressure(self):
+        h = GROUND_ELEVATION + self.world.altitude + self.world.rng.gauss(0, BARO_NOISE)
+        return ALTITUDE_SEA_LEVEL_HPA * (1.0 - h / 44330.0) ** (1.0 / 0.1903)
+
+    @property
+    def temperature(self):
+        return 20.0
+
+
+class SimBottomTof(RangeSensor):
+    def __init__(self, world):
+        self.world = world
+
+    data_ready = True
+
+    @property
+    def distance(self):
+        cm = self.world.altitude * 100.0
+        return cm if cm < TOF_MAX_RANGE else None
+
+
+class SimFrontTof(RangeSensor):
+    def __init__(self, world):
+        self.world = world
+
+    data_ready = True
+
+    @property
+    def distance(self):
+        w = self.world
+        cm = w.distance_to_cone() * 100.0
+        if w.since_landing() < 0 or cm >= TOF_MAX_RANGE or abs(w.relative_cone_bearing()) > TOF_FRONT_FOV:
+            return None
+        return cm
+
+
+class SimGps(Gps):
+    def __init__(self, world):
+        self.world = world
+        self._next_fix = 0.0
+        self.latitude = None
+        self.longitude = None
+        self.hdop = GPS_NOISE / GPS_UERE
+
+    @property
+    def has_fix(self):
+        return self.world.since_landing() >= GPS_FIX_DELAY
+
+    def update(self):
+        w = self.world
+        now = w.clock.monotonic()
+        if not self.has_fix or now < self._next_fix:
+            return False
+        self._next_fix = now + GPS_PERIOD
+        x = w.x + w.rng.gauss(0, GPS_NOISE)
+        y = w.y + w.rng.gauss(0, GPS_NOISE)
+        self.latitude, self.longitude = w.frame.to_latlon(x, y)
+        return True
+
+
+class SimCamera(AiCamera):
+    """コーンが画角内なら IMX500 と同じ形式 (1801要素) のテンソルを返す"""
+
+    def __init__(self, world):
+        self.world = world
+        self.frames = 0
+        self._last_index = -1
+
+    def capture_metadata(self):
+        clock = self.world.clock
+        period = 1.0 / CAMERA_FPS
+        # 次のフレーム境界まで待つ (実機の capture_metadata と同じくブロックする)
+        now = clock.monotonic()
+        clock.sleep(period - (now % period) or period)
+        return self._render()
+
+    def poll_metadata(self):
+        # 前回から新しいフレーム境界を過ぎていれば、そのフレームを返す
+        if int(self.world.clock.monotonic() * CAMERA_FPS + 1e-6) == self._last_index:
+            return None
+        return self._render()
+
+    def exposure_time(self, metadata):
+        return metadata['SensorTimestamp'] * 1e-9
+
+    def _render(self):
+        index = int(self.world.clock.monotonic() * CAMERA_FPS + 1e-6)
+        self._last_index = index
+        self.frames += 1
+
+        detections = []
+        w = self.world
+        rel = w.relative_cone_bearing()
+        dist = w.distance_to_cone()
+        if w.since_landing() >= 0 and abs(rel) < CAMERA_HFOV / 2 and dist < CAMERA_RANGE:
+            # 記録ログの旋回方向と合うよう、方位が小さい側を画像右に写す
+            cx = 0.5 - rel / CAMERA_HFOV
+            # 見かけの大きさは距離に反比例 (1m で画面の高さいっぱい)
+            size = min(1.0, 1.0 / max(dist, 1.0))
+            detections.append((cx, 0.5, 0.5 * size, size, 0.9, CONE_CLASS))
+        return {'CnnOutputTensor': encode_detections(detections),
+                'SensorTimestamp': int(index / CAMERA_FPS * 1e9)}
+
+
+def build_sim_hardware(target_lat, target_lon, log=None, seed=0, in_flight=False,
+                       start_x=-20.0, start_y=-35.0, start_yaw=0.0, mounting_offset=180.0):
+    """仮想時計と物理モデルの上に Hardware を組み立てる"""
+    clock = VirtualClock()
+    world = SimWorld(clock, target_lat, target_lon, start_x=start_x, start_y=start_y,
+                     start_yaw=start_yaw, in_flight=in_flight, seed=seed)
+    hw = Hardware(clock, MotorDriver(SimMotors(clock, world), clock, threaded=False),
+                  imu=SimImu(world, mounting_offset=mounting_offset),
+                  baro=SimBarometer(world),
+                  tof_front=SimFrontTof(world), tof_bottom=SimBottomTof(world),
+                  gps=SimGps(world), camera=SimCamera(world),
+                  nicrome=Output(), led=Output(),
+                  base_altitude=GROUND_ELEVATION, log=log)
+    hw.world = world
+    return hw
+
+
+# ==========================================
+# 実行 (python3 hal_sim.py)
+# ==========================================
+class SimTimeout(Exception):
+    pass
+
+
+def phase3_time(engine, end):
+    """最初に Phase 3 に入ってから end までの時間 (Phase 3 に入っていなければ None)"""
+    if engine is None:
+        return None
+    for start, name, _, _ in engine.timeline:
+        if name == "PHASE3":
+            return end - start
+    return None
+
+
+def phase2_metrics(marks):
+    """最初の Phase 2 開始から最初に Phase 3 へ移るまでの (時間, 走行距離, 出力積分)"""
+    if "PHASE2" not in marks or "PHASE3" not in marks:
+        return None
+    (t2, p2, e2), (t3, p3, e3) = marks["PHASE2"], marks["PHASE3"]
+    return t3 - t2, p3 - p2, e3 - e2
+
+
+def sim_log_stamp(log_dir, seed):
+    """シミュレーションのログ名 (仮想時計の時刻は毎回同じなので seed と実時刻で分ける)
+
+    同じ名前が既にあれば番号を足す (ログは追記で開くので、前の実行に混ざらないように)。
+    """
+    base = f"sim{seed}_{int(time.time())}"
+    stamp, n = base, 1
+    while os.path.exists(f"{log_dir}/navi_{stamp}.bin"):
+        n += 1
+        stamp = f"{base}_{n}"
+    return stamp
+
+
+def run_sim(seed=0, start_x=-20.0, start_y=-35.0, start_yaw=0.0, with_phase1=True,
+            time_limit=900.0, log_dir=None, quiet=True, phase3_mode=None, mission=None,
+            controller=None):
+    """main_0306 のミッションを仮想時間で最後まで走らせ、結果を dict で返す
+
+    phase3_mode を渡すと main_0306.PHASE3_MODE ("servo" / "stopgo") を差し替えて走らせる。
+    mission を渡すと main_0306.MISSION_FILE を差し替え、その経路のゴールにコーンを置く。
+    controller を渡すと main_0306.CONTROLLER (Phase 2 の操舵) を差し替える。
+    """
+    import main_0306
+
+    saved_mission = main_0306.MISSION_FILE
+    if mission is not None:
+        main_0306.MISSION_FILE = mission
+    goal = main_0306.load_mission_route().goal
+    hw = build_sim_hardware(goal.lat, goal.lon,
+                            seed=seed, in_flight=with_phase1,
+                            start_x=start_x, start_y=start_y, start_yaw=start_yaw,
+                            mounting_offset=main_0306.MOUNTING_OFFSET)
+
+    def watchdog(dt):
+        if hw.clock.monotonic() > time_limit:
+            raise SimTimeout()
+    hw.clock.add_listener(watchdog)
+
+    # 各状態に最初に入った時の (時刻, 走行距離, 出力積分)
+    marks = {}
+    def mark_states(dt):
+        engine = hw.engine
+        if engine is not None and engine.state is not None and engine.state.name not in marks:
+            marks[engine.state.name] = (hw.clock.monotonic(), hw.world.path_length, hw.motors.backend.energy)
+    hw.clock.add_listener(mark_states)
+    # 実機と同じくキャッシュ経由で読む (仮想時計なのでスレッドは使わない)
+    attach_sensor_service(hw, threaded=False)
+    attach_camera_pipeline(hw, threaded=False)
+
+    if log_dir:
+        hw.log = main_0306.open_flight_log(log_dir, stamp=sim_log_stamp(log_dir, seed))
+
+    out = io.StringIO() if quiet else sys.stdout
+    saved_mode = main_0306.PHASE3_MODE
+    saved_controller = main_0306.CONTROLLER
+    if phase3_mode is not None:
+        main_0306.PHASE3_MODE = phase3_mode
+    if controller is not None:
+        main_0306.CONTROLLER = controller
+    wall_start = time.perf_counter()
+    completed = False
+    try:
+        with contextlib.redirect_stdout(out):
+            completed = main_0306.run_mission(hw, with_phase1=with_phase1)
+    except SimTimeout:
+        pass
+    finally:
+        main_0306.PHASE3_MODE = saved_mode
+        main_0306.MISSION_FILE = saved_mission
+        main_0306.CONTROLLER = saved_controller
+        if hw.log is not None:
+            hw.log.close()
+    wall = time.perf_counter() - wall_start
+
+    return {
+        "completed": completed,
+        "sim_time": hw.clock.monotonic(),
+        "wall_time": wall,
+        "final_dist": hw.world.distance_to_cone(),
+        "path_length": hw.world.path_length,
+        "energy": hw.motors.backend.energy,
+        "camera_frames": hw.camera.frames,
+        "waypoints": len(hw.route.arrivals) if hw.route is not None else 0,
+        "phase2": phase2_metrics(marks),
+        "phase3_time": phase3_time(hw.engine, hw.clock.monotonic()) if completed else None,
+        "log": hw.log.path if hw.log is not None else None,
+    }
+
+
+def compare_phase3(seeds, modes=("stopgo", "servo"), **kwargs):
+    """同じ着地条件で Phase 3 の方式ごとに走らせ、ゴールまでの時間を比べる"""
+    results = {m: [run_sim(seed=s, phase3_mode=m, **kwargs) for s in seeds] for m in modes}
+    print("seed," + ",".join(f"{m}_phase3,{m}_total,{m}_frames" for m in modes))
+    for i, s in enumerate(seeds):
+        cells = []
+        for m in modes:
+            r = results[m][i]
+            p3 = f"{r['phase3_time']:.1f}" if r["completed"] else "timeout"
+            cells += [p3, f"{r['sim_time']:.1f}", str(r["camera_frames"])]
+        print(f"{s}," + ",".join(cells))
+    for m in modes:
+        done = [r["phase3_time"] for r in results[m] if r["completed"]]
+        done.sort()
+        median = done[len(done) // 2] if done else float("nan")
+        mean = sum(done) / len(done) if done else float("nan")
+        print(f"📊 {m:<7} 完了 {len(done)}/{len(seeds)} | Phase 3 ゴールまで 中央値 {median:.1f}s "
+              f"平均 {mean:.1f}s 最大 {max(done) if done else float('nan'):.1f}s")
+    return results
+
+
+def compare_controllers(seeds, names=None, **kwargs):
+    """Phase 2 の操舵ごとに走らせ、カメラフェーズへ着くまでの時間・走行距離・出力積分を比べる
+
+    着地時の機体の向きは seed ごとに変える (旋回の多い状況も含めるため)。
+    """
+    from steering import CONTROLLERS
+    names = list(names or CONTROLLERS)
+    kwargs.pop("start_yaw", None)
+    results = {n: [run_sim(seed=s, controller=n, start_yaw=(s * 137.0) % 360, **kwargs) for s in seeds]
+               for n in names}
+    print("seed," + ",".join(f"{n}_time,{n}_path,{n}_energy" for n in names))
+    for i, s in enumerate(seeds):
+        cells = []
+        for n in names:
+            m = results[n][i]["phase2"]
+            cells += [f"{v:.1f}" for v in m] if m else ["timeout", "", ""]
+        print(f"{s}," + ",".join(cells))
+    for n in names:
+        done = sorted(r["phase2"] for r in results[n] if r["phase2"])
+        if not done:
+            print(f"📊 {n:<8} 到達 0/{len(seeds)}")
+            continue
+        times = sorted(m[0] for m in done)
+        mean = lambda k: sum(m[k] for m in done) / len(done)
+        print(f"📊 {n:<8} 到達 {len(done)}/{len(seeds)} | 時間 中央値 {times[len(times) // 2]:.1f}s "
+              f"平均 {mean(0):.1f}s 最大 {times[-1]:.1f}s | 走行 {mean(1):.1f}m | 出力積分 {mean(2):.1f} "
+              f"| ミッション完了 {sum(r['completed'] for r in results[n])}/{len(seeds)}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="main_0306 のミッションを仮想時間でシミュレーションする")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start-x", type=float, default=-20.0, help="着地点 (コーンから東へ[m])")
+    parser.add_argument("--start-y", type=float, default=-35.0, help="着地点 (コーンから北へ[m])")
+    parser.add_argument("--start-yaw", type=float, default=0.0, help="着地時の機体方位[deg]")
+    parser.add_argument("--no-phase1", action="store_true", help="着地済みの状態から開始する")
+    parser.add_argument("--time-limit", type=float, default=900.0, help="打ち切り時間 (仮想秒)")
+    parser.add_argument("--log-dir", default=tempfile.gettempdir(), help="航法ログ(.bin)の保存先")
+    parser.add_argument("-v", "--verbose", action="store_true", help="ミッションの表示をそのまま出す")
+    parser.add_argument("--phase3", choices=("servo", "stopgo"), help="Phase 3 の方式 (既定: main_0306.PHASE3_MODE)")
+    parser.add_argument("--mission", help="経由点のミッションファイル (既定: main_0306.MISSION_FILE)")
+    parser.add_argument("--controller", help="Phase 2 の操舵 (既定: main_0306.CONTROLLER)")
+    parser.add_argument("--controllers", type=int, metavar="N",
+                        help="seed 0..N-1 で Phase 2 の操舵ごとにカメラフェーズまでの時間・距離・出力を比べる")
+    parser.add_argument("--compare", type=int, metavar="N",
+                        help="seed 0..N-1 で Stop & Go と連続操舵のゴールまでの時間を比べる")
+    args = parser.parse_args(argv)
+
+    if args.controllers:
+        compare_controllers(range(args.controllers), start_x=args.start_x, start_y=args.start_y,
+                            with_phase1=not args.no_phase1, time_limit=args.time_limit,
+                            mission=args.mission, phase3_mode=args.phase3)
+        return
+
+    if args.compare:
+        compare_phase3(range(args.compare), start_x=args.start_x, start_y=args.start_y,
+                       start_yaw=args.start_yaw, with_phase1=not args.no_phase1,
+                       time_limit=args.time_limit)
+        return
+
+    r = run_sim(seed=args.seed, start_x=args.start_x, start_y=args.start_y, start_yaw=args.start_yaw,
+                with_phase1=not args.no_phase1, time_limit=args.time_limit,
+                log_dir=args.log_dir, quiet=not args.verbose, phase3_mode=args.phase3,
+                mission=args.mission, controller=args.controller)
+    status = "✅ 完了" if r["completed"] else "⚠️ 打ち切り"
+    print(f"{status} | 仮想 {r['sim_time']:.1f}s / 実 {r['wall_time']:.2f}s "
+          f"(x{r['sim_time'] / max(r['wall_time'], 1e-9):.0f}) | 残距離 {r['final_dist']:.2f}m "
+          f"| 走行 {r['path_length']:.1f}m | 出力積分 {r['energy']:.1f} | カメラ {r['camera_frames']}フレーム"
+          f" | 経由点 {r['waypoints']}")
+    if r["log"]:
+        print(f"📝 ログ: {r['log']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import time
+import heapq
+import itertools
+import threading
+
+# ==========================================
+# I2C バス調停 (BNO055 / DPS310 / VL53L1X が1本のバスを共有)
+# ==========================================
+# I2CArbiter がバス (board.I2C()) を持ち、デバイスごとに I2CClient を配る。
+# I2CClient は busio.I2C と同じメソッド (try_lock / writeto / readfrom_into /
+# writeto_then_readfrom ...) を持つので、adafruit のドライバにそのまま渡せる。
+#
+# - 排他: ロック待ちが重なったら優先度の高い (数字が小さい) デバイスから通す
+#         制御用IMU > ゴール判定用ToF > ログ用気圧
+# - 再試行: OSError (クロックストレッチ失敗など) はバスを持ったまま間隔を倍々にして再試行
+# - 統計: デバイスごとの取引回数・待ち時間・占有時間・エラー数
+
+PRIO_IMU = 0
+PRIO_TOF = 1
+PRIO_BARO = 2
+
+RETRIES = 3            # 失敗時の再試行回数
+RETRY_BACKOFF = 0.001  # 最初の再試行までの待ち [s] (以降 2倍ずつ)
+
+
+class PriorityLock:
+    """待ちが重なったら優先度順 (同じなら先着順) に渡すロック"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._busy = False
+        self._waiting = []
+        self._order = itertools.count()
+
+    def acquire(self, priority):
+        with self._cond:
+            if not self._busy and not self._waiting:
+                self._busy = True
+                return
+            ticket = (priority, next(self._order))
+            heapq.heappush(self._waiting, ticket)
+            while self._busy or self._waiting[0] != ticket:
+                self._cond.wait()
+            heapq.heappop(self._waiting)
+            self._busy = True
+
+    def release(self):
+        with self._cond:
+            self._busy = False
+            self._cond.notify_all()
+
+
+class I2CClient:
+    """1デバイス分のバスの窓口 (busio.I2C 互換)"""
+
+    def __init__(self, arbiter, name, priority):
+        self.arbiter = arbiter
+        self.name = name
+        self.priority = priority
+        # 統計
+        self.transactions = 0
+        self.retries = 0
+        self.errors = 0        # 再試行しても失敗した回数
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.hold_total = 0.0
+        self.hold_max = 0.0
+        self._t_lock = 0.0
+
+    # --- ロック (adafruit_bus_device.I2CDevice が使う) ---
+    def try_lock(self):
+        t0 = time.perf_counter()
+        self.arbiter.acquire(self.priority)
+        self._t_lock = time.perf_counter()
+        wait = self._t_lock - t0
+        self.wait_total += wait
+        if wait > self.wait_max:
+            self.wait_max = wait
+        return True
+
+    def unlock(self):
+        hold = time.perf_counter() - self._t_lock
+        self.transactions += 1
+        self.hold_total += hold
+        if hold > self.hold_max:
+            self.hold_max = hold
+        self.arbiter.release()
+
+    def __enter__(self):
+        self.try_lock()
+        return self
+
+    def __exit__(self, *exc):
+        self.unlock()
+        return False
+
+    # --- 転送 (ロックを持った状態で呼ばれる) ---
+    def _retry(self, fn, *args, **kwargs):
+        delay = RETRY_BACKOFF
+        for attempt in range(RETRIES + 1):
+            try:
+                return fn(*args, **kwargs)
+            except OSError:
+                if attempt == RETRIES:
+                    self.errors += 1
+                    raise
+                self.retries += 1
+                time.sleep(delay)
+                delay *= 2
+
+    def writeto(self, address, buffer, *, start=0, end=None):
+        return self._retry(self.arbiter.i2c.writeto, address, buffer, start=start, end=end)
+
+    def readfrom_into(self, address, buffer, *, start=0, end=None):
+        return self._retry(self.arbiter.i2c.readfrom_into, address, buffer, start=start, end=end)
+
+    def writeto_then_readfrom(self, address, buffer_out, buffer_in, *,
+                              out_start=0, out_end=None, in_start=0, in_end=None):
+        return self._retry(self.arbiter.i2c.writeto_then_readfrom, address, buffer_out, buffer_in,
+                           out_start=out_start, out_end=out_end, in_start=in_start, in_end=in_end)
+
+    def scan(self):
+        return self.arbiter.i2c.scan()
+
+    def deinit(self):
+        pass
+
+    def read_register(self, address, register, buffer):
+        """レジスタ先頭から len(buffer) バイトを1回の取引で読む (バースト読み出し)"""
+        with self:
+            self.writeto_then_readfrom(address, bytes([register]), buffer)
+        return buffer
+
+
+class I2CArbiter:
+    def __init__(self, i2c):
+        self.i2c = i2c
+        self.clients = {}
+        self._lock = PriorityLock()
+
+    def client(self, name, priority):
+        c = I2CClient(self, name, priority)
+        self.clients[name] = c
+        return c
+
+    def acquire(self, priority):
+        self._lock.acquire(priority)
+        # busio 側のロックも取っておく (他に使う者はいないので即座に取れる)
+        while not self.i2c.try_lock():
+            pass
+
+    def release(self):
+        self.i2c.unlock()
+        self._lock.release()
+
+    def report(self):
+        lines = ["📊 I2C バス統計"]
+        for c in sorted(self.clients.values(), key=lambda c: c.priority):
+            n = c.transactions or 1
+            lines.append(f"  {c.name:<11} 取引 {c.transactions}回 | 再試行 {c.retries} | 失敗 {c.errors} | "
+                         f"待ち 平均 {c.wait_total / n * 1000:.2f}ms 最大 {c.wait_max * 1000:.2f}ms | "
+                         f"占有 平均 {c.hold_total / n * 1000:.2f}ms 最大 {c.hold_max * 1000:.2f}ms")
+        return "\n".join(lines)
@@ -0,0 +1,158 @@
+import numpy as np
+
+# ==========================================
+# IMX500 検出テンソルの復号 (best_imx)
+# ==========================================
+# best_imx は最後に MultiClassNMS を持ち、出力4本 (dnnParams.xml の outputTensor ordinal 順)
+#   output_0  ボックス 300x4 (x1, y1, x2, y2) 入力画素 (320x320)
+#   output_1  スコア   300 (0〜1)
+#   output_2  クラス   300
+#   output_3  検出数   1
+# が CnnOutputTensor に ordinal 順で平坦化されて計 1801 要素で届く。並びは
+#   [0:1200] ボックス | [1200:1500] スコア | [1500:1800] クラス | [1800] 検出数
+# ボックスは (検出, 座標) の行優先 (1検出の4座標が並ぶ)。実機 (hal_real) では
+# picamera2 の IMX500.get_outputs() で出力ごとの形 (get_output_shapes) に分けてから
+# normalize_metadata() でこの並びに詰め直すので、センサー側の直列化の順序に依存しない。
+# 座標の順は BOX_ORDER ("xy" = x1, y1, x2, y2 / "yx" = y1, x1, y2, x2)。
+#
+# テンソルは numpy の view として読み (float32 のバッファならコピー無し)、
+# 全検出をまとめてベクトル演算で閾値・NMS にかけ、構造化配列で返す。
+# 返す配列は DetectionDecoder が確保済みのバッファの一部なので、
+# 次の decode() で上書きされる (残したい値は float() などで取り出すこと)。
+
+MAX_DETECTIONS = 300
+INPUT_SIZE = 320.0                  # モデル入力 [px] (正方形)
+TENSOR_LENGTH = MAX_DETECTIONS * 6 + 1
+BOX_ORDER = "xy"                    # ボックスの座標の順 (Ultralytics の IMX 書き出しは xyxy)
+
+_BOX = 0
+_SCORE = _BOX + MAX_DETECTIONS * 4
+_CLASS = _SCORE + MAX_DETECTIONS
+_COUNT = _CLASS + MAX_DETECTIONS
+_XY = [0, 1, 2, 3] if BOX_ORDER == "xy" else [1, 0, 3, 2]    # x1, y1, x2, y2 の位置
+
+SCORE_THRESHOLD = 0.25
+IOU_THRESHOLD = 0.5
+CONE_CLASS = 0                      # labels.txt: 0 = red cone
+
+# 座標は画像幅・高さで 0.0〜1.0 に正規化 (cx=0 が画像左端)
+DETECTION_DTYPE = np.dtype([("cx", "f4"), ("cy", "f4"), ("w", "f4"), ("h", "f4"),
+                            ("score", "f4"), ("cls", "i2")])
+
+
+def tensor_view(tensor):
+    """CnnOutputTensor を 1次元 float32 配列として見る (長さが違えば None)"""
+    if isinstance(tensor, np.ndarray):
+        t = tensor.reshape(-1)
+        if t.dtype != np.float32:
+            t = t.astype(np.float32)
+    else:
+        try:
+            t = np.frombuffer(tensor, dtype=np.float32)   # array('f') / memoryview はコピー無し
+        except TypeError:
+            t = np.asarray(tensor, dtype=np.float32)       # list の場合はコピーするしかない
+    if t.size != TENSOR_LENGTH:
+        return None
+    return t
+
+
+def outputs_to_tensor(outputs):
+    """IMX500.get_outputs() の出力 (ordinal 順の配列4本) を CnnOutputTensor の並びに詰める"""
+    if outputs is None or len(outputs) != 4:
+        return None
+    t = np.concatenate([np.asarray(o, dtype=np.float32).reshape(-1) for o in outputs])
+    return t if t.size == TENSOR_LENGTH else None
+
+
+def normalize_metadata(metadata, imx500):
+    """picamera2 のメタデータの CnnOutputTensor を、出力ごとの形で分け直した並びに置き換える"""
+    if imx500 is None or not metadata or 'CnnOutputTensor' not in metadata:
+        return metadata
+    t = outputs_to_tensor(imx500.get_outputs(metadata, add_batch=False))
+    if t is not None:
+        metadata['CnnOutputTensor'] = t
+    return metadata
+
+
+def nms(boxes, scores, iou_threshold=IOU_THRESHOLD):
+    """x1y1x2y2 のボックスに貪欲 NMS をかけ、残す添字をスコアの高い順に返す"""
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    area = (x2 - x1).clip(0) * (y2 - y1).clip(0)
+    order = np.argsort(-scores, kind="stable")
+    keep = np.empty(order.size, dtype=np.intp)
+    n = 0
+    while order.size:
+        i = order[0]
+        keep[n] = i
+        n += 1
+        rest = order[1:]
+        iw = (np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest])).clip(0)
+        ih = (np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest])).clip(0)
+        inter = iw * ih
+        iou = inter / (area[i] + area[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return keep[:n]
+
+
+class DetectionDecoder:
+    def __init__(self, score_threshold=SCORE_THRESHOLD, iou_threshold=IOU_THRESHOLD):
+        self.score_threshold = score_threshold
+        self.iou_threshold = iou_threshold
+        self._out = np.zeros(MAX_DETECTIONS, dtype=DETECTION_DTYPE)
+
+    def decode(self, tensor):
+        """全検出を復号し、スコアの高い順の構造化配列 (DETECTION_DTYPE) を返す"""
+        t = tensor_view(tensor) if tensor is not None else None
+        if t is None:
+            return self._out[:0]
+        n = min(max(int(t[_COUNT]), 0), MAX_DETECTIONS)
+        if n == 0:
+            return self._out[:0]
+
+        boxes = t[_BOX:_SCORE].reshape(MAX_DETECTIONS, 4)[:n][:, _XY]
+        scores = t[_SCORE:_CLASS][:n]
+        classes = t[_CLASS:][:n]
+
+        idx = np.flatnonzero(scores >= self.score_threshold)
+        if idx.size > 1:
+            idx = idx[nms(boxes[idx], scores[idx], self.iou_threshold)]
+
+        out = self._out[:idx.size]
+        b = boxes[idx]
+        scale = 1.0 / INPUT_SIZE
+        out["cx"] = (b[:, 0] + b[:, 2]) * (0.5 * scale)
+        out["cy"] = (b[:, 1] + b[:, 3]) * (0.5 * scale)
+        out["w"] = (b[:, 2] - b[:, 0]) * scale
+        out["h"] = (b[:, 3] - b[:, 1]) * scale
+        out["score"] = scores[idx]
+        out["cls"] = classes[idx]
+        return out
+
+
+def best_detection(dets, cls=CONE_CLASS):
+    """スコア×大きさ (√面積) が最大の検出を返す (無ければ None)
+
+    遠くの誤検出より、近くてはっきり写っているコーンを優先する。
+    """
+    if dets.size == 0:
+        return None
+    rank = dets["score"] * np.sqrt(dets["w"].clip(0) * dets["h"].clip(0))
+    rank[dets["cls"] != cls] = -1.0
+    i = int(np.argmax(rank))
+    if rank[i] < 0:
+        return None
+    return dets[i]
+
+
+def encode_detections(detections):
+    """(cx, cy, w, h, score, cls) の並びから CnnOutputTensor を作る (シミュレーション・再生用)"""
+    tensor = np.zeros(TENSOR_LENGTH, dtype=np.float32)
+    detections = detections[:MAX_DETECTIONS]
+    tensor[_COUNT] = len(detections)
+    boxes = tensor[_BOX:_SCORE].reshape(MAX_DETECTIONS, 4)
+    for k, (cx, cy, w, h, score, cls) in enumerate(detections):
+        boxes[k, _XY] = ((cx - w / 2) * INPUT_SIZE, (cy - h / 2) * INPUT_SIZE,
+                         (cx + w / 2) * INPUT_SIZE, (cy + h / 2) * INPUT_SIZE)
+        tensor[_SCORE + k] = score
+        tensor[_CLASS + k] = cls
+    return tensor
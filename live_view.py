@@ -0,0 +1,282 @@
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from imx500_detect import DetectionDecoder, best_detection, normalize_metadata
+
+# ==========================================
+# ライブビュー配信 (MJPEG, multipart/x-mixed-replace)
+# ==========================================
+# カメラの lores ストリーム (YUV420) を、推論結果と同じリクエストから受け取り、
+# 専用スレッドで検出枠を描いて JPEG にし、1つのバッファを全クライアントで共有する。
+#   - 制御側の仕事は「見ている人がいて、次のフレームの番なら lores を1枚コピーする」だけ
+#   - 見ている人がいなければ何もしない (コピーも圧縮もしない)
+#   - フレームレートは圧縮にかかった時間から自動で決める (CPU_SHARE を超えない)
+#   - 遅いクライアントは途中のフレームを飛ばして常に最新を受け取る
+#
+# ブラウザで http://<ラズパイのIP>:<port>/ を開くと見られる。
+
+MAX_FPS = 10.0
+MIN_FPS = 1.0
+CPU_SHARE = 0.25         # 圧縮に使ってよい CPU 1コアあたりの割合
+JPEG_QUALITY = 70
+CLIENT_TIMEOUT = 2.0     # 新しいフレームが来なくても接続を確かめる間隔 [s]
+
+# YUV (BT.601) の枠の色
+COLOR_CONE = (145, 54, 34)      # 緑: 追いかけているコーン
+COLOR_OTHER = (81, 90, 240)     # 赤: それ以外の検出
+
+PAGE = """<!doctype html>
+<html lang="ja">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>CanSat Live View</title>
+<style>
+body { margin: 0; background: #111; color: #bbb; font-family: sans-serif;
+       display: grid; place-items: center; min-height: 100vh; }
+img { width: min(96vw, 960px); border: 1px solid #444; border-radius: 8px; background: #222; }
+</style>
+</head>
+<body><div><img src="stream.mjpg" alt="live"><p>緑: 追跡中のコーン / 赤: その他の検出</p></div></body>
+</html>
+""".encode("utf-8")
+
+
+def yuv420_planes(image):
+    """picamera2 の YUV420 配列 (高さ*3/2, 幅) を Y, U, V の view に分ける"""
+    h = image.shape[0] * 2 // 3
+    w = image.shape[1]
+    y = image[:h]
+    u = image[h:h + h // 4].reshape(h // 2, w // 2)
+    v = image[h + h // 4:h + h // 2].reshape(h // 2, w // 2)
+    return y, u, v
+
+
+def draw_box(planes, x1, y1, x2, y2, color, thickness=2):
+    """YUV420 の各プレーンに直接枠を描く (座標は Y プレーンの画素)"""
+    for plane, value, scale in zip(planes, color, (1, 2, 2)):
+        ph, pw = plane.shape
+        t = max(1, thickness // scale)
+        a = min(max(x1 // scale, 0), pw - 1)
+        b = min(max(x2 // scale, 0), pw - 1)
+        c = min(max(y1 // scale, 0), ph - 1)
+        d = min(max(y2 // scale, 0), ph - 1)
+        plane[c:c + t, a:b + 1] = value
+        plane[max(d - t + 1, 0):d + 1, a:b + 1] = value
+        plane[c:d + 1, a:a + t] = value
+        plane[c:d + 1, max(b - t + 1, 0):b + 1] = value
+
+
+def _simplejpeg_encoder(quality):
+    import simplejpeg   # picamera2 が依存しているので実機には入っている
+
+    def encode(planes):
+        y, u, v = planes
+        return simplejpeg.encode_jpeg_yuv_planes(y, u, v, quality=quality)
+    return encode
+
+
+class StreamBuffer:
+    """最新の JPEG 1枚を全クライアントで共有する"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.jpeg = None
+        self.seq = 0
+        self.closed = False
+
+    def publish(self, jpeg):
+        with self._cond:
+            self.jpeg = jpeg
+            self.seq += 1
+            self._cond.notify_all()
+
+    def wait(self, after_seq, timeout=CLIENT_TIMEOUT):
+        """after_seq より新しいフレームを待って (seq, jpeg) を返す"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.seq != after_seq or self.closed, timeout)
+            return self.seq, self.jpeg
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class LiveView:
+    def __init__(self, port=8080, max_fps=MAX_FPS, quality=JPEG_QUALITY, encode=None):
+        self.port = port
+        self.max_fps = max_fps
+        self.quality = quality
+        self._encode = encode
+        self.buffer = StreamBuffer()
+        self.decoder = DetectionDecoder()
+        self.interval = 1.0 / max_fps
+        self.clients = 0
+        self._lock = threading.Lock()
+        self._pending = None
+        self._next_due = 0.0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._server = None
+        # 統計
+        self.encoded = 0
+        self.skipped = 0         # 圧縮が追いつかず上書きされたフレーム
+        self.encode_total = 0.0
+
+    # --- 制御側 (カメラのスレッド) から呼ぶ ---
+    @property
+    def wants_frame(self):
+        """見ている人がいて、次のフレームを送る時刻になっていれば True"""
+        return self.clients > 0 and time.monotonic() >= self._next_due
+
+    def submit(self, image, metadata):
+        """lores の YUV420 配列 (コピー済み) と推論結果を渡す。すぐ戻る"""
+        with self._lock:
+            if self._pending is not None:
+                self.skipped += 1
+            self._pending = (image, metadata)
+            self._next_due = time.monotonic() + self.interval
+        self._wake.set()
+
+    # --- 配信側 ---
+    def start(self):
+        if self._encode is None:
+            self._encode = _simplejpeg_encoder(self.quality)
+        live = self
+
+        class Handler(_StreamHandler):
+            pass
+        Handler.live = live
+        self._server = ThreadingHTTPServer(("0.0.0.0", self.port), Handler)
+        self._server.daemon_threads = True
+        for target, name in ((self._encode_loop, "live-encode"), (self._server.serve_forever, "live-http")):
+            th = threading.Thread(target=target, name=name, daemon=True)
+            th.start()
+            self._threads.append(th)
+
+    def stop(self, timeout=1.0):
+        self._stop.set()
+        self._wake.set()
+        self.buffer.close()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for th in self._threads:
+            th.join(timeout)
+        self._threads = []
+
+    def _encode_loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(CLIENT_TIMEOUT)
+            self._wake.clear()
+            with self._lock:
+                pending, self._pending = self._pending, None
+            if pending is None:
+                continue
+            t0 = time.perf_counter()
+            try:
+                jpeg = self._encode(self.overlay(*pending))
+            except Exception as e:
+                print(f"⚠️ ライブビューの圧縮に失敗: {e}")
+                continue
+            spent = time.perf_counter() - t0
+            self.encoded += 1
+            self.encode_total += spent
+            # 圧縮が重ければ間隔を空ける (MAX_FPS〜MIN_FPS の範囲)
+            self.interval = min(max(spent / CPU_SHARE, 1.0 / self.max_fps), 1.0 / MIN_FPS)
+            self.buffer.publish(jpeg)
+
+    def overlay(self, image, metadata):
+        """推論結果の検出枠を画像に描き、(Y, U, V) を返す"""
+        planes = yuv420_planes(image)
+        tensor = metadata.get('CnnOutputTensor') if metadata else None
+        if tensor is not None:
+            dets = self.decoder.decode(tensor)
+            best = best_detection(dets)
+            h, w = planes[0].shape
+            for d in dets:
+                x1 = int((d["cx"] - d["w"] / 2) * w)
+                x2 = int((d["cx"] + d["w"] / 2) * w)
+                y1 = int((d["cy"] - d["h"] / 2) * h)
+                y2 = int((d["cy"] + d["h"] / 2) * h)
+                is_best = best is not None and d["cx"] == best["cx"] and d["cy"] == best["cy"]
+                draw_box(planes, x1, y1, x2, y2, COLOR_CONE if is_best else COLOR_OTHER)
+        return planes
+
+    def report(self):
+        n = self.encoded or 1
+        return (f"🌐 ライブビュー {self.encoded}フレーム | 飛ばし {self.skipped} | "
+                f"圧縮 平均 {self.encode_total / n * 1000:.1f}ms | 現在 {1.0 / self.interval:.1f}fps | "
+                f"視聴 {self.clients}")
+
+
+class _StreamHandler(BaseHTTPRequestHandler):
+    live = None
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path in ("/", "/index.html"):
+            self._send(200, "text/html; charset=utf-8", PAGE)
+        elif path == "/stream.mjpg":
+            self._stream()
+        elif path == "/snapshot.jpg" and self.live.buffer.jpeg is not None:
+            self._send(200, "image/jpeg", self.live.buffer.jpeg)
+        else:
+            self.send_error(404)
+
+    def _send(self, code, content_type, body):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache, private")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self):
+        live = self.live
+        self.send_response(200)
+        self.send_header("Age", "0")
+        self.send_header("Cache-Control", "no-cache, private")
+        self.send_header("Pragma", "no-cache")
+        self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=FRAME")
+        self.end_headers()
+        with live._lock:
+            live.clients += 1
+        try:
+            seq = 0
+            while not live.buffer.closed:
+                seq, jpeg = live.buffer.wait(seq)
+                if jpeg is None:
+                    continue
+                self.wfile.write(b"--FRAME\r\nContent-Type: image/jpeg\r\n")
+                self.wfile.write(b"Content-Length: %d\r\n\r\n" % len(jpeg))
+                self.wfile.write(jpeg)
+                self.wfile.write(b"\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with live._lock:
+                live.clients -= 1
+
+    def log_message(self, format, *args):
+        pass  # アクセスごとの表示はしない
+
+
+def capture_with_preview(picam2, live, imx500=None):
+    """推論結果を取得し、配信中なら同じフレームの lores 画像を LiveView に渡す
+
+    lores ストリームを設定した Picamera2 で使う。配信していない時は capture_metadata() と同じ。
+    imx500 を渡すと CnnOutputTensor を出力ごとの形で分け直した並びにする (normalize_metadata)。
+    """
+    if live is None or not live.wants_frame:
+        return normalize_metadata(picam2.capture_metadata(), imx500)
+    request = picam2.capture_request()
+    try:
+        metadata = normalize_metadata(request.get_metadata(), imx500)
+        live.submit(request.make_array("lores"), metadata)
+    finally:
+        request.release()
+    return metadata
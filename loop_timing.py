@@ -0,0 +1,171 @@
+import signal
+import time
+from array import array
+
+# ==========================================
+# 制御ループの周期・処理時間の計測 (HDR 風ヒストグラム)
+# ==========================================
+# 各ループは1周の始めに tick()、区切りごとに lap("read") のように呼ぶ。
+#   周期 … 前回の tick() からの間隔 (遅れ = 予定周期の LATE_RATIO 倍を超えた回数)
+#   区間 … 直前の tick()/lap() からの経過 (センサー読み出し・計算・出力・ログなど)
+#   busy … tick() から最後の lap() まで (1周の処理にかかった時間)
+# 値はマイクロ秒の整数にして、固定長の配列に数えるだけ (ループ中にメモリを確保しない)。
+#   - 0〜2^(SUB_BITS+1) µs は 1µs 刻み
+#   - それより上は 2 倍ごとの区間を 2^SUB_BITS 等分 (相対誤差 1/2^SUB_BITS 以下)
+#   - MAX_US を超えた値は最上段に数える (最大値だけは正確に残す)
+# p50/p99/max は report() でいつでも取れる。SIGUSR1 で途中経過を表示することもできる。
+
+SUB_BITS = 5                      # 2倍ごとの区間の分割数 = 32 (誤差 約3%)
+MAX_US = 1 << 27                  # 記録できる上限 約134秒
+LATE_RATIO = 1.5                  # 予定周期のこの倍を超えた周を「遅れ」に数える
+
+_SUB = 1 << SUB_BITS
+_LINEAR = _SUB << 1               # ここまでは 1µs 刻み
+_BUCKETS = (MAX_US.bit_length() - SUB_BITS - 1) * _SUB + _SUB
+
+
+def _bucket(us):
+    if us < _LINEAR:
+        return us
+    shift = us.bit_length() - SUB_BITS - 1
+    return shift * _SUB + (us >> shift)
+
+
+def _bucket_high(index):
+    """区間に入る最大値 [µs]"""
+    if index < _LINEAR:
+        return index
+    shift = index // _SUB - 1
+    return ((index % _SUB + _SUB) << shift) + (1 << shift) - 1
+
+
+class LatencyHistogram:
+    """秒で渡した値を固定長の配列に数える。percentile() は区間の上端を返す"""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = array("L", bytes(array("L").itemsize * _BUCKETS))
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        if seconds < 0.0:
+            seconds = 0.0
+        us = int(seconds * 1e6)
+        self.counts[_bucket(us if us < MAX_US else MAX_US - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """q [%] 点の値 [s] (記録なしは 0)"""
+        if not self.count:
+            return 0.0
+        rank = max(1, int(self.count * q / 100.0 + 0.5))
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n:
+                seen += n
+                if seen >= rank:
+                    return min(_bucket_high(i) / 1e6, self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def reset(self):
+        for i in range(_BUCKETS):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+class LoopTimer:
+    """1本のループの周期と区間ごとの処理時間"""
+
+    def __init__(self, name, period=None, clock=time.monotonic):
+        self.name = name
+        self.period = period          # 予定周期 [s] (None なら遅れを数えない)
+        self.clock = clock
+        self.interval = LatencyHistogram()
+        self.busy = LatencyHistogram()
+        self.spans = {}               # 区間名 -> LatencyHistogram (最初に lap() した順)
+        self.ticks = 0
+        self.late = 0
+        self._start = None
+        self._mark = None
+
+    def tick(self):
+        """1周の始め"""
+        now = self.clock()
+        self.ticks += 1
+        if self._start is not None:
+            dt = now - self._start
+            self.interval.record(dt)
+            if self.period and dt > self.period * LATE_RATIO:
+                self.late += 1
+            self.busy.record(self._mark - self._start)
+        self._start = self._mark = now
+
+    def lap(self, span):
+        """直前の tick()/lap() から今までを span に数える"""
+        if self._mark is None:
+            return
+        now = self.clock()
+        hist = self.spans.get(span)
+        if hist is None:
+            hist = self.spans[span] = LatencyHistogram()
+        hist.record(now - self._mark)
+        self._mark = now
+
+    def pause(self):
+        """ループを抜ける時に呼ぶ (次に入った時の最初の間隔を周期に数えない)"""
+        if self._start is not None:
+            self.busy.record(self._mark - self._start)
+        self._start = self._mark = None
+
+    def report(self):
+        def ms(hist):
+            return (f"p50 {hist.percentile(50) * 1e3:7.2f} p99 {hist.percentile(99) * 1e3:7.2f} "
+                    f"max {hist.max * 1e3:7.2f}ms")
+        period = f"{self.period * 1e3:.0f}ms" if self.period else "-"
+        lines = [f"  {self.name:<10} {self.ticks:>6}周 "
+                 f"予定 {period:>6} | 遅れ {self.late}"]
+        if self.interval.count:
+            lines.append(f"    {'周期':<8} {ms(self.interval)}")
+        if self.busy.count:
+            lines.append(f"    {'busy':<8} {ms(self.busy)}")
+        for span, hist in self.spans.items():
+            lines.append(f"    {span:<8} {ms(hist)}")
+        return "\n".join(lines)
+
+
+class LoopTimings:
+    """ループ名ごとの LoopTimer を持つ (hw.timing)"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.loops = {}
+
+    def loop(self, name, period=None):
+        timer = self.loops.get(name)
+        if timer is None:
+            timer = self.loops[name] = LoopTimer(name, period, self.clock)
+        return timer
+
+    def report(self):
+        lines = ["⏲️ ループ周期・処理時間"]
+        for timer in self.loops.values():
+            lines.append(timer.report())
+        return "\n".join(lines)
+
+    def install_signal_handler(self, signum=signal.SIGUSR1):
+        """kill -USR1 <pid> で途中経過を表示する (メインスレッドから呼ぶこと)"""
+        def handler(num, frame):
+            print("\n" + self.report())
+        signal.signal(signum, handler)
@@ -1,20 +1,20 @@
-import time
-from datetime import datetime
-import board
-import digitalio
-import pwmio
-import adafruit_bno055
-import adafruit_gps
-import serial
 import math
 import os
-import adafruit_dps310
-import adafruit_vl53l1x
-import struct
-from picamera2 import Picamera2
-from picamera2.devices import IMX500
+import time
 from collections import deque
-from digitalio import DigitalInOut, Direction
+from flight_logger import FlightLogger
+from telemetry_bin import NAVI_SCHEMA
+from hal import pressure_to_altitude
+from mission_engine import Engine, State
+from imx500_detect import DetectionDecoder, best_detection
+from cone_tracker import ConeTracker
+from pose_filter import PoseFilter
+from route import Route, Waypoint, load_route
+from steering import make_controller
+from loop_timing import LoopTimings
+from maneuvers import load_maneuvers, play
+from flight_events import FlightEventDetector
+import startup_profile
 
 
 # ==========================================
@@ -24,210 +24,113 @@ from digitalio import DigitalInOut, Direction
 # 目標地点 
 TARGET_LATITUDE = 30.374321
 TARGET_LONGITUDE = 130.960611
+# 経由点を通ってゴールへ向かう場合はミッションファイルを指定する (書式は route.py)。
+# None なら TARGET_LATITUDE/TARGET_LONGITUDE へ直接向かう
+MISSION_FILE = None
 # 制御パラメータ
-KP_GAIN = 0.004        # 旋回ゲイン (調整ポイント)
-MAX_TURN = 0.35        # 旋回スピードの上限 (行き過ぎ防止)
-BASE_SPEED = 0.8       # 基本の前進速度
-APPROACH_ANGLE = 10    # この角度以内なら前進許可
+CONTROLLER = "bangbang" # Phase 2 の操舵: bangbang / p / pid / pursuit (ゲインは steering.py)
+APPROACH_ANGLE = 10    # この角度以内なら前進許可 (bangbang)
 MOUNTING_OFFSET = 180 # センサー取り付けズレ補正 (屋外用)
 GOAL_DISTANCE_METERS = 5.0 # ゴール判定距離
 ACTION_INTERVAL = 0.2      # 制御間隔 (1秒に5回更新)
 RECALIB_DISTANCE_THRESHOLD = 7.0
-next_cam_dist = 20.0
+FIRST_CAM_DIST = 20.0      # 最初にカメラフェーズへ移る距離
+next_cam_dist = FIRST_CAM_DIST
 
 # --- 以下追加: 空中分離・着地判定設定 ---
 ARM_ALTITUDE = 20.0         # ロック解除高度
 TARGET_ALTITUDE = 10.0      # 作動(分離)高度
-NICROME_PIN = board.D4
-LED_PIN = board.D21
 DUTY_CYCLE_PERCENT = 0.2    # ニクロム線出力 (20%)
 BURN_TIME = 3.0             # 加熱時間
 DROP_THRESHOLD = 10.0       # 最高到達点からの降下検知 (要件に合わせ15.0に変更)
 RUN_DURATION = 5.0          # スタック回避走行時間
-MOTOR_POWER = 1.0           # 回避走行時のモーター出力
+MANEUVER_FILE = None        # 復帰・校正の動作スクリプト (書式は maneuvers.py / None なら maneuvers.txt)
+PHASE1_INTERVAL = 0.1       # Phase 1 の判定周期 [s] (着地判定の 50 サンプル = 5秒)
+
+# --- Phase 3 (照準) ---
+ALIGN_STEP = 0.05           # 旋回中に推定方位を見直す間隔 [s]
+ALIGN_MAX_TURN = 0.5        # 1回の照準旋回の最大時間 [s] (IMUが無いときはこの時間だけ回る)
+ALIGN_STOP_LEAD = 0.25      # 減速停止中にも回る分を見越して早めに止める [s]
+
+# --- Phase 3 (連続操舵) ---
+PHASE3_MODE = "servo"       # "servo": 毎フレーム操舵 / "stopgo": 従来の Stop & Go
+SERVO_GAIN = 0.03           # 方位ズレ1度あたりの左右差
+SERVO_MAX_TURN = 0.6        # 左右差の上限
+SERVO_SPEED = 1.0           # 前進の基本出力
+SERVO_MIN_SPEED = 0.4       # ゴール直前の前進出力
+SERVO_SLOW_DIST = 200       # 前方ToFがこれ以下なら減速を始める (TOF_GOAL_* と同じ単位)
+SERVO_PIVOT_ERR = 25.0      # 方位ズレがこれ以上ならその場旋回 [deg]
+SERVO_SLEW = 2.0            # 出力の変化率の上限 [1/s]
+SERVO_SEARCH_PWR = 1.0      # スキャン旋回の出力
+TOF_GOAL_LONG = 100         # 前方ToF: 減速しきる距離
+TOF_GOAL_SHORT = 40         # 前方ToF: ゴール判定距離
+
+# --- Phase 3 (カメラ) ---
+FRAME_TIMEOUT = 1.0         # これだけ待ってもフレームが来なければ未検出として進める [s]
+SETTLE_TIME = 0.2           # 停止後これ以降に露光したフレームだけ使う (車体の揺れ待ち) [s]
+SCAN_TIMEOUT = 3.0          # 一度も見つけずにこれだけ探したら Phase 2 へ戻る [s]
+CAMERA_WARMUP_DIST = 10.0   # カメラフェーズに入る距離のこれだけ手前でカメラを起動しておく [m]
+CAMERA_READY_TIMEOUT = 5.0  # Phase 3 の開始時に最初のフレームを待つ上限 [s]
+
+# --- 監視タスク ---
+FALL_CHECK_INTERVAL = 0.2   # 転倒検知の周期 (走行中の動作とは独立に回る)
+HEARTBEAT_INTERVAL = 0.3    # これ以上ログが途切れたら監視タスクが姿勢・出力を記録する
+POSE_INTERVAL = 0.05        # 位置推定を進める周期 (GPS の測位の間を IMU とモーター指令で埋める)
+
+# --- ライブビュー (地上試験用) ---
+LIVE_VIEW_PORT = None       # 8080 などにすると http://<IP>:8080/ で映像と検出枠を見られる (本番は None)
 
 
 # ログ保存先
 LOG_DIR = "/home/yuki/cansat_raspi/logs"
-os.makedirs(LOG_DIR, exist_ok=True)
-filename = f"{LOG_DIR}/navi_{int(time.time())}.csv"
-
-
-# ==========================================
-# 2. モーター設定 
-# ==========================================
-print("モーター初期化中...")
-ain1 = digitalio.DigitalInOut(board.D6)
-ain2 = digitalio.DigitalInOut(board.D5)
-ain1.direction = digitalio.Direction.OUTPUT
-ain2.direction = digitalio.Direction.OUTPUT
-pwma = pwmio.PWMOut(board.D12, frequency=20000)
-
-bin1 = digitalio.DigitalInOut(board.D22)
-bin2 = digitalio.DigitalInOut(board.D23)
-bin1.direction = digitalio.Direction.OUTPUT
-bin2.direction = digitalio.Direction.OUTPUT
-pwmb = pwmio.PWMOut(board.D13, frequency=20000)
-
-current_speed_A = 0.0
-current_speed_B = 0.0
-
-def set_motor_speed(motor, throttle):
-    global current_speed_A, current_speed_B
-    throttle = max(-1.0, min(1.0, throttle))
-    duty = int(abs(throttle) * 65535)
-    if motor == 'A':
-        current_speed_A = throttle
-        ain1.value = (throttle > 0)
-        ain2.value = (throttle < 0)
-        pwma.duty_cycle = duty
-    elif motor == 'B':
-        current_speed_B = throttle
-        bin1.value = (throttle > 0)
-        bin2.value = (throttle < 0)
-        pwmb.duty_cycle = duty
-
-def stop_motors(duration=0.5, steps=10):
-    global current_speed_A, current_speed_B
-    start_A = current_speed_A
-    start_B = current_speed_B
-    if start_A == 0.0 and start_B == 0.0:
+NAN = float("nan")
+
+def open_flight_log(log_dir=LOG_DIR, stamp=None):
+    """航法ログをバイナリ形式で開く (CSVへは python3 telemetry_bin.py logs/navi_*.bin で変換)"""
+    os.makedirs(log_dir, exist_ok=True)
+    if stamp is None:
+        stamp = int(time.time())
+    filename = f"{log_dir}/navi_{stamp}.bin"
+    # 書き込み・fsync はロガーのスレッドがまとめて行う (制御ループはバッファに積むだけ)
+    return FlightLogger(filename, header=NAVI_SCHEMA.header_bytes(), encoder=NAVI_SCHEMA.encode)
+
+last_log_time = 0.0
+last_log_state = ""
+
+def log_tick(hw, phase, state, lat=0.0, lon=0.0, heading=0.0, target_ang=0.0, dist=0.0,
+             roll=0.0, pitch=0.0, l_val=0.0, r_val=0.0, fix=0,
+             rel_alt=0.0, accel_norm=0.0, ai_cx=NAN, tof=NAN, frame=None):
+    """1制御周期ぶんの航法ログを積む (列は NAVI_SCHEMA と同じ順)
+
+    frame にはその判断の元にしたカメラの Frame を渡す (番号と経過時間を残す)。
+    位置推定 (hw.pose) の位置・速度・不確かさは毎回自動で残す。
+    """
+    global last_log_time, last_log_state
+    if hw.log is None:
         return
-    for i in range(1, steps + 1):
-        ratio = 1.0 - (i / steps)
-        set_motor_speed('A', start_A * ratio)
-        set_motor_speed('B', start_B * ratio)
-        time.sleep(duration / steps)
-    set_motor_speed('A', 0.0)
-    set_motor_speed('B', 0.0)
-
-
+    now = hw.clock.time()
+    last_log_time, last_log_state = now, state
+    if frame is not None:
+        frame_seq, frame_age = frame.seq, frame.age(hw.clock.monotonic())
+    else:
+        frame_seq, frame_age = 0, NAN
+    pose = hw.pose
+    if pose is not None and pose.initialized:
+        pose_x, pose_y, pose_v, pose_sigma = pose.x, pose.y, pose.v, pose.sigma
+    else:
+        pose_x = pose_y = pose_v = pose_sigma = NAN
+    hw.log.log(phase, now, state, lat, lon, heading, target_ang, dist,
+               roll, pitch, l_val, r_val, fix, rel_alt, accel_norm, ai_cx, tof,
+               frame_seq, frame_age, pose_x, pose_y, pose_v, pose_sigma)
 
-# ==========================================
-# 3. センサー設定
-# ==========================================
-i2c = board.I2C()
-nicrome = pwmio.PWMOut(NICROME_PIN, frequency=100, duty_cycle=0)
-
-# 1. 片方ずつアドレスを変えるためにXSHUTを制御
-xshut_front = digitalio.DigitalInOut(board.D27)
-xshut_front.direction = digitalio.Direction.OUTPUT
-xshut_bottom = digitalio.DigitalInOut(board.D17)
-xshut_bottom.direction = digitalio.Direction.OUTPUT
-# 両方一度眠らせる（リセット）
-xshut_front.value = False
-xshut_bottom.value = False
-time.sleep(0.1)
-# 2. Frontだけ起こしてアドレス変更
-xshut_front.value = True
-time.sleep(0.1)
-# 既存のi2cインスタンスを使用
-tof_front = adafruit_vl53l1x.VL53L1X(i2c) 
-with tof_front.i2c_device as i2c_dev:
-    i2c_dev.write(bytes([0x00, 0x01, 0x30])) # 0x30へ書き換え
-tof_front.i2c_device.device_address = 0x30
-# 3. Bottomを起こす (デフォルト0x29で起動)
-xshut_bottom.value = True
-time.sleep(0.1)
-tof_bottom = adafruit_vl53l1x.VL53L1X(i2c)
-# 計測設定
-for t in [tof_front, tof_bottom]:
-    t.distance_mode = 2
-    t.timing_budget = 50
-    t.start_ranging()
-
-sensor = None
-try:
-    sensor = adafruit_bno055.BNO055_I2C(i2c, address=0x28)
-    print("✅ BNO055 接続成功 (0x28)")
-except Exception as e:
-    print(f"❌ BNO055が見つかりません: {e}")
-
-
-print("AIカメラ初期化中...")
-imx500 = IMX500("network.rpk")
-picam2 = Picamera2(imx500.camera_num)
-config = picam2.create_preview_configuration(main={"size": (320, 240)})
-picam2.configure(config)
-picam2.start()
-print("カメラ暖機運転中...")
-time.sleep(2.0) # ★追加: 電流スパイクを分散させ、カメラを安定させる
-
-# 既存のパス設定を維持
-CALIB_FILE = "/home/yuki/cansat_raspi/bno_offsets.bin"
-print("--- BNO055 手動キャリブレーション保存モード ---")
-print("機体をゆっくり8の字に回して、Mag: 3 を目指してください。")
-try:
-    while True:
-        sys, gyro, accel, mag = sensor.calibration_status
-        print(f"ステータス - Sys:{sys} Gyro:{gyro} Accel:{accel} Mag:{mag}", end="\r")
-
-        # Magが3になったら保存して終了
-        if mag == 3:
-            print("\n\n✅ Mag:3 到達！ データを保存します...")
-
-            # レジスタからオフセットを取得
-            offsets = sensor.offsets_accelerometer + \
-                      sensor.offsets_gyroscope + \
-                      sensor.offsets_magnetometer + \
-                      (sensor.radius_accelerometer, sensor.radius_magnetometer)
-            # バイナリ書き出し
-            with open(CALIB_FILE, "wb") as f:
-                f.write(struct.pack("<hhhhhhhhhHH", *offsets))
-
-            print(f"保存完了: {CALIB_FILE}")
-            break
-        time.sleep(0.2)
-except KeyboardInterrupt:
-    print("\n中断されました。")
-
-dps = None
-base_altitude = 0.0
-try:
-    dps = adafruit_dps310.DPS310(i2c, address=0x77)
-    print("✅ 気圧センサ接続成功 (Address: 0x77)")
-except Exception as e:
-    print(f"❌ 気圧センサが見つかりません: {e}")
-
-if dps:
-    print("--- 初期高度(オフセット)のキャリブレーション ---")
-    calib_samples = 10
-    calib_alts = []
-    try:
-        for _ in range(calib_samples):
-            press = dps.pressure
-            alt = 44330 * (1.0 - (press / 1013.25) ** 0.1903)
-            calib_alts.append(alt)
-            time.sleep(0.1)
-        base_altitude = sum(calib_alts) / calib_samples
-        print(f"✅ 基準高度設定完了: {base_altitude:.2f} m")
-    except Exception as e:
-        print(f"⚠️ オフセット設定失敗。基準=0.0mで開始: {e}")
+def flush_log(hw):
+    if hw.log is not None:
+        hw.log.flush()
 
-# GPS (UART)
-uart = serial.Serial("/dev/serial0", baudrate=9600, timeout=10)
-gps = adafruit_gps.GPS(uart, debug=False)
-gps.send_command(b"PMTK314,0,1,0,1,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0")
-gps.send_command(b"PMTK220,500") # 2Hz更新 (GPSの取得頻度を上げる)
 
 # ==========================================
 # 4. 計算関数
 # ==========================================
-def calculate_distance_meters(lat1, lon1, lat2, lon2):
-    R = 6371000
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    delta_lambda = math.radians(lon2 - lon1)
-    a = math.sin((phi2 - phi1)/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(delta_lambda/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
-
-def calculate_bearing(lat1, lon1, lat2, lon2):
-    lon1, lat1, lon2, lat2 = map(math.radians, [lon1, lat1, lon2, lat2])
-    dLon = lon2 - lon1
-    y = math.sin(dLon) * math.cos(lat2)
-    x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(dLon)
-    return (math.degrees(math.atan2(y, x)) + 360) % 360
-
 def normalize_angle_error(error):
     while error > 180: error -= 360
     while error < -180: error += 360
@@ -237,12 +140,12 @@ heading = 0.0
 roll = 0.0
 pitch = 0.0
 
-def update_sensor_data():
+def update_sensor_data(hw):
     """センサーから最新の姿勢情報を取得し、グローバル変数を更新する"""
     global heading, roll, pitch
-    if not sensor: return
+    if not hw.imu: return
     try:
-        raw_h, r, p = sensor.euler
+        raw_h, r, p = hw.imu.euler
         if raw_h is not None:
             heading = (raw_h + MOUNTING_OFFSET) % 360
         if r is not None and p is not None:
@@ -252,281 +155,272 @@ def update_sensor_data():
 # ==========================================
 # 独立関数群 
 # ==========================================
-def execute_recovery_routine():
+# 動作 (復帰・校正・加熱) はコルーチンで書く。待ちは yield 秒数 で行い、
+# その間も mission_engine の監視タスク (転倒検知・ログ) が回る。
+# 復帰・校正のモーターの動きは動作スクリプト (maneuvers.txt) に書き、ここでは
+# 打ち切り条件 (起き上がった・校正が済んだ) だけを渡す。
+_maneuvers = None
+
+def run_maneuver(hw, name):
+    """動作スクリプト name を実行する (打ち切った条件名か None が返る)"""
+    global _maneuvers
+    if _maneuvers is None:
+        _maneuvers = load_maneuvers(MANEUVER_FILE)
+    return (yield from play(_maneuvers[name], hw.motors, hw.clock, maneuver_conditions(hw)))
+
+def maneuver_conditions(hw):
+    """動作スクリプトの abort に書ける条件"""
+    last_status = [None]
+
+    def upright():
+        update_sensor_data(hw)
+        return abs(roll) < 100 and abs(pitch) < 100
+
+    def calibrated():
+        if not hw.imu:
+            return False
+        status = hw.imu.calibration_status
+        if status != last_status[0]:
+            last_status[0] = status
+            sys_cal, gyro, accel, mag = status
+            print(f"自動校正中... [Sys:{sys_cal}, Gyro:{gyro}, Accel:{accel}, Mag:{mag}]")
+        return status[3] == 3 and status[1] > 0
+
+    return {"upright": upright, "calibrated": calibrated}
+
+def execute_recovery_routine(hw, maneuver="recovery"):
+    """揺さぶりで起き上がる (recovery は起き上がった時点で打ち切る / escape は最初の揺さぶりを必ず行う)"""
     print(f"\n⚠️ 復帰シーケンス開始 (Roll:{roll:.0f} Pitch:{pitch:.0f})")
+    reason = yield from run_maneuver(hw, maneuver)
+    if reason == "upright":
+        print(f"✅ 起き上がりました (Roll:{roll:.0f} Pitch:{pitch:.0f})")
+    yield from hw.motors.stop_steps(duration=0.3)
 
-    # Step 1 & 2: 前進揺さぶり動作
-    # (パワー, 前進時間, 後退パワー, 後退時間) の順で定義
-    steps = [
-        (MOTOR_POWER, 2.0, -0.5, 1.0, "🚀 Step 1: 前方全力"),
-        (0.8,         2.0, -0.5, 1.0, "🔄 Step 2: 80%出力")
-    ]
-
-    for p_fwd, t_fwd, p_rev, t_rev, msg in steps:
-        print(msg)
-        # 前進
-        set_motor_speed('A', p_fwd); time.sleep(0.05)
-        set_motor_speed('B', p_fwd); time.sleep(t_fwd)
-        # 切り替えの衝撃緩和（一瞬止める）
-        set_motor_speed('A', 0); set_motor_speed('B', 0); time.sleep(0.1)
-        # 揺さぶり（少し下がる）
-        set_motor_speed('A', p_rev); time.sleep(0.05)
-        set_motor_speed('B', p_rev); time.sleep(t_rev)
-        
-        stop_motors(duration=0.3) # 毎回スローダウン停止
-        update_sensor_data()
-        if abs(roll) < 100 and abs(pitch) < 100:
-            return
-
-    # Step 3: 最終手段 後退全振り
-    print("🔄 Step 3: 後退全振り (Reverse 100%)")
-    set_motor_speed('A', -MOTOR_POWER); time.sleep(0.05)
-    set_motor_speed('B', -MOTOR_POWER); time.sleep(2.0)
-    # 前に少し戻して体制を整える
-    set_motor_speed('A', 0.5); time.sleep(0.05)
-    set_motor_speed('B', 0.5); time.sleep(1.0)
-    stop_motors()
-
-def execute_calibration(sensor_obj):
+def execute_calibration(hw):
     """フェーズ3: 角丸ポリゴン軌道による地磁気キャリブレーション"""
-    execute_recovery_routine()
-    if not sensor_obj:
+    yield from execute_recovery_routine(hw, "escape")
+    if not hw.imu:
         print("⚠️ センサーがないためキャリブレーションをスキップします。")
         return
     print("\n🤖 BNO055 キャリブレーション (角丸ポリゴン軌道) を開始します...")
-    try:
-        sensor_obj.mode = adafruit_bno055.CONFIG_MODE
-        time.sleep(0.05)
-        sensor_obj.mode = adafruit_bno055.NDOF_MODE
-        time.sleep(0.05)
-    except Exception:
-        pass
-    stop_motors()
-    time.sleep(1.0)
-    timeout = time.time() + 40.0
-    start_time = time.time()
-    while time.time() < timeout:
-        sys_cal, gyro, accel, mag = sensor_obj.calibration_status
-        print(f"自動校正中... [Sys:{sys_cal}, Gyro:{gyro}, Accel:{accel}, Mag:{mag}]")
-
-        if mag == 3 and gyro > 0:
-            print("\n✅ 自動校正完了！本当の北を認識しました。")
-            break
-
-        # 角丸ポリゴン軌道のロジック
-        t = time.time() - start_time
-        cycle_time = 2.0
-        phase_t = t % cycle_time
-        l_val = 0.4
-
-        if phase_t < 0.8:
-            r_val = 0.4
-        elif phase_t < 1.2:
-            ratio = (phase_t - 0.8) / 0.4
-            r_val = 0.4 - (0.8 * ratio)
-        elif phase_t < 1.6:
-            r_val = -0.4
-        else:
-            ratio = (phase_t - 1.6) / 0.4
-            r_val = -0.4 + (0.8 * ratio)
-
-        set_motor_speed('A', l_val)
-        set_motor_speed('B', r_val)
-        time.sleep(0.05)
+    hw.imu.restart_fusion()
+    yield from hw.motors.stop_steps()
+    yield 1.0
+    if (yield from run_maneuver(hw, "calibration")) == "calibrated":
+        print("\n✅ 自動校正完了！本当の北を認識しました。")
     else:
         print("\n⚠️ キャリブレーションがタイムアウトしました。現在の状態で進行します。")
-    stop_motors(duration=1.0)
-    time.sleep(1.0)
-
-def load_calibration(sensor_obj):
-    """保存されたオフセットをセンサーに流し込む"""
-    if not os.path.exists(CALIB_FILE):
-        print("❌ 保存ファイルが見つかりません。")
-        execute_recovery_routine()
-    with open(CALIB_FILE, "rb") as f:
-        data = struct.unpack("<hhhhhhhhhHH", f.read())
-        # センサーの各プロパティに直接代入
-        sensor_obj.offsets_accelerometer = data[0:3]
-        sensor_obj.offsets_gyroscope = data[3:6]
-        sensor_obj.offsets_magnetometer = data[6:9]
-        sensor_obj.radius_accelerometer = data[9]
-        sensor_obj.radius_magnetometer = data[10]
-    return True
-
-def burn_nicrome():
+    yield from hw.motors.stop_steps(duration=1.0)
+    yield 1.0
+
+def burn_nicrome(hw):
     """ニクロム線を通電加熱し、分離を確認する"""
     global is_fired
     print(f"\n🔥 分離条件達成！ ニクロム線加熱開始")
     # ニクロム線 ON
-    nicrome.duty_cycle = int(65535 * DUTY_CYCLE_PERCENT)
-    burn_start = time.time()
+    hw.nicrome.duty_cycle = int(65535 * DUTY_CYCLE_PERCENT)
+    burn_start = hw.clock.time()
     # 加熱中のループ (3秒間)
-    while time.time() - burn_start < BURN_TIME:
+    while hw.clock.time() - burn_start < BURN_TIME:
         try:
-            if dps:
-                p = dps.pressure
-                a = 44330 * (1.0 - (p / 1013.25) ** 0.1903)
-                print(f"[BURNING] 高度: {a - base_altitude:.2f}m")
+            if hw.baro:
+                p = hw.baro.pressure
+                a = pressure_to_altitude(p)
+                print(f"[BURNING] 高度: {a - hw.base_altitude:.2f}m")
         except: pass
-        time.sleep(0.1)
+        yield 0.1
     # ニクロム線 OFF
-    nicrome.duty_cycle = 0
+    hw.nicrome.duty_cycle = 0
     is_fired = True
     print("✅ 加熱完了・分離成功")
 
-def parse_direct_tensor(tensor_list):
-    # データ数が1801個であることを確認
-    if not tensor_list or len(tensor_list) != 1801:
-        return None
-
-    # [0] は「AIが確信を持って検出した物体の数」
-    num_detections = int(tensor_list[0])
+detector = DetectionDecoder()
 
+def parse_direct_tensor(tensor_list):
+    """全検出を復号し、一番確かなコーン (スコア×大きさ) の中心X (0.0 ~ 1.0) を返す"""
+    dets = detector.decode(tensor_list)
+    best = best_detection(dets)
     # 1つも見つからなかったら None を返す
-    if num_detections == 0:
+    if best is None:
         return None
-
-    # 見つかった場合、最初の物体（一番信頼度が高いもの）のX座標は [1] にある
-    cx = tensor_list[1]
-
-    # 画像サイズ(320x320と想定)で 0.0 ~ 1.0 に正規化
-    center_x = cx / 320.0
+    center_x = float(best["cx"])
 
     # デバッグ用に検出数も出しておきます
-    print(f"🎯 ロックオン (検出数:{num_detections}個) 位置:{center_x:.2f}")
+    print(f"🎯 ロックオン (検出数:{dets.size}個) 位置:{center_x:.2f} スコア:{best['score']:.2f}")
 
     return center_x
 
-def flush_metadata(picam2, flush_count=3):
+def align_turn(hw, tracker, target_cx, max_time=ALIGN_MAX_TURN):
+    """旋回しながら IMU の方位でコーン位置を予測し、target_cx を越えそうになったら戻る
+
+    モーターの向きは呼び出し側で設定しておく。止めるのも呼び出し側。
     """
-    カメラのバッファに溜まった古い(ブレた)推論結果を捨てて、
-    機体が停止した後の「最新の綺麗な画像」の推論結果を取得する
+    start = tracker.cx
+    t0 = hw.clock.monotonic()
+    last_h = heading
+    while hw.clock.monotonic() - t0 < max_time:
+        yield ALIGN_STEP
+        update_sensor_data(hw)
+        tracker.predict(hw.clock.monotonic(), heading if hw.imu else None)
+        # 今の旋回速度のまま ALIGN_STOP_LEAD 秒回ったときの位置で判定する
+        turn = ((heading - last_h + 180) % 360 - 180) if hw.imu else 0.0
+        last_h = heading
+        ahead = tracker.cx + turn / ALIGN_STEP * ALIGN_STOP_LEAD / tracker.hfov
+        if (ahead - target_cx) * (start - target_cx) <= 0:
+            break
+
+def servo_command(err, d_f):
+    """方位ズレ err [deg] と前方ToF距離から (左, 右) の目標出力を決める"""
+    speed = SERVO_SPEED
+    if d_f is not None and d_f < SERVO_SLOW_DIST:
+        # SERVO_SLOW_DIST → TOF_GOAL_LONG で SERVO_SPEED → SERVO_MIN_SPEED に落とす
+        k = max(0.0, (d_f - TOF_GOAL_LONG) / (SERVO_SLOW_DIST - TOF_GOAL_LONG))
+        speed = SERVO_MIN_SPEED + (SERVO_SPEED - SERVO_MIN_SPEED) * k
+    # 大きくズレている間は前進を絞ってその場で向きを変える
+    speed *= max(0.0, 1.0 - abs(err) / SERVO_PIVOT_ERR)
+    # err > 0 は右輪 (B) を速くすると正面に来る側
+    turn = max(-SERVO_MAX_TURN, min(SERVO_MAX_TURN, SERVO_GAIN * err))
+    l_val = max(-1.0, min(1.0, speed - turn))
+    r_val = max(-1.0, min(1.0, speed + turn))
+    return l_val, r_val
+
+def slew(current, target, max_step):
+    return current + max(-max_step, min(max_step, target - current))
+
+def wait_frame(hw, since=None, timeout=FRAME_TIMEOUT):
+    """まだ使っていない次のカメラフレームを待つ (timeout 秒来なければ None)
+
+    since を渡すと、その時刻より前に露光したフレーム (止まる前のブレた画像) は使わない。
     """
-    meta = None
-    for _ in range(flush_count):
-        meta = picam2.capture_metadata()
-    return meta
+    t0 = hw.clock.monotonic()
+    while True:
+        frame = hw.frames.take(since=since)
+        if frame is not None or hw.clock.monotonic() - t0 > timeout:
+            return frame
+        yield
+
+def camera_ready(hw, timeout=CAMERA_READY_TIMEOUT):
+    """カメラを (まだなら) 起動し、最初のフレームが届くまで待つ"""
+    frames = hw.frames
+    if not frames.started:
+        print("📷 カメラ起動中...")
+        frames.start()
+    t0 = hw.clock.monotonic()
+    while frames.latest() is None and hw.clock.monotonic() - t0 < timeout:
+        yield 0.05
+
+def detect_cone(frame):
+    """フレームからコーンの中心X (0.0 ~ 1.0) を取り出す (無ければ None)"""
+    if frame is None or 'CnnOutputTensor' not in frame.metadata:
+        return None
+    return parse_direct_tensor(frame.metadata['CnnOutputTensor'])
 
 # ------------------------------------------------
 # 【Phase 1】 空中分離・着地判定フェーズ
 # ------------------------------------------------
-def phase1_drop_and_landing():
+def phase1_drop_and_landing(hw):
     print("\n【Phase 1】 放出待機・空中分離・着地判定 を開始します")
-    # 履歴・判定用変数
-    is_armed = False            # 発火準備フラグ
+    # 上昇・降下・開傘・着地の判定は FlightEventDetector が1サンプルずつ行う。
+    # センサー取得サービスがあればその更新ごと (全レート) に判定し、
+    # このループはイベントへの対応 (加熱) と表示・ログだけを PHASE1_INTERVAL で回す。
     is_fired = False            # 発火フラグ
-    is_deployed = False         # 開傘(衝撃)検知フラグ
-    max_altitude = 0.0
-    below_target_count = 0
-    landing_count = 0
-    static_count = 0
-    tof_target_count = 0  # ToF用カウンター
-    has_landed = False
-
-    while not has_landed:
+    detector = FlightEventDetector(ARM_ALTITUDE, TARGET_ALTITUDE, DROP_THRESHOLD,
+                                   base_altitude=hw.base_altitude)
+    streaming = hw.sensors is not None and detector.attach(hw.sensors)
+    timer = hw.timing.loop("phase1", PHASE1_INTERVAL)
+
+    while not detector.landed:
+        timer.tick()
+        now = hw.clock.monotonic()
         press, temp, abs_alt, rel_alt = 0, 0, 0, 0
         d_b = None
-    
-        if tof_bottom.data_ready:
+        tof_read = False
+
+        if hw.tof_bottom.data_ready:
+            tof_read = True
             try:
-                d_b = tof_bottom.distance
+                d_b = hw.tof_bottom.distance
             finally:
-                tof_bottom.clear_interrupt()
-        if d_b is not None and d_b < 300:
-            tof_target_count += 1
-        else:
-            tof_target_count = 0
+                hw.tof_bottom.clear_interrupt()
 
-        if dps:
+        baro_ok = False
+        if hw.baro:
             try:
-                press = dps.pressure
-                temp = dps.temperature
-                abs_alt = 44330 * (1.0 - (press / 1013.25) ** 0.1903)
-                rel_alt = abs_alt - base_altitude
-            
-                if rel_alt > max_altitude:
-                    max_altitude = rel_alt
+                press = hw.baro.pressure
+                temp = hw.baro.temperature
+                abs_alt = pressure_to_altitude(press)
+                rel_alt = abs_alt - hw.base_altitude
+                baro_ok = True
             except: pass
 
-        ax, ay, az = 0, 0, 0
         accel_norm = 9.8 # デフォルト1G
-        if sensor:
+        accel_ok = False
+        if hw.imu:
             try:
-                a = sensor.acceleration
+                a = hw.imu.acceleration
                 if a[0] is not None:
                     ax, ay, az = a
                     accel_norm = math.sqrt(ax**2 + ay**2 + az**2)
+                    accel_ok = True
             except: pass
+        # サービスが無い時 (直接読んでいる時) はこのループの周期で判定する
+        if not streaming:
+            if tof_read:
+                detector.update_tof(now, d_b)
+            if baro_ok:
+                detector.update_altitude(now, rel_alt)
+            if accel_ok:
+                detector.update_accel(now, accel_norm)
+        timer.lap("read")
+
+        for name, t, value in detector.poll():
+            if name == "arm":
+                print(f"🚀 上昇検知！ ロック解除 (高度: {value:.2f}m > {ARM_ALTITUDE}m)")
+            elif name == "apogee":
+                print(f"\n🔝 頂点通過 (最高高度: {value:.2f}m)")
+            elif name == "drop":
+                print(f"\n⬇️ 降下検知 (最高高度から {value:.1f}m)")
+            elif name == "shock":
+                print(f"\n💥 衝撃検知！ 開傘と判定 (G: {value/9.8:.1f})")
+            elif name == "release":
+                alt_at, d_at = detector.release_altitude, d_b
+                yield from burn_nicrome(hw)
+                is_fired = True
+                detector.separated(hw.clock.monotonic())
+                if value == "tof":
+                    print(f"\n📡 ToF緊急分離！ 気圧高度({alt_at:.2f}m)よりToFを優先 (Bottom: {d_at}cm)")
+                else:
+                    print(f"\n   空中分離！ 気圧高度({alt_at:.2f}m)より")
+            elif name == "landing":
+                print(f"\n🪂 着地検知！ (Alt: {detector.rel_alt:.2f}m, G: {detector.accel_norm:.1f}, {value})")
+        if not detector.armed:
+            print(f"[STANDBY] 高度: {rel_alt:.2f}m (Target: > {ARM_ALTITUDE}m)", end="\r")
 
-    # --- 2. ARMING (放出待機) ---
-        if not is_armed:
-            if rel_alt > ARM_ALTITUDE:
-                is_armed = True
-                print(f"🚀 上昇検知！ ロック解除 (高度: {rel_alt:.2f}m > {ARM_ALTITUDE}m)")
-            else:
-                print(f"[STANDBY] 高度: {rel_alt:.2f}m (Target: > {ARM_ALTITUDE}m)", end="\r")
-    
-        # --- 3. 空中分離 (発火) ---
-        elif is_armed and not is_fired:
-            # 開傘(衝撃)検知: 約1G から離れたか
-            if (accel_norm > 19.6 or accel_norm < 5.0) and not is_deployed:
-                is_deployed = True
-                print(f"\n💥 衝撃検知！ 開傘と判定 (G: {accel_norm/9.8:.1f})")
-        
-            # 降下検知 (15m以上落ちたか)
-            has_dropped = (max_altitude - rel_alt) >= DROP_THRESHOLD
-
-            if rel_alt < TARGET_ALTITUDE:
-                below_target_count += 1
-            else:
-                below_target_count = 0
-
-            # 発火条件: 降下済 AND ターゲット未満
-            # 本丸: 高度10m以下 かつ (衝撃検知済 OR 3回連続10m未満)
-            condition_main = has_dropped and (rel_alt < TARGET_ALTITUDE) and (is_deployed or below_target_count >= 3)
-            # バックアップ: Bottom ToFが5回連続300cm(3m)以内を検知
-            condition_backup = has_dropped and (tof_target_count >= 5)
-            if condition_main:
-                burn_nicrome()
-                print(f"\n   空中分離！ 気圧高度({rel_alt:.2f}m)より")
-            elif condition_backup:
-                burn_nicrome()
-                print(f"\n📡 ToF緊急分離！ 気圧高度({rel_alt:.2f}m)よりToFを優先 (Bottom: {d_b}cm)")
-        
-
-        # --- 4. 着地判定 ---
-        elif is_armed: # 分離済み、または分離前だが高度が下がってきた場合
-            # 条件A: 気圧が 3m 〜 -3m にいるか
-            if -3.0 <= rel_alt <= 3.0:
-                landing_count += 1
-            else:
-                landing_count = 0
-        
-            # 条件B: 9軸加速度が 1G (9.0〜11.0 m/s^2) 付近で安定しているか
-            if 9.0 <= accel_norm <= 11.0:
-                static_count += 1
-            else:
-                static_count = 0
+        state = detector.state
+        timer.lap("compute")
+        log_tick(hw, 1, state, rel_alt=rel_alt, accel_norm=accel_norm,
+                 tof=d_b if d_b is not None else NAN)
+        timer.lap("log")
 
-            # 50サンプル(5秒)気圧安定 OR 50サンプル(5秒)加速度安定
-            if landing_count >= 50 or static_count >= 50:
-                print(f"\n🪂 着地検知！ (Alt: {rel_alt:.2f}m, G: {accel_norm:.1f})")
-                has_landed = True
+        yield PHASE1_INTERVAL
 
-        time.sleep(0.1)
+    detector.detach()
+    print(detector.report())
+    timer.pause()
+    flush_log(hw)
 
     # --- 5. 緊急分離 (未分離レスキュー) ---
     if not is_fired:
         print("\n⚠️ 未分離レスキュー実行！ 着地後に強制加熱します")
-        nicrome.duty_cycle = int(65535 * DUTY_CYCLE_PERCENT)
-        time.sleep(BURN_TIME+1)
-        nicrome.duty_cycle = 0
+        hw.nicrome.duty_cycle = int(65535 * DUTY_CYCLE_PERCENT)
+        yield BURN_TIME + 1
+        hw.nicrome.duty_cycle = 0
         is_fired = True
         print("✅ 強制加熱完了")
 
     # --- 6. スタック回避走行 ---
     print(f"\n🏎️ スタック回避走行開始 ({RUN_DURATION}秒)")
-    execute_recovery_routine()
+    yield from execute_recovery_routine(hw, "escape")
     print("✅ 回避走行完了。ナビゲーションフェーズへ移行します。")
 
 
@@ -534,59 +428,69 @@ def phase1_drop_and_landing():
 # ------------------------------------------------
 # 【Phase 2】 GPSナビゲーションフェーズ
 # ------------------------------------------------
-def phase2_gps_navigation():
+def phase2_gps_navigation(hw):
     global next_cam_dist
+    route = hw.route
+    steering = make_steering()
     print("\n【Phase 2】 GPSのFix(測位)を待機しています...")
-    uart.reset_input_buffer()
+    hw.gps.reset_input_buffer()
+    # 測位の受け取りと位置推定は監視タスク (pose_monitor) が行う
     while True:
-      gps.update()
-      if gps.has_fix:
-        print(f"✅ GPS測位完了！(Lat: {gps.latitude:.5f}, Lon: {gps.longitude:.5f})")
+      if hw.gps.has_fix and hw.pose.initialized:
+        print(f"✅ GPS測位完了！(Lat: {hw.pose.latitude:.5f}, Lon: {hw.pose.longitude:.5f})")
         break
-      time.sleep(0.01)
-    uart.reset_input_buffer()
-    with open(filename, "a") as f:
-        f.write("Timestamp,Lat,Lon,Heading,Dist,TargetAngle,L_Speed,R_Speed,Fix\n")
+      yield 0.01
+    if not route.started:
+        # 区間の幾何は最初の測位位置から1回だけ計算する
+        route.begin(hw.pose.x, hw.pose.y)
+        print(f"🗺️ 経路 {len(route.legs)}区間 / {route.remaining(hw.pose.x, hw.pose.y):.1f}m\n{route.describe()}")
+    hw.gps.reset_input_buffer()
 
     last_action_time = 0
     min_dist_seen = float('inf') 
+    timer = hw.timing.loop("phase2", ACTION_INTERVAL)
 
     try:
         while True:
-            gps.update()
-            now_sys = time.time()
+            now_sys = hw.clock.time()
 
             if now_sys - last_action_time >= ACTION_INTERVAL:
                 last_action_time = now_sys
-                timestamp_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                timer.tick()
 
-                has_fix = gps.has_fix
-                lat = gps.latitude if has_fix else 0
-                lon = gps.longitude if has_fix else 0
+                # 判断には位置推定 (GPS の測位の間も進む) を使い、ログには GPS の生の値を残す
+                pose = hw.pose
+                fix = hw.gps.fix
+                has_fix = fix is not None
+                lat = fix.lat if has_fix else 0
+                lon = fix.lon if has_fix else 0
 
             # --- BNO055 データ取得と【転倒検知】 ---
                 heading = 0
                 pitch, roll = 0, 0
-                if sensor:
+                if hw.imu:
                     try:
                         # euler[0]:Heading, euler[1]:Roll, euler[2]:Pitch
-                        raw_h, r, p = sensor.euler
+                        raw_h, r, p = hw.imu.euler
                         if raw_h is not None:
                             heading = (raw_h + MOUNTING_OFFSET) % 360
                         if r is not None and p is not None:
                          roll, pitch = r, p
                     except: pass
-                # ★転倒検知ロジック (PitchかRollが100度を超えていたら裏返し)
-                if abs(roll) > 100 or abs(pitch) > 100:
-                    print(f"\n⚠️ 転倒検知！ (Roll:{roll:.0f} Pitch:{pitch:.0f})")
-                    execute_recovery_routine() # 復帰関数を呼び出し
-                    continue # 起き上がったら、今のループの計算は飛ばしてやり直す
+                if pose.heading is not None:
+                    heading = pose.heading  # GPS の進行方向で学習した取り付けズレを補正済み
+                timer.lap("read")
+                # ★転倒検知は監視タスク (fall_monitor) が常時行う
 
                 dist, target_ang, l_val, r_val = 0, 0, 0, 0 
+                state = "NOFIX"
 
                 if has_fix and lat != 0:
-                    dist = calculate_distance_meters(lat, lon, TARGET_LATITUDE, TARGET_LONGITUDE)
-                    target_ang = calculate_bearing(lat, lon, TARGET_LATITUDE, TARGET_LONGITUDE)
+                    if route.update(pose.x, pose.y):
+                        print(f"\n📍 経由点に到着。次の区間へ (方位 {route.leg.bearing:.0f}° / {route.leg.length:.1f}m)")
+                    # 距離はゴールまでの残り経路長、方位は区間の線上の少し先の点
+                    dist = route.remaining(pose.x, pose.y)
+                    target_ang = route.steer_bearing(pose.x, pose.y)
 
                 # ★距離のベストスコア更新
                     if dist < min_dist_seen:
@@ -594,64 +498,41 @@ def phase2_gps_navigation():
                 
                 # ★迷走検知ロジック (ベストスコアより RECALIB_DISTANCE_THRESHOLD 以上遠ざかったか？)
                     if dist > min_dist_seen + RECALIB_DISTANCE_THRESHOLD:
-                        if min_dist_seen < 15.0: # ★追加: ゴール付近(例: 15m以内)まで来て迷走した場合
+                        if route.final and min_dist_seen < 15.0: # ★追加: ゴール付近(例: 15m以内)まで来て迷走した場合
                             print(f"\n✅ ゴール付近(ベスト{min_dist_seen:.1f}m)での迷走検知。カメラフェーズへ移行します。")
                             break # ★追加: ループを抜けてPhase 3へ
                         else:
                             print("🔄 姿勢リセットと再キャリブレーションを実行します。")
-                            execute_calibration(sensor)               
+                            yield from execute_calibration(hw)
                             min_dist_seen = dist 
                             continue # 計算を飛ばして次のループへ
                    # ★カメラ起動判定 (20mから5m間隔で移行)
-                    if dist < next_cam_dist:
-                        stop_motors()
+                    if route.final and dist < next_cam_dist + CAMERA_WARMUP_DIST:
+                        hw.frames.start()   # 推論は Phase 3 の少し手前から (起動・露出合わせの時間を走行と重ねる)
+                    if route.final and dist < next_cam_dist:
+                        yield from hw.motors.stop_steps()
                         print(f"\n🎉 距離 {next_cam_dist}m 圏内に到達！(現在 {dist:.1f}m) カメラフェーズへ移行します。")
                         # ★追加: 次の目標を5m下げる (最小は5m)
                         next_cam_dist = max(5.0, next_cam_dist - 5.0) 
                         break # ループを抜けてPhase 3へ
 
                 # ★ゴール判定 (Phase 3への移行)
-                    if dist < GOAL_DISTANCE_METERS:
-                        stop_motors()
+                    if route.final and dist < GOAL_DISTANCE_METERS:
+                        yield from hw.motors.stop_steps()
                         print(f"\n🎉 ゴール到達！(残 {dist:.1f}m) カメラフェーズへ移行します。")
                         break # ★追加: ループを抜けてPhase 3へ
 
                     else:
-                        # --- 走行ロジック (P制御＆リミッター) ---
+                        # --- 走行ロジック (CONTROLLER で選んだ制御則) ---
                         angle_diff = normalize_angle_error(target_ang - heading)
-                       
-                        if abs(angle_diff) < APPROACH_ANGLE:
-                            # 直進: 両輪フルパワー
-                            action_icon = "⬆️ 前進"
-                            l_val = 1.0
-                            r_val = 1.0
-                        else:
-                            # 旋回: 片輪のみフルパワー駆動
-                            action_icon = "🔄 旋回"
-                            if angle_diff > 0:
-                                # 右旋回: 右を軸に(0.0)、左を回す(1.0)
-                                l_val = 0.0
-                                r_val = 1.0
-                            else:
-                                # 左旋回: 左を軸に(0.0)、右を回す(1.0)
-                                l_val = 1.0
-                                r_val = 0.0
-                        #if abs(angle_diff) < APPROACH_ANGLE:
-                        #    current_base = BASE_SPEED
-                        #    action_icon = "⬆️ 前進"
-                       # else:
-                        #    current_base = 0.0
-                         #   action_icon = "🔄 旋回"
-                       # turn = angle_diff * KP_GAIN
-                       # turn = max(-MAX_TURN, min(MAX_TURN, turn))
-
-                       # l_val = max(-1.0, min(1.0, current_base - turn))
-                       # r_val = max(-1.0, min(1.0, current_base + turn))
-                       # l_val = 1.0
-                       # r_val = 1.0
-
-                        set_motor_speed('A', l_val)
-                        set_motor_speed('B', r_val)
+                        l_val, r_val, state = steering.command(hw.clock.monotonic(), heading, target_ang,
+                                                               speed=route.leg.speed, pose=pose, route=route)
+                        action_icon = "⬆️ 前進" if state == "DRIVE" else "🔄 旋回"
+                        timer.lap("compute")
+
+                        hw.motors.set_speed('A', l_val)
+                        hw.motors.set_speed('B', r_val)
+                        timer.lap("actuate")
                     
                         # スマホ用ダッシュボード出力
                         diff_str = f"{angle_diff:+4.0f}°"
@@ -659,21 +540,20 @@ def phase2_gps_navigation():
 
                 else:
                     print("⏳ [📡GPS待機中] 衛星を見失いました... (安全のため一時停止)")
-                    stop_motors(duration=0.5)
+                    yield from hw.motors.stop_steps(duration=0.5)
+                    timer.lap("actuate")
 
-                #ログ保存
-                log_line = f"{timestamp_str},{lat},{lon},{heading:.2f},{dist:.2f},{target_ang:.2f},{l_val:.2f},{r_val:.2f},{int(has_fix)}\n"
-                with open(filename, "a") as f:
-                    f.write(log_line)
-                    f.flush()
-                    os.fsync(f.fileno())
+                #ログ保存 (整形と書き込みはロガー側で行う)
+                log_tick(hw, 2, state, lat, lon, heading, target_ang, dist, roll, pitch,
+                         l_val, r_val, int(has_fix))
+                timer.lap("log")
 
-            time.sleep(0.01)
+            yield 0.01
 
-    except KeyboardInterrupt:
-        print("\n停止信号を受信 (Ctrl+C)")
-        stop_motors(duration=1.0)
-        raise
+    finally:
+        timer.pause()
+        # フェーズ移行時はここまでのログを確実にSDへ書き出す
+        flush_log(hw)
 
 
 # ==========================================
@@ -681,7 +561,7 @@ def phase2_gps_navigation():
 # ==========================================
 scan = False
 
-def phase3_ai_terminal():
+def phase3_ai_terminal(hw):
     global scan
     """【Phase 3】メイン制御ループ (Stop & Go) ※既存のmain()関数を改名"""
     print("\n【Phase 3】 AIカメラナビゲーション開始")
@@ -690,29 +570,31 @@ def phase3_ai_terminal():
     STATE_ALIGN = "ALIGN"
     STATE_DASH = "DASH"
     current_state = STATE_SCAN
-    lost_counter = 0
-    scan_counter = 0
+    tracker = ConeTracker()
     SEARCH_PWR = 1.0
     TURN_PWR = 0.9
     DRIVE_PWR = 1.0
     TOF_GOAL_LONG_THRESHOLD = 100
     TOF_GOAL_SHORT_THRESHOLD = 40
+    ALIGN_LEFT = 0.30
+    ALIGN_RIGHT = 0.55
+    ALIGN_CENTER = (ALIGN_LEFT + ALIGN_RIGHT) / 2
     
-    led = DigitalInOut(LED_PIN)
-    led.direction = Direction.OUTPUT
-    led.value = False
-    led.value = False
+    hw.led.value = False
+    timer = hw.timing.loop("phase3")
 
     try:
-        stop_motors()
+        yield from hw.motors.stop_steps()
+        yield from camera_ready(hw)
+        settled = hw.clock.monotonic()
+        scan_since = settled
         while True:
-            # 【重要】AIの推論サイクルに合わせて少し待つ（CPUの負荷低減も兼ねる）
-            time.sleep(0.1)
-
+            timer.tick()
             # --- ★追加: 前方ToFセンサーによる最終ゴール判定 ---
-            if tof_front.data_ready:
+            d_f = None
+            if hw.tof_front.data_ready:
                 try:
-                    d_f = tof_front.distance
+                    d_f = hw.tof_front.distance
                     if d_f is not None:
                         # 状況把握のため現在距離を上書き表示
                         print(f"[ToF] 前方距離: {d_f} mm", end="\r") 
@@ -721,17 +603,27 @@ def phase3_ai_terminal():
                             DRIVE_PWR = 0.5
                         if d_f <= TOF_GOAL_SHORT_THRESHOLD:
                             print(f"\n\n🎉 最終ゴール到達！(前方距離: {d_f} mm) ミッションコンプリート！")
-                            led.value = True
+                            hw.led.value = True
                             
                             return True # ★Phase 3 を完了として終了させる
                 finally:
-                    tof_front.clear_interrupt()
+                    hw.tof_front.clear_interrupt()
+            timer.lap("tof")
             # ----------------------------------------------------
-            # シンプルに最新のメタデータを1回だけ取得する
-            metadata = picam2.capture_metadata()
-            cx = None
-            if 'CnnOutputTensor' in metadata:
-                cx = parse_direct_tensor(metadata['CnnOutputTensor'])
+            # 止まって揺れが収まった後に露光した、まだ使っていないフレームを待つ
+            frame = yield from wait_frame(hw, since=settled)
+            timer.lap("frame")
+            cx = detect_cone(frame)
+            # 検出と IMU の方位変化を追跡器に入れる (見えないフレームは予測だけ進む)
+            update_sensor_data(hw)
+            now = hw.clock.monotonic()
+            tracker.step(now, cx, heading if hw.imu else None)
+            timer.lap("compute")
+
+            log_tick(hw, 3, current_state, l_val=hw.motors.speed('A'), r_val=hw.motors.speed('B'),
+                     ai_cx=cx if cx is not None else NAN,
+                     tof=d_f if d_f is not None else NAN, frame=frame)
+            timer.lap("log")
 
             # ---------------------------------------------
             # 【モード1】スキャン（探す）
@@ -741,14 +633,11 @@ def phase3_ai_terminal():
                     print(f"\n🎯 コーン発見！(位置:{cx:.2f}) 照準を合わせます。")
                     current_state = STATE_ALIGN
                     scan = True
-                    lost_counter = 0  
-                    scan_counter = 0  # 発見したらスキャン回数をリセット
                 else:
-                    scan_counter += 1
-                    if scan_counter > 15:
+                    if now - scan_since > SCAN_TIMEOUT:
                         if scan:
-                            # ★変更: 一度でも見つけている場合は諦めずにスキャンを継続（カウンターのみリセット）
-                            scan_counter = 0
+                            # ★変更: 一度でも見つけている場合は諦めずにスキャンを継続（タイマーのみリセット）
+                            scan_since = now
                         else:
                             # 一度も見つけていない場合のみPhase 2へ戻る
                             print("\n⚠️ コーンが見つかりません。GPSフェーズ(Phase 2)に戻ります。")
@@ -756,39 +645,38 @@ def phase3_ai_terminal():
 
                     # \r を使って同じ行を上書きし、ログが埋まるのを防ぐ
                     print("\r🔄 周囲をスキャン中... (右へ旋回)", end="")
-                    set_motor_speed('A',SEARCH_PWR)
-                    set_motor_speed('B', -SEARCH_PWR)
+                    hw.motors.set_speed('A',SEARCH_PWR)
+                    hw.motors.set_speed('B', -SEARCH_PWR)
 
             # ---------------------------------------------
             # 【モード2】アライン（真正面に向く）
             # ---------------------------------------------
             elif current_state == STATE_ALIGN:
-                if cx is None:
-                    lost_counter += 1
-                    # 5回連続（約0.5秒間）見えなかったら「完全に見失った」と判定
-                    if lost_counter >= 10:
-                        print("\n⚠️ 完全に見失った！スキャンモードに戻ります。")
-                        current_state = STATE_SCAN
+                # 一定時間 (LOST_TIMEOUT) 観測が無ければ「完全に見失った」と判定
+                if tracker.lost:
+                    print("\n⚠️ 完全に見失った！スキャンモードに戻ります。")
+                    current_state = STATE_SCAN
+                    tracker.reset()
+                    scan_since = now
                     continue
 
-                # 見えた場合はカウンターをリセット
-                lost_counter = 0
-
-                if cx < 0.30:
-                    print(f"\r👈 左にズレている (位置:{cx:.2f}) -> ちょい左旋回   ", end="")
-                    set_motor_speed('A', -TURN_PWR)
-                    set_motor_speed('B', TURN_PWR)
-                    time.sleep(0.5)
-                    stop_motors()
-                    time.sleep(0.3)
-                elif cx > 0.55:
-                    print(f"\r👉 右にズレている (位置:{cx:.2f}) -> ちょい右旋回   ", end="")
-                    set_motor_speed('A', TURN_PWR)
-                    set_motor_speed('B', -TURN_PWR)
-                    time.sleep(0.5)
-                    stop_motors()
-                    time.sleep(0.3)
-                else:
+                # 見えないフレームでも追跡器の予測位置で照準する
+                est = tracker.cx
+                if est < ALIGN_LEFT:
+                    print(f"\r👈 左にズレている (位置:{est:.2f}) -> ちょい左旋回   ", end="")
+                    hw.motors.set_speed('A', -TURN_PWR)
+                    hw.motors.set_speed('B', TURN_PWR)
+                    yield from align_turn(hw, tracker, ALIGN_CENTER)
+                    yield from hw.motors.stop_steps()
+                    settled = hw.clock.monotonic() + SETTLE_TIME
+                elif est > ALIGN_RIGHT:
+                    print(f"\r👉 右にズレている (位置:{est:.2f}) -> ちょい右旋回   ", end="")
+                    hw.motors.set_speed('A', TURN_PWR)
+                    hw.motors.set_speed('B', -TURN_PWR)
+                    yield from align_turn(hw, tracker, ALIGN_CENTER)
+                    yield from hw.motors.stop_steps()
+                    settled = hw.clock.monotonic() + SETTLE_TIME
+                elif cx is not None:
                     print(f"\n✨ 真正面にロックオン！(位置:{cx:.2f}) ダッシュ準備！")
                     current_state = STATE_DASH
 
@@ -797,55 +685,266 @@ def phase3_ai_terminal():
             # ---------------------------------------------
             elif current_state == STATE_DASH:
                 print("🚀 直進ダーッシュ！！！")
-                set_motor_speed('A', DRIVE_PWR)
-                set_motor_speed('B', DRIVE_PWR)
-                time.sleep(1.0)
-                stop_motors()
-                time.sleep(0.5)
+                hw.motors.set_speed('A', DRIVE_PWR)
+                hw.motors.set_speed('B', DRIVE_PWR)
+                yield 1.0
+                yield from hw.motors.stop_steps()
+                settled = hw.clock.monotonic() + SETTLE_TIME
 
                 current_state = STATE_ALIGN
+            timer.lap("actuate")
 
-    except KeyboardInterrupt:
-        print("\nシステムを安全に停止します。")
+    except Exception as e:
+        print(f"\nエラーが発生しました: {e}")
         raise
+    finally:
+        timer.pause()
+        hw.motors.stop()
+        flush_log(hw)
+
+
+
+def phase3_visual_servo(hw):
+    """【Phase 3】連続操舵: カメラの毎フレーム、追跡した方位と前方ToFから左右の出力を決める"""
+    global scan
+    print("\n【Phase 3】 AIカメラナビゲーション開始 (連続操舵)")
+
+    STATE_SCAN = "SCAN"
+    STATE_SERVO = "SERVO"
+    current_state = STATE_SCAN
+    tracker = ConeTracker()
+    scan_since = hw.clock.monotonic()
+    last_t = scan_since
+    l_val = r_val = 0.0
+    hw.led.value = False
+    timer = hw.timing.loop("phase3")
+
+    try:
+        yield from camera_ready(hw)
+        scan_since = last_t = hw.clock.monotonic()
+        while True:
+            timer.tick()
+            # --- 前方ToFセンサーによる最終ゴール判定 ---
+            d_f = None
+            if hw.tof_front.data_ready:
+                try:
+                    d_f = hw.tof_front.distance
+                    if d_f is not None:
+                        print(f"[ToF] 前方距離: {d_f} mm", end="\r")
+                        if d_f <= TOF_GOAL_SHORT:
+                            print(f"\n\n🎉 最終ゴール到達！(前方距離: {d_f} mm) ミッションコンプリート！")
+                            hw.led.value = True
+                            return True
+                finally:
+                    hw.tof_front.clear_interrupt()
+            timer.lap("tof")
+
+            # 新しいフレームが届くたびに1回回る (カメラのフレームレートで操舵する)
+            frame = yield from wait_frame(hw)
+            timer.lap("frame")
+            cx = detect_cone(frame)
+            update_sensor_data(hw)
+            now = hw.clock.monotonic()
+            dt, last_t = now - last_t, now
+            tracker.step(now, cx, heading if hw.imu else None)
+
+            if tracker.lost:
+                if current_state == STATE_SERVO:
+                    print("\n⚠️ 完全に見失った！スキャンモードに戻ります。")
+                    current_state = STATE_SCAN
+                    tracker.reset()
+                    scan_since = now
+                if now - scan_since > SCAN_TIMEOUT:
+                    if not scan:
+                        # 一度も見つけていない場合のみPhase 2へ戻る
+                        print("\n⚠️ コーンが見つかりません。GPSフェーズ(Phase 2)に戻ります。")
+                        return False
+                    scan_since = now
+                print("\r🔄 周囲をスキャン中... (右へ旋回)", end="")
+                target = (SERVO_SEARCH_PWR, -SERVO_SEARCH_PWR)
+            else:
+                if current_state == STATE_SCAN:
+                    print(f"\n🎯 コーン発見！(位置:{tracker.cx:.2f}) 追従を開始します。")
+                    current_state = STATE_SERVO
+                    scan = True
+                target = servo_command(tracker.err, d_f)
+
+            # 急に出力を変えない (スリップ・転倒防止)
+            step = SERVO_SLEW * dt
+            l_val = slew(l_val, target[0], step)
+            r_val = slew(r_val, target[1], step)
+            timer.lap("compute")
+            hw.motors.set_speed('A', l_val)
+            hw.motors.set_speed('B', r_val)
+            timer.lap("actuate")
+
+            log_tick(hw, 3, current_state, heading=heading, roll=roll, pitch=pitch,
+                     l_val=l_val, r_val=r_val,
+                     ai_cx=cx if cx is not None else NAN,
+                     tof=d_f if d_f is not None else NAN, frame=frame)
+            timer.lap("log")
+
     except Exception as e:
         print(f"\nエラーが発生しました: {e}")
         raise
     finally:
-        stop_motors()
-        picam2.stop()
+        timer.pause()
+        hw.motors.stop()
+        flush_log(hw)
 
 
+# ==========================================
+# 監視タスク (状態・動作に関係なく一定周期で回る)
+# ==========================================
+def fall_monitor(hw):
+    """地上フェーズ中に PitchかRollが100度を超えていたら裏返しと判定し、復帰動作を割り込ませる"""
+    def check(engine):
+        if engine.state.tag == 1 or engine.interrupts:
+            return  # 空中 (Phase 1) では判定しない / 復帰中は重ねない
+        update_sensor_data(hw)
+        if abs(roll) > 100 or abs(pitch) > 100:
+            print(f"\n⚠️ 転倒検知！ (Roll:{roll:.0f} Pitch:{pitch:.0f})")
+            engine.interrupt(execute_recovery_routine(hw), "RECOVER")
+    return check
+
+def pose_monitor(hw):
+    """IMU の方位とモーター指令で位置推定を進め、GPS の測位が届いたら補正する"""
+    def step(engine):
+        if engine.state.tag == 1:
+            return  # 空中 (Phase 1) では推定しない
+        update_sensor_data(hw)
+        gps = hw.gps
+        hw.pose.predict(hw.clock.monotonic(), heading if hw.imu else None,
+                        hw.motors.output('A'), hw.motors.output('B'))
+        if gps.update():
+            # 1回の測位の値だけを使う (受信スレッドが途中で次の測位に差し替えても混ざらない)
+            fix = gps.fix
+            if fix is not None:
+                hw.pose.update_gps(fix.lat, fix.lon, fix.hdop, fix.speed, fix.course)
+    return step
+
+def heartbeat_log(hw):
+    """動作中などでログが途切れている間も、姿勢とモーター出力を記録し続ける"""
+    def log(engine):
+        if not engine.interrupts and hw.clock.time() - last_log_time < HEARTBEAT_INTERVAL:
+            return
+        update_sensor_data(hw)
+        state = engine.interrupts[-1].label if engine.interrupts else last_log_state
+        log_tick(hw, engine.state.tag, state, heading=heading, roll=roll, pitch=pitch,
+                 l_val=hw.motors.speed('A'), r_val=hw.motors.speed('B'))
+    return log
+
 
 # ==========================================
 # メインシーケンス (システム実行の起点)
 # ==========================================
+def build_mission(hw):
+    """Phase 1 → (Phase 2 ⇄ Phase 3) の状態機械を組み立てる"""
+    engine = Engine(hw.clock, timing=hw.timing)
+    always = lambda result: True
+    engine.add_state(State("PHASE1", lambda e: phase1_drop_and_landing(hw),
+                           [(always, "PHASE2")], tag=1))
+    engine.add_state(State("PHASE2", lambda e: phase2_gps_navigation(hw),
+                           [(always, "PHASE3")], tag=2))
+    # Phase 3 が True (ゴール) なら終了、それ以外は Phase 2 からリトライ
+    terminal = phase3_visual_servo if PHASE3_MODE == "servo" else phase3_ai_terminal
+    engine.add_state(State("PHASE3", lambda e: terminal(hw),
+                           [(lambda result: result is True, None), (always, "PHASE2")], tag=3))
+    engine.add_monitor("fall", fall_monitor(hw), FALL_CHECK_INTERVAL)
+    engine.add_monitor("heartbeat", heartbeat_log(hw), HEARTBEAT_INTERVAL)
+    engine.add_monitor("pose", pose_monitor(hw), POSE_INTERVAL)
+    return engine
+
+def make_steering():
+    """CONTROLLER の制御則を作る (bangbang は APPROACH_ANGLE を使う)"""
+    if CONTROLLER == "bangbang":
+        return make_controller(CONTROLLER, approach_angle=APPROACH_ANGLE)
+    return make_controller(CONTROLLER)
+
+def load_mission_route():
+    """MISSION_FILE の経路 (無ければ目標地点だけの経路) を読み込む"""
+    if MISSION_FILE:
+        return load_route(MISSION_FILE)
+    return Route([Waypoint(TARGET_LATITUDE, TARGET_LONGITUDE)])
+
+def run_mission(hw, with_phase1=False, resume_scan=False):
+    """Phase 1 → (Phase 2 ⇄ Phase 3) を実行する。ミッション完了で True
+
+    resume_scan=True なら Phase 2 を飛ばして Phase 3 の探索から始める。
+    """
+    global scan, next_cam_dist
+    scan = resume_scan
+    next_cam_dist = FIRST_CAM_DIST
+
+    hw.route = load_mission_route()
+    if hw.timing is None:
+        hw.timing = LoopTimings(hw.clock.monotonic)
+    # 位置推定は経路と同じ局所平面 (ゴール原点) で行う
+    hw.pose = PoseFilter(hw.route.frame)
+    engine = build_mission(hw)
+    engine.on_enter = startup_profile.mark   # startup_profile.py run で起動した時だけ記録される
+    hw.engine = engine
+    if with_phase1:
+        initial = "PHASE1"
+    else:
+        initial = "PHASE3" if scan else "PHASE2"
+    try:
+        engine.run(initial)
+        print("\n🏁 全ミッション完了！")
+        return True # 完全クリアで終了
+    finally:
+        print(engine.report())
+        print(hw.pose.report())
+        print(hw.timing.report())
+
+
 if __name__ == "__main__":
+    startup_profile.mark("main")
+    from hal_real import build_real_hardware
+    from sensor_service import attach_sensor_service
+    from camera_pipeline import attach_camera_pipeline
+    startup_profile.mark("imports")
+
+    flight_log = open_flight_log()
+    # SIGTERM/SIGHUP (pkill や SSH 切断) でもログを書き切ってから止まる
+    flight_log.install_signal_handlers()
+    hw = build_real_hardware(log=flight_log, live_view_port=LIVE_VIEW_PORT)
+    startup_profile.record_bringup(hw.bringup)
+    startup_profile.mark("hardware")
+    # kill -USR1 <pid> で各ループの周期・処理時間を途中で表示できる
+    hw.timing = LoopTimings(hw.clock.monotonic)
+    hw.timing.install_signal_handler()
+    # IMU・気圧・ToF は専用スレッドで読み、ループはキャッシュを見るだけにする
+    attach_sensor_service(hw)
+    # 推論結果も専用スレッドで受け取り、ループは最新フレームだけを見る
+    # (カメラの推論は Phase 3 の手前で起動する)
+    attach_camera_pipeline(hw, lazy=True)
+    startup_profile.mark("ready")
+    startup_profile.save()
 
     try:
-        # phase1_drop_and_landing()
-        
-        # ★追加: Phase 2 と Phase 3 を行き来するためのループ
-        while True:
-            if not scan : phase2_gps_navigation()
-            
-            mission_complete = phase3_ai_terminal()
-
-            if mission_complete:
-                print("\n🏁 全ミッション完了！")
-                break # 完全クリアで終了
-            else:
-                print("\n🔄 Phase 2 (GPSナビゲーション) からリトライします...")
+        run_mission(hw)
     except KeyboardInterrupt:
         print("\n停止信号を受信 (Ctrl+C)")
     except Exception as e:
         print(f"\nエラーが発生しました: {e}")
     finally:
-        stop_motors()
+        hw.motors.stop()
+        hw.motors.close()
+        hw.sensors.stop()
+        hw.frames.stop()
+        hw.gps.close()
+        flight_log.close()
+        print(f"📝 ログ: {flight_log.report()}")
+        print(hw.sensors.report())
+        print(hw.frames.report())
+        print(hw.motors.report())
+        if getattr(hw, "i2c", None) is not None:
+            print(hw.i2c.report())
         # 必要に応じてカメラやLEDのリソース解放処理を追加
         try:
-             picam2.stop()
-             picam2.close()
+             hw.camera.stop()
+             hw.camera.close()
              print("📷 カメラリソースを解放しました")
         except:
              pass
@@ -0,0 +1,237 @@
+import os
+import sys
+import math
+from array import array
+
+# ==========================================
+# 動作スクリプト (復帰・校正・揺さぶりの定型動作をデータで書く)
+# ==========================================
+# 動作ファイルは "[名前]" で始まる区画の並び。1行1命令 ("#" 以降はコメント):
+#   hold L R 秒           … 左右の出力 (L, R) をそのまま保つ
+#   ramp L R 秒           … 今の出力から (L, R) へ直線で変える
+#   oscillate L R 秒 回数 … (L, R) と (-L, -R) を 秒 ずつ交互に 回数 往復する (揺さぶり)
+#   arc dL dR 秒          … 今の出力に (dL, dR) を正弦の山で足して元に戻す (角を丸く曲がる)
+#   note 文字列           … ここまで進んだら表示する
+#   abort 条件名          … ここから先は「条件名」が成り立った時点で打ち切る
+#   repeat 回数           … 区画全体を繰り返す (区画の中のどこに書いてもよい)
+#   use 名前              … 先に書いた区画の中身をここに入れる (abort も一緒に入る)
+# 出力は -1.0〜1.0 (L が 'A'、R が 'B')。区画の最初の出力は (0, 0) とみなす。
+#
+# 読み込み時に DT 秒ごとの目標値の表 (Maneuver.left / right) まで作っておき、
+# 実行中は経過時間から表を引いて set_speed() するだけ (play() はコルーチン)。
+# 表の引き方は時刻基準なので、周期が遅れても動作全体の長さは変わらない。
+# 加速度の上限・トリムは motor_driver.MotorDriver 側で掛かる。
+# 打ち切り条件 (姿勢が戻った・校正が済んだ など) はミッション側が名前 → 関数で渡し、
+# 毎周期調べる (動作の区切りを待たずに止まれる)。
+#
+# python3 maneuvers.py maneuvers.txt [名前]   … 長さ・出力範囲・打ち切り条件を表示
+
+DT = 0.02                 # 目標値の表の刻み [s]
+DEFAULT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "maneuvers.txt")
+
+_ARGS = {"hold": 3, "ramp": 3, "oscillate": 4, "arc": 3}
+
+
+class Maneuver:
+    __slots__ = ("name", "dt", "left", "right", "repeat", "notes", "aborts")
+
+    def __init__(self, name, dt=DT):
+        self.name = name
+        self.dt = dt
+        self.left = array("f")
+        self.right = array("f")
+        self.repeat = 1
+        self.notes = {}           # 表の位置 -> 表示する文字列 (1回目だけ)
+        self.aborts = []          # (表の位置, 条件名) … その位置から有効
+
+    @property
+    def duration(self):
+        return len(self.left) * self.repeat * self.dt
+
+    def setpoint(self, t):
+        """開始から t 秒後の (L, R)。終わっていれば None"""
+        i = int(t / self.dt)
+        n = len(self.left)
+        if t < 0 or i >= n * self.repeat:
+            return None
+        return self.left[i % n], self.right[i % n]
+
+    def describe(self):
+        lo = min(min(self.left, default=0.0), min(self.right, default=0.0))
+        hi = max(max(self.left, default=0.0), max(self.right, default=0.0))
+        lines = [f"  [{self.name}] {self.duration:.2f}s ({len(self.left)}点"
+                 + (f" × {self.repeat}回" if self.repeat > 1 else "") + f") 出力 {lo:+.2f}〜{hi:+.2f}"]
+        for index, name in self.aborts:
+            lines.append(f"    {index * self.dt:6.2f}s〜 打ち切り: {name}")
+        for index, text in sorted(self.notes.items()):
+            lines.append(f"    {index * self.dt:6.2f}s  {text}")
+        return "\n".join(lines)
+
+
+def _samples(seconds, dt):
+    return max(1, int(round(seconds / dt))) if seconds > 0 else 0
+
+
+def _compile(name, sections, dt, stack=()):
+    """区画の命令列を Maneuver (目標値の表) にする"""
+    if name in stack:
+        raise ValueError(f"[{name}]: use が循環しています")
+    man = Maneuver(name, dt)
+    left, right = man.left, man.right
+    cur = [0.0, 0.0]
+
+    def emit(l_val, r_val):
+        left.append(max(-1.0, min(1.0, l_val)))
+        right.append(max(-1.0, min(1.0, r_val)))
+
+    for lineno, op, args in sections[name]:
+        where = f"[{name}] {lineno}行目"
+        if op == "note":
+            man.notes[len(left)] = " ".join(args)
+            continue
+        if op == "abort":
+            if len(args) != 1:
+                raise ValueError(f"{where}: 'abort 条件名' の形ではありません")
+            man.aborts.append((len(left), args[0]))
+            continue
+        if op == "use":
+            if len(args) != 1 or args[0] not in sections:
+                raise ValueError(f"{where}: use の区画 {' '.join(args)} がありません (先に書くこと)")
+            sub = _compile(args[0], sections, dt, stack + (name,))
+            base = len(left)
+            for _ in range(sub.repeat):
+                left.extend(sub.left)
+                right.extend(sub.right)
+            for index, text in sub.notes.items():
+                man.notes[base + index] = text
+            man.aborts.extend((base + index, cond) for index, cond in sub.aborts)
+            if left:
+                cur = [left[-1], right[-1]]
+            continue
+        if op == "repeat":
+            try:
+                man.repeat = int(args[0])
+            except (IndexError, ValueError):
+                raise ValueError(f"{where}: 'repeat 回数' の形ではありません")
+            if man.repeat < 1:
+                raise ValueError(f"{where}: repeat は 1 以上")
+            continue
+        if op not in _ARGS:
+            raise ValueError(f"{where}: 命令 {op} は使えません")
+        if len(args) != _ARGS[op]:
+            raise ValueError(f"{where}: {op} の引数は {_ARGS[op]}個です")
+        try:
+            values = [float(a) for a in args]
+        except ValueError:
+            raise ValueError(f"{where}: 数値として読めません")
+
+        if op == "hold":
+            l_val, r_val, sec = values
+            for _ in range(_samples(sec, dt)):
+                emit(l_val, r_val)
+            cur = [l_val, r_val]
+        elif op == "ramp":
+            l_val, r_val, sec = values
+            n = _samples(sec, dt)
+            for i in range(1, n + 1):
+                k = i / n
+                emit(cur[0] + (l_val - cur[0]) * k, cur[1] + (r_val - cur[1]) * k)
+            cur = [l_val, r_val]
+        elif op == "oscillate":
+            l_val, r_val, sec, count = values
+            n = _samples(sec, dt)
+            for _ in range(int(count)):
+                for sign in (1.0, -1.0):
+                    for _ in range(n):
+                        emit(sign * l_val, sign * r_val)
+            if int(count) > 0:
+                cur = [-l_val, -r_val]
+        else:  # arc
+            d_l, d_r, sec = values
+            n = _samples(sec, dt)
+            for i in range(n):
+                k = math.sin(math.pi * (i + 0.5) / n)
+                emit(cur[0] + d_l * k, cur[1] + d_r * k)
+    return man
+
+
+def parse_maneuvers(text, dt=DT):
+    """動作ファイルの中身を {名前: Maneuver} にする"""
+    sections = {}
+    current = None
+    for lineno, line in enumerate(text.splitlines(), 1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        if line.startswith("[") and line.endswith("]"):
+            current = line[1:-1].strip()
+            if not current or current in sections:
+                raise ValueError(f"{lineno}行目: 区画名 [{current}] が空か重複しています")
+            sections[current] = []
+            continue
+        if current is None:
+            raise ValueError(f"{lineno}行目: 最初に [名前] で区画を始めてください")
+        fields = line.split()
+        sections[current].append((lineno, fields[0].lower(), fields[1:]))
+    if not sections:
+        raise ValueError("動作ファイルに区画がありません")
+    return {name: _compile(name, sections, dt) for name in sections}
+
+
+def load_maneuvers(path=None, dt=DT):
+    with open(path or DEFAULT_FILE, encoding="utf-8") as f:
+        return parse_maneuvers(f.read(), dt)
+
+
+def play(maneuver, motors, clock, conditions=None):
+    """動作を実行するコルーチン (mission_engine 用)
+
+    打ち切ったら成り立った条件名、最後まで進んだら None を返す (yield from の値)。
+    終わった時の出力はそのまま (止めるのは呼び出し側)。
+    """
+    conditions = conditions or {}
+    for _, cond in maneuver.aborts:
+        if cond not in conditions:
+            raise ValueError(f"[{maneuver.name}]: 打ち切り条件 {cond} が渡されていません")
+    aborts = [(index, conditions[cond], cond) for index, cond in maneuver.aborts]
+    left, right, dt = maneuver.left, maneuver.right, maneuver.dt
+    n = len(left)
+    total = n * maneuver.repeat
+    shown = -1
+    t0 = clock.monotonic()
+    while True:
+        i = int((clock.monotonic() - t0) / dt)
+        if i >= total:
+            return None
+        for index, check, cond in aborts:
+            if (i >= index or i >= n) and check():
+                return cond
+        for j in range(shown + 1, min(i, n - 1) + 1):
+            text = maneuver.notes.get(j)
+            if text:
+                print(text)
+        shown = max(shown, min(i, n - 1))
+        motors.set_speed('A', left[i % n])
+        motors.set_speed('B', right[i % n])
+        yield dt
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) > 2 or (argv and argv[0] in ("-h", "--help")):
+        print("使い方: python3 maneuvers.py [maneuvers.txt [名前]]")
+        return 1
+    path = argv[0] if argv else DEFAULT_FILE
+    table = load_maneuvers(path)
+    names = argv[1:] or list(table)
+    print(f"🕹️ {path}: {len(table)}区画 (刻み {DT * 1e3:.0f}ms)")
+    for name in names:
+        if name not in table:
+            print(f"❌ 区画 [{name}] がありません")
+            return 1
+        print(table[name].describe())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+# ==========================================
+# ミッション状態機械エンジン
+# ==========================================
+# 各状態の処理 (action) はジェネレータ (コルーチン) で書き、待ちたいところで
+#     yield 0.5     … 0.5 秒後に再開
+#     yield         … 次の tick で再開
+# とする。time.sleep しないので、待っている間もエンジンは
+#   - 監視タスク (monitor): 周期ごとに必ず呼ばれる (転倒検知・ログなど)
+#   - 割り込み (interrupt): 状態の処理を一時停止して先に走らせるコルーチン (復帰動作など)
+# を回し続けられる。状態の処理が return した値で遷移先 (transitions) を決める。
+#
+# 待ちの合間は clock.sleep() でまとめて眠るので、仮想時計でも実時計でも同じ動きになる。
+# timing (loop_timing.LoopTimings) を渡すと、監視タスクごとの周期と処理時間を記録する。
+# on_enter に fn(状態名) を入れておくと、状態に入るたびに呼ばれる (起動時間の計測など)。
+
+DEFAULT_TICK = 0.01
+_EPS = 1e-9             # 時刻比較の丸め誤差吸収 [s]
+
+
+class Task:
+    """1本のコルーチンと、次に再開する時刻"""
+
+    def __init__(self, gen, label, now):
+        self.gen = gen
+        self.label = label
+        self.wake = now
+        self.done = False
+        self.result = None
+
+    def step(self, now, tick):
+        try:
+            delay = next(self.gen)
+        except StopIteration as stop:
+            self.done = True
+            self.result = stop.value
+            return
+        self.wake = now + (delay or tick)
+
+    def close(self):
+        try:
+            self.gen.close()
+        except Exception:
+            pass
+
+
+class State:
+    """状態: action(engine) がコルーチンを返す。transitions は [(guard(result), 遷移先名)]
+
+    遷移先に None を書くとそこでエンジンを終了する。tag は呼び出し側が自由に使う値。
+    """
+
+    def __init__(self, name, action, transitions, tag=None):
+        self.name = name
+        self.action = action
+        self.transitions = transitions
+        self.tag = tag
+
+
+class Monitor:
+    def __init__(self, name, fn, period, timer=None):
+        self.name = name
+        self.fn = fn
+        self.period = period
+        self.timer = timer
+        self.next_run = 0.0
+
+
+class Engine:
+    def __init__(self, clock, tick=DEFAULT_TICK, timing=None):
+        self.clock = clock
+        self.tick = tick
+        self.timing = timing
+        self.states = {}
+        self.monitors = []
+        self.state = None
+        self.task = None
+        self.interrupts = []
+        self.timeline = []        # (開始時刻, 状態名, 滞在時間, 結果)
+        self.result = None
+        self.on_enter = None
+        self._entered = 0.0
+
+    def add_state(self, state):
+        self.states[state.name] = state
+        return state
+
+    def add_monitor(self, name, fn, period):
+        """fn(engine) を period 秒ごとに呼ぶ (状態・割り込みに関係なく)"""
+        timer = self.timing.loop(name, period) if self.timing is not None else None
+        m = Monitor(name, fn, period, timer)
+        self.monitors.append(m)
+        return m
+
+    def interrupt(self, gen, label):
+        """状態の処理を止めて gen を先に最後まで走らせる"""
+        self.interrupts.append(Task(gen, label, self.clock.monotonic()))
+
+    def _enter(self, name):
+        self.state = self.states[name]
+        self._entered = self.clock.monotonic()
+        if self.on_enter is not None:
+            self.on_enter(name)
+        self.task = Task(self.state.action(self), name, self._entered)
+
+    def _leave(self, result):
+        now = self.clock.monotonic()
+        stay = now - self._entered
+        self.timeline.append((self._entered, self.state.name, stay, result))
+        for guard, target in self.state.transitions:
+            if guard(result):
+                print(f"\n⏱️ {self.state.name} → {target or '終了'} ({stay:.1f}秒)")
+                return target
+        raise RuntimeError(f"{self.state.name}: 結果 {result!r} に合う遷移がありません")
+
+    def run(self, initial):
+        """initial から状態機械を回し、最後の状態の結果を返す"""
+        self._enter(initial)
+        try:
+            while True:
+                now = self.clock.monotonic()
+                for m in self.monitors:
+                    if now + _EPS >= m.next_run:
+                        m.next_run = now + m.period
+                        if m.timer is None:
+                            m.fn(self)
+                        else:
+                            m.timer.tick()
+                            m.fn(self)
+                            m.timer.lap("run")
+
+                if self.interrupts:
+                    top = self.interrupts[-1]
+                    if now + _EPS >= top.wake:
+                        top.step(now, self.tick)
+                        if top.done:
+                            self.interrupts.pop()
+                            continue
+                elif now + _EPS >= self.task.wake:
+                    self.task.step(now, self.tick)
+                    if self.task.done:
+                        self.result = self.task.result
+                        target = self._leave(self.result)
+                        if target is None:
+                            self.task = None
+                            return self.result
+                        self._enter(target)
+                        continue
+
+                # 次にやることがある時刻まで眠る (監視タスクの周期は守る)
+                front = self.interrupts[-1] if self.interrupts else self.task
+                next_at = min([front.wake] + [m.next_run for m in self.monitors])
+                delay = next_at - self.clock.monotonic()
+                if delay > _EPS:
+                    self.clock.sleep(delay)
+        finally:
+            # 例外で抜けた場合も各コルーチンの finally (モーター停止・ログ書き出し) を走らせる
+            for t in reversed(self.interrupts):
+                t.close()
+            self.interrupts = []
+            if self.task is not None:
+                self.task.close()
+
+    def report(self):
+        lines = ["⏱️ 状態遷移タイムライン"]
+        t0 = self.timeline[0][0] if self.timeline else 0.0
+        for start, name, stay, result in self.timeline:
+            lines.append(f"  +{start - t0:7.1f}s  {name:<8} {stay:7.1f}s  → {result!r}")
+        return "\n".join(lines)
@@ -0,0 +1,141 @@
+import math
+import threading
+
+from hal import Motors
+
+# ==========================================
+# モーター出力の整形 (加速度制限ランプ・左右トリム)
+# ==========================================
+# MotorDriver は H ブリッジ 2ch のバックエンド (PwmMotors / SimMotors / ReplayMotors) の
+# 前に置き、Hardware.motors としてミッションに渡す。
+#   set_speed()  … 目標値を書くだけですぐ戻る。出力は RATE [Hz] ごとに目標へ
+#                  ACCEL [1/s] 以下の傾きで近づく (台形の立ち上がり・立ち下がり)
+#   stop_steps() … duration 秒かけて両輪同時に 0 へ (従来と同じ使い方)
+#   speed()      … 目標値 (判断・ログ用) / output() … いまバックエンドへ出している値
+# 定型の動作 (復帰・校正など) は maneuvers.play() が set_speed() で流す。
+# トリムは左右のモーターの個体差の補正で、バックエンドへ書く直前に掛ける。
+# 実機は専用スレッドで回し、仮想時計 (シミュレーション・再生) では時刻が進むたびに進める。
+# 出力のランプがあるので、左右の起動を 0.05 秒ずらして突入電流を分ける必要は無い。
+
+RATE = 100.0              # 出力を更新する周期 [Hz]
+ACCEL = 5.0               # 出力の変化率の上限 [1/s] (0 → 全速 0.2秒)
+MOTORS = ('A', 'B')
+
+
+def _clamp(value):
+    return max(-1.0, min(1.0, value))
+
+
+class MotorDriver(Motors):
+    def __init__(self, backend, clock, accel=ACCEL, trim=None, rate=RATE, threaded=True):
+        super().__init__(clock)
+        self.backend = backend
+        self.accel = accel
+        self.trim = {'A': 1.0, 'B': 1.0}
+        self.trim.update(trim or {})
+        self.period = 1.0 / rate
+        self.threaded = threaded
+        self._out = {'A': 0.0, 'B': 0.0}
+        self._rate = {'A': accel, 'B': accel}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        # 統計
+        self.updates = 0
+        self.late = 0
+        self.errors = 0
+        if threaded:
+            self._thread = threading.Thread(target=self._run, name="motors", daemon=True)
+            self._thread.start()
+        else:
+            clock.add_listener(self._advance)
+
+    # --- 制御側から呼ぶ (すぐ戻る) ---
+    def set_speed(self, motor, throttle):
+        if motor not in self._speed:
+            return
+        with self._lock:
+            self._set_target(motor, throttle)
+
+    def output(self, motor):
+        return self._out[motor]
+
+    @property
+    def busy(self):
+        """出力が目標へ向かっている途中なら True"""
+        return any(self._out[m] != self._speed[m] for m in MOTORS)
+
+    def wait_steps(self, poll=0.02):
+        """ランプが終わるまで待つコルーチン (mission_engine 用)"""
+        while self.busy:
+            yield poll
+
+    def stop_steps(self, duration=0.5, steps=10):
+        """両輪を duration 秒かけて同時に 0 にし、止まるまで待つ"""
+        with self._lock:
+            for m in MOTORS:
+                self._set_target(m, 0.0, ramp=duration)
+        if self.threaded and self._thread is None:
+            return  # close() 済み (出力は 0 にしてある)
+        yield from self.wait_steps(duration / steps)
+
+    def close(self, timeout=1.0):
+        """更新スレッドを止め、出力を直接 0 にする"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        with self._lock:
+            for m in MOTORS:
+                self._speed[m] = self._out[m] = 0.0
+        for m in MOTORS:
+            self.backend.set_speed(m, 0.0)
+
+    def report(self):
+        return (f"🛞 モーター 更新 {self.updates}回 | 遅れ {self.late} | 失敗 {self.errors} | "
+                f"加速度 {self.accel:.1f}/s | トリム A{self.trim['A']:.4f} B{self.trim['B']:.4f}")
+
+    # --- 出力の更新 ---
+    def _set_target(self, motor, throttle, ramp=None):
+        throttle = _clamp(throttle)
+        self._speed[motor] = throttle
+        rate = self.accel
+        if ramp:
+            # 指定時間で着く傾き (左右を同時に着かせる)。ACCEL は超えない
+            rate = min(rate, max(abs(throttle - self._out[motor]) / ramp, 1e-6))
+        self._rate[motor] = rate
+
+    def _advance(self, dt):
+        writes = []
+        with self._lock:
+            for m in MOTORS:
+                out, target = self._out[m], self._speed[m]
+                if out == target:
+                    continue
+                step = self._rate[m] * dt
+                out = target if abs(target - out) <= step else out + math.copysign(step, target - out)
+                self._out[m] = out
+                writes.append((m, out * self.trim[m]))
+        for m, value in writes:
+            self.backend.set_speed(m, value)
+        self.updates += 1
+
+    def _run(self):
+        clock = self.clock
+        last = next_at = clock.monotonic()
+        while not self._stop.is_set():
+            now = clock.monotonic()
+            try:
+                self._advance(now - last)
+            except Exception as e:
+                self.errors += 1
+                if self.errors == 1:
+                    print(f"⚠️ モーター出力の更新に失敗: {e}")
+            last = now
+            next_at += self.period
+            delay = next_at - clock.monotonic()
+            if delay > 0:
+                self._stop.wait(delay)
+            else:
+                self.late += 1
+                next_at = clock.monotonic()
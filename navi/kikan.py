@@ -1,3 +1,4 @@
+import os
 import time
 import sys
 import termios
@@ -6,6 +7,13 @@ import board
 import digitalio
 import pwmio
 
+# リポジトリ直下の共通モジュール (maneuvers) を読み込めるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from maneuvers import load_maneuvers
+
+# [f] の揺さぶりは動作スクリプト (maneuvers.txt の [flip]) で書く
+FLIP = load_maneuvers()["flip"]
+
 # ==========================================
 # 1. モーター設定 (あなたの環境に合わせたピン配置)
 # ==========================================
@@ -146,13 +154,14 @@ try:
         elif key == 'f':
             # 起き上がるための振り子運動（揺さぶり）の自動化
             print("\r💥 フリップルーチン開始！", end="")
-            for _ in range(3):
-                set_motor_speed('A', PWR)
-                set_motor_speed('B', PWR)
-                time.sleep(0.3)
-                set_motor_speed('A', -PWR)
-                set_motor_speed('B', -PWR)
-                time.sleep(0.3)
+            t0 = time.monotonic()
+            while True:
+                setpoint = FLIP.setpoint(time.monotonic() - t0)
+                if setpoint is None:
+                    break
+                set_motor_speed('A', setpoint[0])
+                set_motor_speed('B', setpoint[1])
+                time.sleep(FLIP.dt)
             stop_motors()
             print("\r停止          ", end="")
 
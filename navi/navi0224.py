@@ -6,8 +6,12 @@ import pwmio
 import adafruit_bno055
 import adafruit_gps
 import serial
-import math
 import os
+import sys
+
+# リポジトリ直下の共通モジュール (geodesy) を読み込めるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from geodesy import calculate_distance_meters, calculate_bearing
 
 # ==========================================
 # 1. 設定エリア
@@ -104,21 +108,6 @@ gps.send_command(b"PMTK220,200") # 5Hz更新 (GPSの取得頻度を上げる)
 # ==========================================
 # 4. 計算関数
 # ==========================================
-def calculate_distance_meters(lat1, lon1, lat2, lon2):
-    R = 6371000
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    delta_lambda = math.radians(lon2 - lon1)
-    a = math.sin((phi2 - phi1)/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(delta_lambda/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
-
-def calculate_bearing(lat1, lon1, lat2, lon2):
-    lon1, lat1, lon2, lat2 = map(math.radians, [lon1, lat1, lon2, lat2])
-    dLon = lon2 - lon1
-    y = math.sin(dLon) * math.cos(lat2)
-    x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(dLon)
-    return (math.degrees(math.atan2(y, x)) + 360) % 360
-
 def normalize_angle_error(error):
     while error > 180: error -= 360
     while error < -180: error += 360
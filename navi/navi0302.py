@@ -6,8 +6,13 @@ import pwmio
 import adafruit_bno055
 import adafruit_gps
 import serial
-import math
 import os
+import sys
+
+# リポジトリ直下の共通モジュール (flight_logger) を読み込めるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from flight_logger import FlightLogger
+from geodesy import calculate_distance_meters, calculate_bearing
 
 # ==========================================
 # 1. 設定エリア
@@ -104,21 +109,6 @@ gps.send_command(b"PMTK220,200") # 5Hz更新 (GPSの取得頻度を上げる)
 # ==========================================
 # 4. 計算関数
 # ==========================================
-def calculate_distance_meters(lat1, lon1, lat2, lon2):
-    R = 6371000
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    delta_lambda = math.radians(lon2 - lon1)
-    a = math.sin((phi2 - phi1)/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(delta_lambda/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
-
-def calculate_bearing(lat1, lon1, lat2, lon2):
-    lon1, lat1, lon2, lat2 = map(math.radians, [lon1, lat1, lon2, lat2])
-    dLon = lon2 - lon1
-    y = math.sin(dLon) * math.cos(lat2)
-    x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(dLon)
-    return (math.degrees(math.atan2(y, x)) + 360) % 360
-
 def normalize_angle_error(error):
     while error > 180: error -= 360
     while error < -180: error += 360
@@ -219,8 +209,12 @@ uart.reset_input_buffer()
 # フェーズ 4: メインループ (ナビゲーション)
 # ------------------------------------------------
 print("\n【Phase 4】 屋外ナビゲーション開始")
-with open(filename, "w") as f:
-    f.write("Timestamp,Lat,Lon,Heading,Dist,TargetAngle,L_Speed,R_Speed,Fix\n")
+flight_log = FlightLogger(
+    filename,
+    header="Timestamp,Lat,Lon,Heading,Dist,TargetAngle,L_Speed,R_Speed,Fix",
+    fmt="{:%Y-%m-%d %H:%M:%S},{},{},{:.2f},{:.2f},{:.2f},{:.2f},{:.2f},{:d}",
+)
+flight_log.install_signal_handlers()
 
 last_action_time = 0
 has_reached_goal = False
@@ -235,7 +229,7 @@ try:
 
         if now_sys - last_action_time >= ACTION_INTERVAL:
             last_action_time = now_sys
-            timestamp_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            timestamp = datetime.now()
 
             has_fix = gps.has_fix
             lat = gps.latitude if has_fix else 0
@@ -286,8 +280,9 @@ try:
                 # --- ゴール判定 ---
                 if not has_reached_goal and dist < GOAL_DISTANCE_METERS:
                     print("\n🎉 GOAL REACHED! 🎉")
+                    flight_log.flush()
                     with open(filename, "a") as f:
-                        f.write(f"====================,GOAL REACHED at {timestamp_str},====================\n")
+                        f.write(f"====================,GOAL REACHED at {timestamp:%Y-%m-%d %H:%M:%S},====================\n")
                     has_reached_goal = True
                     stop_motors(duration=1.0)
 
@@ -322,15 +317,14 @@ try:
                 print("⏳ [📡GPS待機中] 衛星を見失いました... (安全のため一時停止)")
                 stop_motors(duration=0.5)
 
-            # ログ保存
-            log_line = f"{timestamp_str},{lat},{lon},{heading:.2f},{dist:.2f},{target_ang:.2f},{l_val:.2f},{r_val:.2f},{int(has_fix)}\n"
-            with open(filename, "a") as f:
-                f.write(log_line)
-                f.flush()
-                os.fsync(f.fileno())
+            # ログ保存 (整形と書き込みはロガー側で行う)
+            flight_log.log(timestamp, lat, lon, heading, dist, target_ang, l_val, r_val, int(has_fix))
 
         time.sleep(0.01)
 
 except KeyboardInterrupt:
     print("\n停止信号を受信 (Ctrl+C)")
     stop_motors(duration=1.0)
+finally:
+    flight_log.close()
+    print(f"📝 ログ: {flight_log.report()}")
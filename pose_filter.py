@@ -0,0 +1,202 @@
+import math
+
+# ==========================================
+# 位置推定 (拡張カルマンフィルタ: GPS + IMU方位 + モーター指令)
+# ==========================================
+# 状態 s = [x, y, v]
+#   x, y : 局所平面 (LocalFrame, 東・北) 上の位置 [m]
+#   v    : 前進速度 [m/s]
+# 予測 (制御周期ごと):
+#   x += v*sin(ψ)*dt,  y += v*cos(ψ)*dt
+#   v += (WHEEL_SPEED*(L+R)/2 - v) * dt/MOTOR_TAU   (指令に一次遅れで追従)
+#   ψ は IMU の方位 + GPS の進行方向から少しずつ学習する取り付けズレ (heading_bias)
+# 補正 (GPS の測位ごと):
+#   位置 … 分散 (GPS_UERE*HDOP)² で重み付け。外れ値はゲートで棄却
+#   速度 … RMC の対地速度があれば v を補正
+#
+# GPS は 2Hz でしか来ないが、間を予測で埋めるので制御側は常に「今の」位置を見られ、
+# 測位ノイズによる距離・方位の跳びも HDOP に応じて均される。
+# 3x3 なので numpy は使わずリストで書いている。
+
+WHEEL_SPEED = 0.5         # 両輪1.0の時の前進速度 [m/s]
+MOTOR_TAU = 0.3           # 指令に対する速度の一次遅れ [s]
+GPS_UERE = 2.0            # HDOP=1 の時の測位誤差 (1軸, 1σ) [m]
+DEFAULT_HDOP = 1.5        # HDOP が分からない受信機の場合
+SPEED_MEAS_NOISE = 0.2    # GPS 対地速度のノイズ (1σ) [m/s]
+POS_NOISE = 0.3           # 位置のランダムウォーク強度 (滑り・方位誤差) [m/√s]
+SPEED_NOISE = 0.3         # 速度のランダムウォーク強度 [m/s/√s]
+INIT_SPEED_STD = 0.3      # 初期化時の速度の不確かさ [m/s]
+GATE = 13.8               # 位置の観測を採用するマハラノビス距離² の上限 (2自由度 99.9%)
+MAX_REJECTS = 3           # これだけ連続で棄却したら GPS 側を信じて初期化し直す
+COURSE_MIN_SPEED = 0.3    # これより遅い時の GPS 進行方向は使わない [m/s]
+HEADING_BIAS_GAIN = 0.05  # 進行方向1回あたり取り付けズレへ反映する割合
+MAX_HEADING_BIAS = 45.0   # 取り付けズレの推定の上限 [deg]
+
+
+def _wrap(deg):
+    return (deg + 180.0) % 360.0 - 180.0
+
+
+class PoseFilter:
+    def __init__(self, frame):
+        self.frame = frame          # geodesy.LocalFrame (目標地点を原点にすると距離・方位が速い)
+        self.reset()
+
+    def reset(self):
+        self.initialized = False
+        self.x = 0.0
+        self.y = 0.0
+        self.v = 0.0
+        self.P = [[0.0] * 3 for _ in range(3)]
+        self.t = None
+        self.heading_imu = None
+        self.heading_bias = 0.0
+        self.rejects = 0
+        self.fixes = 0
+        self.rejected = 0
+        self.last_fix = None
+
+    # --- 予測 ---
+    def predict(self, t, heading=None, l_val=0.0, r_val=0.0):
+        """時刻 t まで進める。heading [deg] は IMU の方位, l_val/r_val はモーター指令"""
+        if heading is not None:
+            self.heading_imu = heading
+        dt = 0.0 if self.t is None else t - self.t
+        self.t = t
+        if not self.initialized or dt <= 0.0:
+            return
+        a = min(1.0, dt / MOTOR_TAU)
+        v_cmd = WHEEL_SPEED * (l_val + r_val) / 2.0
+        psi = self.heading
+        if psi is None:
+            # 方位が分からなければ位置は進めず、不確かさだけ増やす
+            sn = cs = 0.0
+        else:
+            sn, cs = math.sin(math.radians(psi)), math.cos(math.radians(psi))
+        self.x += self.v * sn * dt
+        self.y += self.v * cs * dt
+        self.v += (v_cmd - self.v) * a
+
+        # F = [[1, 0, sn*dt], [0, 1, cs*dt], [0, 0, 1-a]]
+        P = self.P
+        f02, f12, f22 = sn * dt, cs * dt, 1.0 - a
+        # FP
+        fp = [[P[0][j] + f02 * P[2][j] for j in range(3)],
+              [P[1][j] + f12 * P[2][j] for j in range(3)],
+              [f22 * P[2][j] for j in range(3)]]
+        # (FP)F^T
+        q_pos = POS_NOISE ** 2 * dt
+        if psi is None:
+            q_pos += (WHEEL_SPEED * dt) ** 2
+        self.P = [[fp[i][0] + fp[i][2] * f02, fp[i][1] + fp[i][2] * f12, fp[i][2] * f22]
+                  for i in range(3)]
+        self.P[0][0] += q_pos
+        self.P[1][1] += q_pos
+        self.P[2][2] += SPEED_NOISE ** 2 * dt
+
+    # --- 補正 ---
+    def update_gps(self, lat, lon, hdop=None, speed=None, course=None):
+        """GPS の測位で補正する。位置を採用したら True"""
+        zx, zy = self.frame.to_enu(lat, lon)
+        r = (GPS_UERE * (hdop if hdop else DEFAULT_HDOP)) ** 2
+        self.last_fix = self.t
+        if not self.initialized:
+            self._init(zx, zy, r)
+            return True
+        accepted = self._update_position(zx, zy, r)
+        if accepted and speed is not None:
+            self._update_speed(speed)
+            if course is not None and speed >= COURSE_MIN_SPEED and self.heading_imu is not None:
+                # 走っている時の GPS 進行方向と IMU の方位の差を取り付けズレとして少しずつ学習
+                diff = _wrap(course - self.heading_imu - self.heading_bias)
+                bias = self.heading_bias + HEADING_BIAS_GAIN * diff
+                self.heading_bias = max(-MAX_HEADING_BIAS, min(MAX_HEADING_BIAS, bias))
+        return accepted
+
+    def _update_position(self, zx, zy, r):
+        P = self.P
+        s00, s01, s11 = P[0][0] + r, P[0][1], P[1][1] + r
+        det = s00 * s11 - s01 * s01
+        i00, i01, i11 = s11 / det, -s01 / det, s00 / det
+        yx, yy = zx - self.x, zy - self.y
+        if yx * (i00 * yx + i01 * yy) + yy * (i01 * yx + i11 * yy) > GATE:
+            self.rejects += 1
+            self.rejected += 1
+            if self.rejects < MAX_REJECTS:
+                return False
+            # 予測がずれていたとみなし、GPS 側で初期化し直す (速度は残す)
+            self._init(zx, zy, r, keep_speed=True)
+            return True
+        # K = P H^T S^-1  (H は x, y を取り出すだけ)
+        K = [[P[i][0] * i00 + P[i][1] * i01, P[i][0] * i01 + P[i][1] * i11] for i in range(3)]
+        self.x += K[0][0] * yx + K[0][1] * yy
+        self.y += K[1][0] * yx + K[1][1] * yy
+        self.v += K[2][0] * yx + K[2][1] * yy
+        self.P = [[P[i][j] - K[i][0] * P[0][j] - K[i][1] * P[1][j] for j in range(3)]
+                  for i in range(3)]
+        self.rejects = 0
+        self.fixes += 1
+        return True
+
+    def _update_speed(self, speed):
+        P = self.P
+        s = P[2][2] + SPEED_MEAS_NOISE ** 2
+        k = [P[i][2] / s for i in range(3)]
+        y = speed - self.v
+        self.x += k[0] * y
+        self.y += k[1] * y
+        self.v += k[2] * y
+        self.P = [[P[i][j] - k[i] * P[2][j] for j in range(3)] for i in range(3)]
+
+    def _init(self, zx, zy, r, keep_speed=False):
+        self.initialized = True
+        self.x, self.y = zx, zy
+        if not keep_speed:
+            self.v = 0.0
+        self.P = [[r, 0.0, 0.0], [0.0, r, 0.0], [0.0, 0.0, INIT_SPEED_STD ** 2]]
+        self.rejects = 0
+        self.fixes += 1
+
+    # --- 推定値 ---
+    @property
+    def heading(self):
+        """取り付けズレを補正した方位 [deg] (IMU が無ければ None)"""
+        if self.heading_imu is None:
+            return None
+        return (self.heading_imu + self.heading_bias) % 360
+
+    @property
+    def speed(self):
+        return self.v
+
+    @property
+    def velocity(self):
+        """(東, 北) の速度 [m/s]"""
+        psi = self.heading
+        if psi is None:
+            return 0.0, 0.0
+        rad = math.radians(psi)
+        return self.v * math.sin(rad), self.v * math.cos(rad)
+
+    @property
+    def latitude(self):
+        return self.frame.to_latlon(self.x, self.y)[0]
+
+    @property
+    def longitude(self):
+        return self.frame.to_latlon(self.x, self.y)[1]
+
+    @property
+    def sigma(self):
+        """位置の標準偏差 (東西・南北の平均) [m]"""
+        return math.sqrt(max((self.P[0][0] + self.P[1][1]) / 2.0, 0.0))
+
+    def range_bearing(self, lat, lon):
+        """推定位置から (lat, lon) への (距離 [m], 方位 [deg])"""
+        tx, ty = self.frame.to_enu(lat, lon)
+        dx, dy = tx - self.x, ty - self.y
+        return math.hypot(dx, dy), math.degrees(math.atan2(dx, dy)) % 360
+
+    def report(self):
+        return (f"🧭 位置推定 測位 {self.fixes}回 | 棄却 {self.rejected} | "
+                f"σ {self.sigma:.2f}m | 方位ズレ補正 {self.heading_bias:+.1f}°")
@@ -4,9 +4,15 @@ import busio
 import digitalio
 import pwmio
 import os
+import sys
 import adafruit_dps310
 import adafruit_bno055
-from collections import deque
+
+# リポジトリ直下の共通モジュール (flight_logger) を読み込めるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from flight_logger import FlightLogger
+from bno055_burst import Bno055Burst
+from streaming_stats import SlidingWindow
 
 # ==========================================
 # 設定エリア
@@ -58,6 +64,8 @@ except:
         print("✅ 9軸IMU接続成功 (Addr: 0x29)")
     except:
         print("⚠️ 9軸IMUが見つかりません (ログは0で埋めます)")
+# 9軸をまとめて1回の取引で読む (プロパティ4回分)
+imu_burst = Bno055Burst(imu.i2c_device) if imu else None
 
 # 3. モーター設定
 l_in1 = digitalio.DigitalInOut(PIN_L_IN1)
@@ -93,16 +101,20 @@ time.sleep(WAIT_TIME_START)
 # ログファイル作成
 # ==========================================
 csv_filename = f"{LOG_DIR}/mission_{int(time.time())}.csv"
-with open(csv_filename, "w") as f:
-    # ヘッダー: 時刻, フェーズ, 気圧, 高度, オイラー角(3), 加速度(3), ジャイロ(3), 地磁気(3)
-    f.write("Time,Phase,Pressure,Altitude,Heading,Roll,Pitch,AccelX,AccelY,AccelZ,GyroX,GyroY,GyroZ,MagX,MagY,MagZ\n")
+# ヘッダー: 時刻, フェーズ, 気圧, 高度, オイラー角(3), 加速度(3), ジャイロ(3), 地磁気(3)
+flight_log = FlightLogger(
+    csv_filename,
+    header="Time,Phase,Pressure,Altitude,Heading,Roll,Pitch,AccelX,AccelY,AccelZ,GyroX,GyroY,GyroZ,MagX,MagY,MagZ",
+    fmt="{:.2f},{}" + ",{:.2f}" * 14,
+)
+flight_log.install_signal_handlers()
 
 print(f"計測開始！ログ保存先: {csv_filename}")
 
 # ==========================================
 # メインループ
 # ==========================================
-history = deque(maxlen=50) # 5秒分の高度履歴
+history = SlidingWindow(5.0) # 直近5秒の高度 (最古・最小・最大を O(1) で見る)
 PHASE = 0
 start_time = time.time()
 run_start_time = 0
@@ -126,51 +138,37 @@ try:
         gx, gy, gz = 0, 0, 0
         mx, my, mz = 0, 0, 0
         
-        if imu:
+        if imu_burst:
             try:
-                # オイラー角
-                e = imu.euler
-                if e[0] is not None: h, r, p = e
-                # 加速度
-                a = imu.acceleration
-                if a[0] is not None: ax, ay, az = a
-                # ジャイロ
-                g = imu.gyro
-                if g[0] is not None: gx, gy, gz = g
-                # 地磁気
-                m = imu.magnetic
-                if m[0] is not None: mx, my, mz = m
+                sample = imu_burst.read()
+                h, r, p = sample.euler
+                ax, ay, az = sample.accel
+                gx, gy, gz = sample.gyro
+                mx, my, mz = sample.mag
             except: pass
 
-        # --- ログ保存 (CSV) ---
-        log_line = f"{now:.2f},{PHASE},{press:.2f},{alt:.2f}," \
-                   f"{h:.2f},{r:.2f},{p:.2f}," \
-                   f"{ax:.2f},{ay:.2f},{az:.2f}," \
-                   f"{gx:.2f},{gy:.2f},{gz:.2f}," \
-                   f"{mx:.2f},{my:.2f},{mz:.2f}\n"
-        
-        with open(csv_filename, "a") as f:
-            f.write(log_line)
-            f.flush()
-            os.fsync(f.fileno())
+        # --- ログ保存 (CSV) --- 整形と書き込みはロガー側で行う
+        flight_log.log(now, PHASE, press, alt, h, r, p, ax, ay, az, gx, gy, gz, mx, my, mz)
 
         # --- 制御ロジック ---
-        history.append(alt)
+        history.push(now, alt)
         
         if PHASE == 0: # 落下検知
-            if len(history) == 50:
-                diff = history[0] - history[-1]
+            if history.full:
+                diff = history.first - history.last
                 if diff >= DROP_THRESHOLD:
                     print(f"🚀 落下検知! (降下量: {diff:.1f}m)")
                     PHASE = 1
+                    flight_log.flush()
                     history.clear()
 
         elif PHASE == 1: # 着地検知
-            if len(history) == 50:
-                stab = max(history) - min(history)
+            if history.full:
+                stab = history.range
                 if stab <= LANDING_THRESHOLD:
                     print(f"🪂 着地検知! (変動幅: {stab:.1f}m)")
                     PHASE = 2
+                    flight_log.flush()
                     run_start_time = time.time()
 
         elif PHASE == 2: # 走行
@@ -182,6 +180,7 @@ try:
                 print("🏁 走行終了")
                 stop_motor()
                 PHASE = 3
+                flight_log.flush()
 
         elif PHASE == 3: # 終了
             pass
@@ -191,3 +190,6 @@ try:
 except KeyboardInterrupt:
     stop_motor()
     print("停止")
+finally:
+    flight_log.close()
+    print(f"📝 ログ: {flight_log.report()}")
@@ -0,0 +1,190 @@
+import sys
+import math
+
+from geodesy import LocalFrame
+
+# ==========================================
+# 経路 (経由点 → ゴール) と区間ごとの追従計算
+# ==========================================
+# ミッションファイルは 1行1地点のテキスト ("#" 以降はコメント):
+#   緯度, 経度 [, 到着半径 m [, 速度 0.0〜1.0]]
+# 最後の行がゴール (コーン)。到着半径・速度を省くと WAYPOINT_RADIUS / 1.0。
+#
+# 起動時に全地点をゴール原点の局所平面 (LocalFrame) へ直し、区間 (Leg) ごとの
+# 始点・単位方向ベクトル・方位・長さ・残り距離を先に計算しておく。
+# 制御周期ごとの計算は今の区間に対する内積・外積と atan2 1回だけ:
+#   along = 区間の始点から進んだ距離, cross = 区間の線からの横ズレ (右が正)
+# 操舵の目標方位は「区間の線上で LOOKAHEAD 先の点」への方位なので、
+# 横に流されても線へ戻りながら経由点へ向かう。最初の区間だけは始点が着地点
+# (たまたまの測位位置) で、なぞる意味のある線ではないので経由点へ直接向かう。
+
+WAYPOINT_RADIUS = 3.0     # 経由点の到着半径 (省略時) [m]
+LOOKAHEAD = 4.0           # 線上の目標点をどれだけ先に取るか [m]
+
+
+class Waypoint:
+    __slots__ = ("lat", "lon", "radius", "speed")
+
+    def __init__(self, lat, lon, radius=WAYPOINT_RADIUS, speed=1.0):
+        self.lat = lat
+        self.lon = lon
+        self.radius = radius
+        self.speed = speed
+
+
+class Leg:
+    __slots__ = ("index", "sx", "sy", "ex", "ey", "ux", "uy", "length", "bearing",
+                 "radius", "speed", "rest")
+
+    def __init__(self, index, sx, sy, ex, ey, radius, speed, rest):
+        self.index = index
+        self.sx, self.sy = sx, sy
+        self.ex, self.ey = ex, ey
+        dx, dy = ex - sx, ey - sy
+        self.length = math.hypot(dx, dy)
+        n = self.length or 1.0
+        self.ux, self.uy = dx / n, dy / n
+        self.bearing = math.degrees(math.atan2(dx, dy)) % 360
+        self.radius = radius
+        self.speed = speed
+        self.rest = rest            # この区間の終点からゴールまでの経路長 [m]
+
+    def along(self, x, y):
+        return (x - self.sx) * self.ux + (y - self.sy) * self.uy
+
+    def cross(self, x, y):
+        """区間の線からの横ズレ [m] (進行方向に対して右が正)"""
+        return (x - self.sx) * self.uy - (y - self.sy) * self.ux
+
+
+class Route:
+    def __init__(self, waypoints):
+        if not waypoints:
+            raise ValueError("経路に地点がありません")
+        self.waypoints = list(waypoints)
+        goal = self.waypoints[-1]
+        self.frame = LocalFrame(goal.lat, goal.lon)
+        self.points = [self.frame.to_enu(w.lat, w.lon) for w in self.waypoints]
+        self.legs = []
+        self.index = 0
+        self.arrivals = []          # (区間番号, 到着時の along, cross)
+
+    @property
+    def goal(self):
+        return self.waypoints[-1]
+
+    @property
+    def started(self):
+        return bool(self.legs)
+
+    def begin(self, x, y):
+        """今の位置 (x, y) を始点にして全区間を計算する (ナビ開始時に1回)"""
+        starts = [(x, y)] + self.points[:-1]
+        lengths = [math.hypot(ex - sx, ey - sy) for (sx, sy), (ex, ey) in zip(starts, self.points)]
+        rest = 0.0
+        legs = []
+        for i in range(len(self.points) - 1, -1, -1):
+            w = self.waypoints[i]
+            (sx, sy), (ex, ey) = starts[i], self.points[i]
+            legs.append(Leg(i, sx, sy, ex, ey, w.radius, w.speed, rest))
+            rest += lengths[i]
+        legs.reverse()
+        self.legs = legs
+        self.index = 0
+        self.arrivals = []
+
+    @property
+    def leg(self):
+        return self.legs[self.index]
+
+    @property
+    def final(self):
+        """ゴールへの最後の区間を走っているか"""
+        return self.index >= len(self.legs) - 1
+
+    def update(self, x, y):
+        """経由点に着いた (半径内 or 線上で通り過ぎた) ら次の区間へ進める。進めたら True"""
+        advanced = False
+        while not self.final:
+            leg = self.legs[self.index]
+            along = leg.along(x, y)
+            if along < leg.length and math.hypot(leg.ex - x, leg.ey - y) > leg.radius:
+                break
+            self.arrivals.append((leg.index, along, leg.cross(x, y)))
+            self.index += 1
+            advanced = True
+        return advanced
+
+    def remaining(self, x, y):
+        """今の経由点までの直線距離 + その先ゴールまでの経路長 [m]"""
+        leg = self.leg
+        return math.hypot(leg.ex - x, leg.ey - y) + leg.rest
+
+    def lookahead_point(self, x, y, lookahead=LOOKAHEAD):
+        """区間の線上 lookahead 先の点 (終点を越えない)。最初の区間は経由点そのもの"""
+        leg = self.leg
+        a = leg.along(x, y) + lookahead
+        if leg.index == 0 or a >= leg.length:
+            return leg.ex, leg.ey
+        a = max(a, 0.0)
+        return leg.sx + leg.ux * a, leg.sy + leg.uy * a
+
+    def steer_bearing(self, x, y):
+        """lookahead_point() への方位 [deg]"""
+        tx, ty = self.lookahead_point(x, y)
+        return math.degrees(math.atan2(tx - x, ty - y)) % 360
+
+    def describe(self):
+        lines = []
+        for leg in self.legs:
+            w = self.waypoints[leg.index]
+            kind = "ゴール" if leg.index == len(self.waypoints) - 1 else "経由点"
+            lines.append(f"  {leg.index + 1}. {kind} ({w.lat:.6f}, {w.lon:.6f}) "
+                         f"方位 {leg.bearing:5.1f}° 長さ {leg.length:6.1f}m 半径 {leg.radius:.1f}m "
+                         f"速度 {leg.speed:.2f} | 残り {leg.length + leg.rest:6.1f}m")
+        return "\n".join(lines)
+
+
+def parse_mission(text):
+    """ミッションファイルの中身を Waypoint のリストにする"""
+    waypoints = []
+    for lineno, line in enumerate(text.splitlines(), 1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        fields = [f for f in line.replace(",", " ").split()]
+        if not 2 <= len(fields) <= 4:
+            raise ValueError(f"{lineno}行目: '緯度, 経度 [, 半径 [, 速度]]' の形ではありません")
+        try:
+            values = [float(f) for f in fields]
+        except ValueError:
+            raise ValueError(f"{lineno}行目: 数値として読めません")
+        waypoints.append(Waypoint(*values))
+    if not waypoints:
+        raise ValueError("ミッションファイルに地点がありません")
+    return waypoints
+
+
+def load_route(path):
+    with open(path, encoding="utf-8") as f:
+        return Route(parse_mission(f.read()))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) not in (1, 3):
+        print("使い方: python3 route.py mission.txt [開始緯度 開始経度]")
+        return 1
+    route = load_route(argv[0])
+    if len(argv) == 3:
+        x, y = route.frame.to_enu(float(argv[1].rstrip(",")), float(argv[2]))
+    else:
+        x, y = route.points[0]
+    route.begin(x, y)
+    print(f"🗺️ {argv[0]}: {len(route.waypoints)}地点 / 経路長 {route.remaining(x, y):.1f}m")
+    print(route.describe())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
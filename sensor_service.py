@@ -0,0 +1,277 @@
+import time
+import threading
+
+from hal import Imu, Barometer, RangeSensor
+
+# ==========================================
+# センサー取得サービス (最新値キャッシュ)
+# ==========================================
+# デバイスごとに専用スレッドが自分の周期で読みに行き、結果を Reading として
+# チャンネルに置く。制御ループは置かれた最新値を見るだけなので、I2C の遅い読み出しで
+# モーター制御が止まらない。
+#
+# 書き込みは Reading オブジェクトの参照を1回差し替えるだけ (GILで不可分) なので、
+# 読む側はロック不要。古くなった値 (stale_after 秒以上更新なし) は None として扱う。
+#
+# threaded=False では読む側が get() したときに、周期が来ていればその場で読みに行く。
+# 仮想時計 (シミュレーション) ではスレッドを使わずこちらで動かす。
+#
+# subscribe() した関数は新しい Reading が届くたびに (読んだスレッドで) 呼ばれる。
+# ループの周期を待たずに全サンプルを見たい判定 (flight_events) に使う。軽い処理だけにすること。
+
+NO_UPDATE = object()   # 読み出し関数が「新しいデータなし」を返すときの印
+
+
+class Reading:
+    __slots__ = ("value", "stamp", "seq")
+
+    def __init__(self, value, stamp, seq):
+        self.value = value
+        self.stamp = stamp
+        self.seq = seq
+
+
+class Channel:
+    """1つのデバイス (または読み出し単位) の最新値と統計"""
+
+    def __init__(self, name, read_fn, period, stale_after, clock):
+        self.name = name
+        self.read_fn = read_fn
+        self.period = period
+        self.stale_after = stale_after
+        self.clock = clock
+        self.latest = None
+        self.seq = 0
+        self.last_poll = None
+        self.listeners = []
+        # 統計 (report 用)
+        self.reads = 0
+        self.errors = 0
+        self.last_error = None
+        self.read_time_total = 0.0
+        self.read_time_max = 0.0
+
+    def poll(self):
+        t0 = time.perf_counter()
+        self.last_poll = self.clock.monotonic()
+        try:
+            value = self.read_fn()
+        except Exception as e:
+            self.errors += 1
+            self.last_error = e
+            return
+        finally:
+            dt = time.perf_counter() - t0
+            self.reads += 1
+            self.read_time_total += dt
+            if dt > self.read_time_max:
+                self.read_time_max = dt
+        if value is NO_UPDATE:
+            return
+        self.seq += 1
+        reading = self.latest = Reading(value, self.clock.monotonic(), self.seq)
+        for fn in self.listeners:
+            try:
+                fn(reading)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = e
+
+    def age(self):
+        r = self.latest
+        if r is None:
+            return float('inf')
+        return self.clock.monotonic() - r.stamp
+
+    def is_stale(self):
+        return self.age() > self.stale_after
+
+
+class SensorService:
+    def __init__(self, clock, threaded=True):
+        self.clock = clock
+        self.threaded = threaded
+        self.channels = {}
+        self._threads = []
+        self._stop = threading.Event()
+
+    def add(self, name, read_fn, period, stale_after=None):
+        """チャンネルを登録する。stale_after の既定は周期の3倍 (最低0.2秒)"""
+        if stale_after is None:
+            stale_after = max(3 * period, 0.2)
+        ch = Channel(name, read_fn, period, stale_after, self.clock)
+        self.channels[name] = ch
+        return ch
+
+    def subscribe(self, name, fn):
+        """name のチャンネルに新しい値が届くたびに fn(Reading) を呼ぶ"""
+        # 読むスレッドが回している最中でも安全なように、リストごと差し替える
+        ch = self.channels[name]
+        ch.listeners = ch.listeners + [fn]
+
+    def unsubscribe(self, name, fn):
+        ch = self.channels[name]
+        ch.listeners = [f for f in ch.listeners if f is not fn]
+
+    def start(self):
+        if not self.threaded:
+            return
+        self._stop.clear()
+        for ch in self.channels.values():
+            th = threading.Thread(target=self._run, args=(ch,), name=f"sensor-{ch.name}", daemon=True)
+            th.start()
+            self._threads.append(th)
+
+    def stop(self, timeout=1.0):
+        self._stop.set()
+        for th in self._threads:
+            th.join(timeout)
+        self._threads = []
+
+    def _run(self, ch):
+        next_t = time.monotonic()
+        while not self._stop.is_set():
+            ch.poll()
+            next_t += ch.period
+            delay = next_t - time.monotonic()
+            if delay < 0:
+                # 読み出しが周期より遅れたら、追いつこうとせず今から数え直す
+                next_t = time.monotonic()
+                delay = 0
+            self._stop.wait(delay)
+
+    def reading(self, name):
+        """最新の Reading (古くなっていても返す)。未取得なら None"""
+        ch = self.channels[name]
+        if not self.threaded:
+            last = ch.last_poll
+            if last is None or self.clock.monotonic() - last >= ch.period:
+                ch.poll()
+        return ch.latest
+
+    def fresh(self, name):
+        """古くなっていない最新の Reading。無ければ None"""
+        r = self.reading(name)
+        if r is None or self.clock.monotonic() - r.stamp > self.channels[name].stale_after:
+            return None
+        return r
+
+    def get(self, name, default=None):
+        """最新値。未取得・古くなっている場合は default"""
+        r = self.fresh(name)
+        return default if r is None else r.value
+
+    def report(self):
+        lines = ["📊 センサー取得統計"]
+        for ch in self.channels.values():
+            mean = ch.read_time_total / ch.reads * 1000 if ch.reads else 0.0
+            lines.append(f"  {ch.name:<10} 読出 {ch.reads}回 | 失敗 {ch.errors}回 | "
+                         f"平均 {mean:.2f}ms | 最大 {ch.read_time_max * 1000:.2f}ms | 更新 {ch.seq}回")
+        return "\n".join(lines)
+
+
+# ==========================================
+# キャッシュを読むデバイス (HAL のインターフェースに合わせる)
+# ==========================================
+_NO_MOTION = ((None, None, None),) * 3
+
+
+class CachedImu(Imu):
+    """euler / acceleration はキャッシュから、校正関係は元のデバイスへ"""
+
+    def __init__(self, service, dev):
+        self.service = service
+        self.dev = dev
+
+    @property
+    def euler(self):
+        return self.service.get("imu", _NO_MOTION)[0]
+
+    @property
+    def acceleration(self):
+        return self.service.get("imu", _NO_MOTION)[1]
+
+    @property
+    def gyro(self):
+        return self.service.get("imu", _NO_MOTION)[2]
+
+    def read_motion(self):
+        return self.service.get("imu", _NO_MOTION)
+
+    @property
+    def calibration_status(self):
+        return self.dev.calibration_status
+
+    def restart_fusion(self):
+        self.dev.restart_fusion()
+
+
+class CachedBarometer(Barometer):
+    def __init__(self, service, dev):
+        self.service = service
+        self.dev = dev
+
+    @property
+    def pressure(self):
+        return self.service.get("baro", (None, None))[0]
+
+    @property
+    def temperature(self):
+        return self.service.get("baro", (None, None))[1]
+
+
+class CachedRange(RangeSensor):
+    """新しい測定値が届いていれば data_ready、clear_interrupt() で既読にする"""
+
+    def __init__(self, service, name):
+        self.service = service
+        self.name = name
+        self._consumed = 0
+
+    @property
+    def data_ready(self):
+        r = self.service.fresh(self.name)
+        return r is not None and r.seq != self._consumed
+
+    @property
+    def distance(self):
+        return self.service.get(self.name)
+
+    def clear_interrupt(self):
+        r = self.service.channels[self.name].latest
+        if r is not None:
+            self._consumed = r.seq
+
+
+def _read_range(dev):
+    if not dev.data_ready:
+        return NO_UPDATE
+    try:
+        return dev.distance
+    finally:
+        dev.clear_interrupt()
+
+
+def attach_sensor_service(hw, threaded=True):
+    """hw の IMU・気圧・ToF をキャッシュ経由に差し替えて、サービスを起動する"""
+    svc = SensorService(hw.clock, threaded=threaded)
+    if hw.imu:
+        imu = hw.imu
+        # 姿勢・加速度・角速度は1回のバースト読み出しでまとめて取る
+        svc.add("imu", imu.read_motion, period=0.02, stale_after=0.2)
+        hw.imu = CachedImu(svc, imu)
+    if hw.baro:
+        baro = hw.baro
+        svc.add("baro", lambda: (baro.pressure, baro.temperature), period=0.1, stale_after=0.5)
+        hw.baro = CachedBarometer(svc, baro)
+    if hw.tof_bottom is not None:
+        tof_bottom = hw.tof_bottom
+        svc.add("tof_bottom", lambda: _read_range(tof_bottom), period=0.02, stale_after=0.3)
+        hw.tof_bottom = CachedRange(svc, "tof_bottom")
+    if hw.tof_front is not None:
+        tof_front = hw.tof_front
+        svc.add("tof_front", lambda: _read_range(tof_front), period=0.02, stale_after=0.3)
+        hw.tof_front = CachedRange(svc, "tof_front")
+    hw.sensors = svc
+    svc.start()
+    return svc
@@ -0,0 +1,270 @@
+import os
+import sys
+import json
+import time
+import atexit
+import runpy
+import argparse
+import builtins
+import threading
+
+# ==========================================
+# 起動時間の計測 (import・デバイス初期化・フェーズ開始)
+# ==========================================
+# nohup python3 -u startup_profile.py run -o logs/startup.json main_0306.py > nav.log 2>&1 &
+# のように main_0306.py をこのモジュール経由で起動すると、
+#   imports … __import__ を包んで、モジュールごとの読み込み時間 (子を含む total / 自分だけの self)
+#   devices … hal_real の起動シーケンス (bringup.Bringup) の各 Step の開始・終了
+#   marks   … 任意の時点 (main / imports / hardware / ready) と各状態 (PHASE1〜3) に入った時刻
+# を、計測開始 (= インタプリタ起動直後) からの秒で JSON に保存する。
+# before はプロセス起動から計測開始までの時間 (Python 本体の起動。/proc が無ければ null)。
+#
+# ミッション側は mark() / record_bringup() / save() を呼ぶだけで、普通に起動した時は何もしない。
+# 保存は "ready" の時点と終了時の2回 (途中で止めても起動部分は残る)。
+#
+# python3 startup_profile.py show logs/startup.json
+# python3 startup_profile.py compare old.json new.json   (悪化した項目に ⚠️)
+
+REPORT_VERSION = 1
+TOP_IMPORTS = 15          # show で表示する import の数
+REGRESS_ABS = 0.05        # compare: これ以上 [s] かつ
+REGRESS_REL = 0.10        #          これ以上の割合で遅くなったら悪化とみなす
+
+active = None             # 計測中の StartupProfile (run で起動した時だけ)
+
+
+def _process_age():
+    """プロセスが起動してから今までの秒数 (/proc が読めなければ None)"""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class ImportTimer:
+    """builtins.__import__ を包み、まだ読み込まれていないモジュールの読み込み時間を数える"""
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.records = {}         # 名前 -> [total, self, 最初に読んだ時の深さ, 順番]
+        self._local = threading.local()
+        self._original = None
+
+    def install(self):
+        if self._original is None:
+            self._original = builtins.__import__
+            builtins.__import__ = self._import
+
+    def uninstall(self):
+        if self._original is not None:
+            builtins.__import__ = self._original
+            self._original = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        depth = len(stack)
+        stack.append(0.0)
+        t0 = self.clock()
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            total = self.clock() - t0
+            child = stack.pop()
+            if stack:
+                stack[-1] += total
+            rec = self.records.get(name)
+            if rec is None:
+                self.records[name] = [total, total - child, depth, len(self.records)]
+            else:
+                rec[0] += total
+                rec[1] += total - child
+
+    def to_list(self):
+        return [{"module": name, "total": round(r[0], 6), "self": round(r[1], 6), "depth": r[2]}
+                for name, r in sorted(self.records.items(), key=lambda kv: kv[1][3])]
+
+
+class StartupProfile:
+    def __init__(self, output=None, clock=time.monotonic):
+        self.clock = clock
+        self.t0 = clock()
+        self.before = _process_age()
+        self.output = output
+        self.imports = ImportTimer()
+        self.marks = []           # (名前, 秒)
+        self.devices = []         # {"name", "start", "end", "ok"}
+
+    def mark(self, name):
+        self.marks.append((name, self.clock() - self.t0))
+
+    def record_bringup(self, boot):
+        """bringup.Bringup の各 Step (clock は time.monotonic のもの) を devices に写す"""
+        for step in boot.steps.values():
+            if step.start is None:
+                continue
+            self.devices.append({"name": step.name, "start": round(step.start - self.t0, 6),
+                                 "end": round(step.end - self.t0, 6), "ok": step.error is None})
+
+    def to_dict(self):
+        return {
+            "version": REPORT_VERSION,
+            "created": time.time(),
+            "argv": sys.argv,
+            "python": sys.version.split()[0],
+            "before": self.before,
+            "imports": self.imports.to_list(),
+            "devices": self.devices,
+            "marks": [{"name": n, "t": round(t, 6)} for n, t in self.marks],
+        }
+
+    def save(self, path=None):
+        path = path or self.output
+        if not path:
+            return None
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+        return path
+
+
+# --- ミッション側から呼ぶ (計測していなければ何もしない) ---
+def mark(name):
+    if active is not None:
+        active.mark(name)
+
+
+def record_bringup(boot):
+    if active is not None and boot is not None:
+        active.record_bringup(boot)
+
+
+def save():
+    if active is not None:
+        path = active.save()
+        if path:
+            print(f"⏱️ 起動プロファイル保存: {path}")
+
+
+def run_script(path, argv, output):
+    """import の計測を始めてから path を __main__ として実行する"""
+    global active
+    # python3 startup_profile.py で起動した時もミッション側の import startup_profile が
+    # このモジュール (active を持っている方) を指すようにする
+    sys.modules["startup_profile"] = sys.modules[__name__]
+    active = StartupProfile(output)
+    active.imports.install()
+    atexit.register(save)
+    sys.argv = [path] + list(argv)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    runpy.run_path(path, run_name="__main__")
+
+
+# ==========================================
+# 表示・比較
+# ==========================================
+def load_report(path):
+    with open(path) as f:
+        report = json.load(f)
+    if report.get("version") != REPORT_VERSION:
+        raise ValueError(f"{path}: 形式のバージョンが違います ({report.get('version')})")
+    return report
+
+
+def metrics(report):
+    """比較用に {項目名: 秒} へ平らにする (同じ名前の mark は #2, #3 ... を付ける)"""
+    out = {}
+    if report.get("before") is not None:
+        out["before"] = report["before"]
+    for rec in report["imports"]:
+        if rec["depth"] == 0:
+            out[f"import {rec['module']}"] = rec["total"]
+    for dev in report["devices"]:
+        out[f"device {dev['name']}"] = dev["end"] - dev["start"]
+    seen = {}
+    for m in report["marks"]:
+        n = seen[m["name"]] = seen.get(m["name"], 0) + 1
+        out[f"mark {m['name']}" + (f"#{n}" if n > 1 else "")] = m["t"]
+    return out
+
+
+def format_report(report, top=TOP_IMPORTS):
+    lines = [f"⏱️ 起動プロファイル ({' '.join(report['argv'])}, Python {report['python']})"]
+    if report.get("before") is not None:
+        lines.append(f"  Python 起動 {report['before']:.3f}s (計測開始まで)")
+    imports = report["imports"]
+    if imports:
+        top_total = sum(r["total"] for r in imports if r["depth"] == 0)
+        lines.append(f"  import 合計 {top_total:.3f}s ({len(imports)}モジュール) / self の大きい順:")
+        for r in sorted(imports, key=lambda r: -r["self"])[:top]:
+            lines.append(f"    {r['module']:<32} self {r['self'] * 1e3:8.1f}ms  total {r['total'] * 1e3:8.1f}ms")
+    if report["devices"]:
+        lines.append("  デバイス初期化:")
+        for d in sorted(report["devices"], key=lambda d: d["start"]):
+            lines.append(f"    {d['name']:<12} {d['start']:7.3f} → {d['end']:7.3f}s "
+                         f"({d['end'] - d['start']:6.3f}s) {'✅' if d['ok'] else '❌'}")
+    if report["marks"]:
+        lines.append("  経過:")
+        for m in report["marks"]:
+            lines.append(f"    {m['name']:<12} {m['t']:8.3f}s")
+    return "\n".join(lines)
+
+
+def compare_reports(old, new):
+    """(表示用の行, 悪化した項目数) を返す"""
+    a, b = metrics(old), metrics(new)
+    lines = [f"{'項目':<36} {'旧':>9} {'新':>9} {'差':>9}"]
+    regressions = 0
+    for key in list(a) + [k for k in b if k not in a]:
+        va, vb = a.get(key), b.get(key)
+        if va is None or vb is None:
+            lines.append(f"{key:<36} {_fmt(va):>9} {_fmt(vb):>9} {'':>9}  {'(新規)' if va is None else '(消滅)'}")
+            continue
+        diff = vb - va
+        worse = diff > REGRESS_ABS and diff > REGRESS_REL * max(va, 1e-9)
+        regressions += worse
+        lines.append(f"{key:<36} {va:9.3f} {vb:9.3f} {diff:+9.3f}" + ("  ⚠️" if worse else ""))
+    return lines, regressions
+
+
+def _fmt(value):
+    return "-" if value is None else f"{value:.3f}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ミッションの起動時間 (import・デバイス初期化・フェーズ開始) を計測・比較する")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_run = sub.add_parser("run", help="スクリプトを計測しながら実行する")
+    p_run.add_argument("-o", "--output", default=f"startup_{int(time.time())}.json")
+    p_run.add_argument("script", help="スクリプト (以降の引数はスクリプトへ渡す。-o はスクリプトより前に書く)")
+    p_run.add_argument("args", nargs=argparse.REMAINDER, help="スクリプトに渡す引数")
+    p_show = sub.add_parser("show", help="レポートを表示する")
+    p_show.add_argument("report")
+    p_cmp = sub.add_parser("compare", help="2つのレポートを比べる")
+    p_cmp.add_argument("old")
+    p_cmp.add_argument("new")
+    p_cmp.add_argument("--strict", action="store_true", help="悪化があれば終了コード 1")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        run_script(args.script, args.args, args.output)
+        return 0
+    if args.command == "show":
+        print(format_report(load_report(args.report)))
+        return 0
+    lines, regressions = compare_reports(load_report(args.old), load_report(args.new))
+    print("\n".join(lines))
+    print(f"⚠️ 悪化 {regressions}項目" if regressions else "✅ 悪化なし")
+    return 1 if regressions and args.strict else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import math
+
+from pose_filter import WHEEL_SPEED
+from route import LOOKAHEAD
+
+# ==========================================
+# Phase 2 の操舵 (差し替え可能な制御則)
+# ==========================================
+# どの制御則も command() で (左出力, 右出力, 状態名) を返す。
+#   err = 目標方位 - 機体方位 (正 = 時計回りに向けばよい)
+#   turn = 右 - 左 (正で方位が増える = 時計回り。記録ログの TURN: L=0/R=1 と同じ向き)
+#
+#   bangbang : ±APPROACH_ANGLE 以内は全速直進、外は片輪だけ回して旋回 (従来の方式)
+#   p        : turn = Kp*err。前進は cos(err) で絞る (90度以上ずれたらその場旋回)
+#   pid      : p に積分・微分を足したもの。微分は機体方位の変化率から取り (経由点で
+#              目標方位が跳んでも蹴られない)、出力が飽和している間は積分を止める
+#   pursuit  : 経路の線上 LOOKAHEAD 先の点を通る円弧 (曲率 2sinα/Ld) をなぞる
+#
+# 比較は python3 hal_sim.py --controllers N (時間・走行距離・出力積分)。
+
+TURN_RATE = 15.0          # 左右差1.0の時の旋回速度 [deg/s] (記録ログの TURN から推定)
+
+APPROACH_ANGLE = 10.0     # bangbang: この角度以内なら直進 [deg]
+P_GAIN = 0.03             # p: 方位ズレ1度あたりの左右差
+P_MAX_TURN = 1.0          # p/pid: 左右差の上限
+PID_KP = 0.03
+PID_KI = 0.004            # [1/(deg·s)]
+PID_KD = 0.01             # [s/deg]
+PID_I_LIMIT = 100.0       # 積分の上限 [deg·s]
+PIVOT_ANGLE = 60.0        # pursuit: これ以上ずれていたらその場で向き直る [deg]
+PIVOT_TURN = 1.0          # pursuit: その時の左右差
+
+
+def _wrap(deg):
+    return (deg + 180.0) % 360.0 - 180.0
+
+
+def _clamp(value, limit):
+    return max(-limit, min(limit, value))
+
+
+def mix(forward, turn):
+    """前進と左右差から (左, 右) を作る。±1 を超える分は前進を削って左右差を守る"""
+    l_val, r_val = forward - turn / 2.0, forward + turn / 2.0
+    hi = max(l_val, r_val)
+    if hi > 1.0:
+        l_val, r_val = l_val - (hi - 1.0), r_val - (hi - 1.0)
+    lo = min(l_val, r_val)
+    if lo < -1.0:
+        l_val, r_val = l_val + (-1.0 - lo), r_val + (-1.0 - lo)
+    return l_val, r_val
+
+
+class Steering:
+    """制御則の共通部分。command() を実装する"""
+
+    name = ""
+
+    def reset(self):
+        pass
+
+    def command(self, t, heading, target_ang, speed=1.0, pose=None, route=None):
+        """(l_val, r_val, state) を返す。speed は区間の速度 (0.0〜1.0)"""
+        raise NotImplementedError
+
+    @staticmethod
+    def _state(forward):
+        return "DRIVE" if forward > 0.05 else "TURN"
+
+
+class BangBang(Steering):
+    name = "bangbang"
+
+    def __init__(self, approach_angle=APPROACH_ANGLE):
+        self.approach_angle = approach_angle
+
+    def command(self, t, heading, target_ang, speed=1.0, pose=None, route=None):
+        err = _wrap(target_ang - heading)
+        if abs(err) < self.approach_angle:
+            return speed, speed, "DRIVE"
+        # 片輪を軸にして、もう片方だけフルパワー
+        if err > 0:
+            return 0.0, 1.0, "TURN"
+        return 1.0, 0.0, "TURN"
+
+
+class Proportional(Steering):
+    name = "p"
+
+    def __init__(self, gain=P_GAIN, max_turn=P_MAX_TURN):
+        self.gain = gain
+        self.max_turn = max_turn
+
+    def command(self, t, heading, target_ang, speed=1.0, pose=None, route=None):
+        err = _wrap(target_ang - heading)
+        forward = speed * max(0.0, math.cos(math.radians(err)))
+        turn = _clamp(self.gain * err, self.max_turn)
+        l_val, r_val = mix(forward, turn)
+        return l_val, r_val, self._state(forward)
+
+
+class Pid(Steering):
+    name = "pid"
+
+    def __init__(self, kp=PID_KP, ki=PID_KI, kd=PID_KD, max_turn=P_MAX_TURN, i_limit=PID_I_LIMIT):
+        self.kp, self.ki, self.kd = kp, ki, kd
+        self.max_turn = max_turn
+        self.i_limit = i_limit
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self.t = None
+        self.heading = None
+
+    def command(self, t, heading, target_ang, speed=1.0, pose=None, route=None):
+        err = _wrap(target_ang - heading)
+        dt = 0.0 if self.t is None else t - self.t
+        rate = _wrap(heading - self.heading) / dt if dt > 0.0 else 0.0
+        self.t, self.heading = t, heading
+
+        raw = self.kp * err + self.ki * self.integral - self.kd * rate
+        turn = _clamp(raw, self.max_turn)
+        # アンチワインドアップ: 飽和中はズレを戻す向きの積分だけ許す
+        if dt > 0.0 and (turn == raw or err * raw < 0):
+            self.integral = _clamp(self.integral + err * dt, self.i_limit)
+
+        forward = speed * max(0.0, math.cos(math.radians(err)))
+        l_val, r_val = mix(forward, turn)
+        return l_val, r_val, self._state(forward)
+
+
+class PurePursuit(Steering):
+    name = "pursuit"
+
+    def __init__(self, lookahead=LOOKAHEAD, pivot_angle=PIVOT_ANGLE):
+        self.lookahead = lookahead
+        self.pivot_angle = pivot_angle
+
+    def command(self, t, heading, target_ang, speed=1.0, pose=None, route=None):
+        if pose is None or route is None:
+            tx = ty = None
+        else:
+            tx, ty = route.lookahead_point(pose.x, pose.y, self.lookahead)
+        if tx is None:
+            # 位置が分からなければ目標方位へ向かう円弧 (距離は LOOKAHEAD とみなす)
+            alpha, ld = _wrap(target_ang - heading), self.lookahead
+        else:
+            dx, dy = tx - pose.x, ty - pose.y
+            alpha = _wrap(math.degrees(math.atan2(dx, dy)) - heading)
+            # 最初の区間では目標点が遠い経由点そのものなので、Ld は lookahead までに抑える
+            ld = min(max(math.hypot(dx, dy), 0.5), self.lookahead)
+        if abs(alpha) > self.pivot_angle:
+            l_val, r_val = mix(0.0, math.copysign(PIVOT_TURN, alpha))
+            return l_val, r_val, "TURN"
+        curvature = 2.0 * math.sin(math.radians(alpha)) / ld        # [1/m] (正 = 時計回り)
+        omega = math.degrees(WHEEL_SPEED * speed * curvature)       # [deg/s]
+        l_val, r_val = mix(speed, omega / TURN_RATE)
+        return l_val, r_val, "DRIVE"
+
+
+CONTROLLERS = {c.name: c for c in (BangBang, Proportional, Pid, PurePursuit)}
+
+
+def make_controller(name, **kwargs):
+    """名前 (bangbang / p / pid / pursuit) から制御則を作る"""
+    try:
+        return CONTROLLERS[name](**kwargs)
+    except KeyError:
+        raise ValueError(f"未知の制御則: {name} ({' / '.join(CONTROLLERS)})")
@@ -0,0 +1,171 @@
+import math
+from collections import deque
+
+# ==========================================
+# 逐次統計 (1サンプルごとの更新が O(1))
+# ==========================================
+# 判定ループで履歴を溜めて max(history) - min(history) を毎回計算する代わりに使う。
+#   RunningStats  … 平均・分散 (Welford 法)。remove() で古い値を抜くこともできる
+#   SlidingWindow … 直近 window 秒の最小・最大 (単調デック)・平均・分散・最古の値
+#   Debounce      … 条件が hold 秒以上 (かつ count サンプル以上) 続いたら成立
+# 窓はサンプル数ではなく時刻で区切るので、センサーの読み出し周期を変えても
+# 判定の意味 (「5秒間安定」など) は変わらない。
+# 時刻は呼び出し側が渡す (time.monotonic() / 仮想時計 / ログの時刻のどれでもよい)。
+
+
+class RunningStats:
+    """平均・分散を1パスで更新する (Welford 法)"""
+
+    __slots__ = ("count", "mean", "_m2", "min", "max")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    def remove(self, x):
+        """add() 済みの値を抜く (min / max は add() した値全体のまま戻らない)"""
+        if self.count <= 1:
+            self.count = 0
+            self.mean = self._m2 = 0.0
+            return
+        self.count -= 1
+        delta = x - self.mean
+        self.mean -= delta / self.count
+        self._m2 -= delta * (x - self.mean)
+
+    @property
+    def variance(self):
+        """不偏分散 (2サンプル未満は 0)"""
+        return max(self._m2, 0.0) / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+
+class SlidingWindow:
+    """直近 window 秒のサンプルの最小・最大・平均・分散
+
+    最小・最大は単調デック (最小側は値が増える順、最大側は減る順に (時刻, 値) を残す) で持つ。
+    各サンプルは各デックに1回入って1回出るだけなので、push() はならし O(1)。
+    """
+
+    __slots__ = ("window", "stats", "_items", "_lo", "_hi", "_since")
+
+    def __init__(self, window):
+        self.window = window
+        self.stats = RunningStats()
+        self._items = deque()      # 窓の中の (時刻, 値) (最古の値・平均から抜く値用)
+        self._lo = deque()
+        self._hi = deque()
+        self._since = None         # clear() 後の最初のサンプルの時刻
+
+    def clear(self):
+        self.stats.reset()
+        self._items.clear()
+        self._lo.clear()
+        self._hi.clear()
+        self._since = None
+
+    def push(self, t, x):
+        if self._since is None:
+            self._since = t
+        items, lo, hi = self._items, self._lo, self._hi
+        items.append((t, x))
+        self.stats.add(x)
+        while lo and lo[-1][1] >= x:
+            lo.pop()
+        lo.append((t, x))
+        while hi and hi[-1][1] <= x:
+            hi.pop()
+        hi.append((t, x))
+        # 窓から出た古いサンプルを捨てる
+        cutoff = t - self.window
+        while items[0][0] < cutoff:
+            self.stats.remove(items.popleft()[1])
+        while lo[0][0] < cutoff:
+            lo.popleft()
+        while hi[0][0] < cutoff:
+            hi.popleft()
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def full(self):
+        """最初のサンプルから window 秒以上経ったか (窓が埋まったか)"""
+        return bool(self._items) and self._items[-1][0] - self._since >= self.window
+
+    @property
+    def min(self):
+        return self._lo[0][1] if self._lo else None
+
+    @property
+    def max(self):
+        return self._hi[0][1] if self._hi else None
+
+    @property
+    def range(self):
+        return self._hi[0][1] - self._lo[0][1] if self._items else None
+
+    @property
+    def first(self):
+        return self._items[0][1] if self._items else None
+
+    @property
+    def last(self):
+        return self._items[-1][1] if self._items else None
+
+    @property
+    def mean(self):
+        return self.stats.mean
+
+    @property
+    def std(self):
+        return self.stats.std
+
+
+class Debounce:
+    """条件が hold 秒以上、かつ count サンプル以上続いたら成立 (途切れたら数え直し)"""
+
+    __slots__ = ("hold", "count", "run", "since", "active")
+
+    def __init__(self, hold=0.0, count=1):
+        self.hold = hold
+        self.count = count
+        self.reset()
+
+    def reset(self):
+        self.run = 0               # 連続して成り立っているサンプル数
+        self.since = None          # 成り立ち始めた時刻
+        self.active = False
+
+    def update(self, t, condition):
+        if not condition:
+            self.reset()
+            return False
+        if self.since is None:
+            self.since = t
+        self.run += 1
+        self.active = self.run >= self.count and t - self.since >= self.hold
+        return self.active
+
+    def held(self, t):
+        """成り立ち続けている時間 [s]"""
+        return 0.0 if self.since is None else t - self.since
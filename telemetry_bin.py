@@ -0,0 +1,219 @@
+import os
+import sys
+import math
+import struct
+import argparse
+from datetime import datetime
+
+# ==========================================
+# バイナリ・テレメトリ形式 (固定長レコード)
+# ==========================================
+# [ヘッダー]  magic(4s) version(H) フィールド数(H) レコード長(H)
+#             + フィールド数 x (名前16s, structコード4s, CSV書式16s)
+# [本体]      struct で詰めた固定長レコードの連続 (リトルエンディアン, パディング無し)
+#
+# ループ内では数値をそのまま詰めるだけなので文字列整形が不要。
+# 読み出しは numpy の memmap / frombuffer でコピー無しの構造化配列になる。
+# CSV書式の "T" は UNIX時刻を "%Y-%m-%d %H:%M:%S"、"Tms" はミリ秒付きISO形式で出す。
+
+MAGIC = b"CSTL"
+VERSION = 1
+_HEADER = struct.Struct("<4sHHH")
+_FIELD = struct.Struct("<16s4s16s")
+
+# struct コード -> numpy dtype
+_NUMPY_TYPES = {
+    "d": "<f8", "f": "<f4",
+    "q": "<i8", "i": "<i4", "h": "<i2", "b": "i1",
+    "Q": "<u8", "I": "<u4", "H": "<u2", "B": "u1",
+}
+
+
+class Schema:
+    """フィールド定義 (名前, structコード, CSV書式) の並び"""
+
+    def __init__(self, fields):
+        self.fields = [(name, code, fmt) for name, code, fmt in fields]
+        self.names = [f[0] for f in self.fields]
+        self.record = struct.Struct("<" + "".join(f[1] for f in self.fields))
+        self.record_size = self.record.size
+        # 文字列フィールドだけ bytes へ変換する (それ以外は素通し)
+        self._str_idx = [i for i, f in enumerate(self.fields) if f[1].endswith("s")]
+        # センサーが None を返した時の代替値 (実数は NaN、整数は 0、文字列は空)
+        self._missing = [b"" if code.endswith("s") else (math.nan if code in ("d", "f") else 0)
+                         for _, code, _ in self.fields]
+
+    def header_bytes(self):
+        out = [_HEADER.pack(MAGIC, VERSION, len(self.fields), self.record_size)]
+        for name, code, fmt in self.fields:
+            out.append(_FIELD.pack(name.encode(), code.encode(), fmt.encode()))
+        return b"".join(out)
+
+    def encode(self, row):
+        """1レコードを bytes に詰める (FlightLogger のエンコーダとして使う)"""
+        if self._str_idx:
+            row = list(row)
+            for i in self._str_idx:
+                v = row[i]
+                if isinstance(v, str):
+                    row[i] = v.encode()
+        try:
+            return self.record.pack(*row)
+        except struct.error:
+            row = [self._missing[i] if v is None else v for i, v in enumerate(row)]
+            return self.record.pack(*row)
+
+    def dtype(self):
+        import numpy as np
+        spec = []
+        for name, code, _ in self.fields:
+            if code.endswith("s"):
+                spec.append((name, f"S{int(code[:-1] or 1)}"))
+            else:
+                spec.append((name, _NUMPY_TYPES[code]))
+        return np.dtype(spec)
+
+    @classmethod
+    def from_bytes(cls, buf):
+        """ヘッダーを解析して (Schema, 本体の開始オフセット) を返す"""
+        magic, version, n_fields, record_size = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise ValueError("テレメトリファイルではありません (magic不一致)")
+        if version != VERSION:
+            raise ValueError(f"未対応のバージョンです: {version}")
+        fields = []
+        offset = _HEADER.size
+        for _ in range(n_fields):
+            name, code, fmt = _FIELD.unpack_from(buf, offset)
+            fields.append((name.rstrip(b"\0").decode(), code.rstrip(b"\0").decode(), fmt.rstrip(b"\0").decode()))
+            offset += _FIELD.size
+        schema = cls(fields)
+        if schema.record_size != record_size:
+            raise ValueError("ヘッダーのレコード長とフィールド定義が一致しません")
+        return schema, offset
+
+
+# ==========================================
+# ログ定義
+# ==========================================
+# main_0306.py の航法ログ (従来の navi_*.csv と同じ列)
+NAVI_SCHEMA = Schema([
+    ("Phase",       "B",  "d"),
+    ("Timestamp",   "d",  "T"),
+    ("State",       "8s", "s"),
+    ("Lat",         "d",  ".6f"),
+    ("Lon",         "d",  ".6f"),
+    ("Heading",     "f",  ".1f"),
+    ("TargetAngle", "f",  ".1f"),
+    ("Dist",        "f",  ".2f"),
+    ("Roll",        "f",  ".0f"),
+    ("Pitch",       "f",  ".0f"),
+    ("L_Speed",     "f",  ".2f"),
+    ("R_Speed",     "f",  ".2f"),
+    ("Fix",         "B",  "d"),
+    ("RelAlt",      "f",  ".2f"),
+    ("AccelNorm",   "f",  ".2f"),
+    ("AI_CX",       "f",  ".3f"),   # 未検出は NaN (CSVでは空欄)
+    ("ToF_Dist",    "f",  ".1f"),   # 未取得は NaN (CSVでは空欄)
+    ("FrameSeq",    "I",  "d"),     # 判断に使ったカメラフレームの番号 (0 = 使っていない)
+    ("FrameAge",    "f",  ".3f"),   # そのフレームの露光から判断までの時間 [s]
+    ("PoseX",       "f",  ".2f"),   # 位置推定 (目標地点から東へ [m])。推定前は NaN
+    ("PoseY",       "f",  ".2f"),   # 位置推定 (目標地点から北へ [m])
+    ("PoseSpeed",   "f",  ".2f"),   # 推定前進速度 [m/s]
+    ("PoseSigma",   "f",  ".2f"),   # 位置の標準偏差 [m]
+])
+
+# test/test_imu_fixed.py の高速IMUログ (従来の imu_log.csv と同じ列)
+IMU_SCHEMA = Schema([
+    ("timestamp",      "d", "Tms"),
+    ("heading",        "f", ".4f"),
+    ("roll",           "f", ".4f"),
+    ("pitch",          "f", ".4f"),
+    ("ax",             "f", ".4f"),
+    ("ay",             "f", ".4f"),
+    ("az",             "f", ".4f"),
+    ("lax",            "f", ".4f"),
+    ("lay",            "f", ".4f"),
+    ("laz",            "f", ".4f"),
+    ("left_throttle",  "f", ".2f"),
+    ("right_throttle", "f", ".2f"),
+])
+
+
+# ==========================================
+# 読み出し
+# ==========================================
+def read_header(path):
+    with open(path, "rb") as f:
+        head = f.read(_HEADER.size)
+        n_fields = _HEADER.unpack(head)[2] if len(head) == _HEADER.size else 0
+        head += f.read(n_fields * _FIELD.size)
+    return Schema.from_bytes(head)
+
+
+def load(path, use_mmap=True):
+    """ログを (Schema, 構造化配列) で返す。use_mmap=True ならファイルを直接参照する"""
+    import numpy as np
+    schema, offset = read_header(path)
+    dtype = schema.dtype()
+    # 書き込み途中で止まった末尾の半端なレコードは読まない
+    count = (os.path.getsize(path) - offset) // dtype.itemsize
+    if count <= 0:
+        return schema, np.zeros(0, dtype=dtype)
+    if use_mmap:
+        rows = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+    else:
+        with open(path, "rb") as f:
+            rows = np.frombuffer(f.read(), dtype=dtype, count=count, offset=offset)
+    return schema, rows
+
+
+# ==========================================
+# CSV 変換
+# ==========================================
+def _column_formatter(code, fmt):
+    if fmt == "T":
+        return lambda v: datetime.fromtimestamp(v).strftime("%Y-%m-%d %H:%M:%S")
+    if fmt == "Tms":
+        return lambda v: datetime.fromtimestamp(v).isoformat(timespec="milliseconds")
+    if code.endswith("s"):
+        return lambda v: v.rstrip(b"\0").decode(errors="replace")
+    if code in ("d", "f"):
+        spec = "{:" + fmt + "}"
+        return lambda v: "" if math.isnan(v) else spec.format(v)
+    spec = "{:" + fmt + "}"
+    return lambda v: spec.format(v)
+
+
+def export_csv(path, out_path):
+    schema, rows = load(path)
+    formatters = [_column_formatter(code, fmt) for _, code, fmt in schema.fields]
+    columns = [rows[name].tolist() for name in schema.names]
+    with open(out_path, "w") as f:
+        f.write(",".join(schema.names) + "\n")
+        for values in zip(*columns):
+            f.write(",".join(fmt(v) for fmt, v in zip(formatters, values)) + "\n")
+    return len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="バイナリテレメトリ(.bin)をCSVへ変換する")
+    parser.add_argument("inputs", nargs="+", help="変換する .bin ファイル")
+    parser.add_argument("-o", "--output", help="出力先 (入力が1つの場合のみ。省略時は拡張子を.csvにする)")
+    args = parser.parse_args(argv)
+
+    if args.output and len(args.inputs) != 1:
+        parser.error("-o は入力ファイルが1つの場合のみ指定できます")
+
+    for path in args.inputs:
+        out_path = args.output or os.path.splitext(path)[0] + ".csv"
+        try:
+            n = export_csv(path, out_path)
+        except (OSError, ValueError) as e:
+            print(f"❌ {path}: {e}", file=sys.stderr)
+            continue
+        print(f"✅ {path} -> {out_path} ({n}行)")
+
+
+if __name__ == "__main__":
+    main()
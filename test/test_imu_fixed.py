@@ -1,12 +1,18 @@
+import os
+import sys
 import time
-import csv
-from datetime import datetime
 import board
 import busio
 import adafruit_bno055
 import digitalio
 import pwmio
 
+# リポジトリ直下の共通モジュールを読み込めるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from flight_logger import FlightLogger
+from telemetry_bin import IMU_SCHEMA
+from bno055_burst import Bno055Burst
+
 # ==========================================
 # 0. 走行パラメータ
 # ==========================================
@@ -56,32 +62,15 @@ try:
 except Exception as e:
     print(f"センサの初期化に失敗しました: {e}")
     exit()
+# 姿勢・加速度・線形加速度を1回のバースト読み出しで取る
+burst = Bno055Burst(sensor.i2c_device)
 
 print("高速読み取りテスト開始 (Ctrl+Cで停止)")
-csv_path = "imu_log.csv"
-csv_file = open(csv_path, mode="a", newline="", encoding="utf-8")
-csv_writer = csv.writer(csv_file)
-
-# 空ファイルのときだけヘッダーを書き込む
-if csv_file.tell() == 0:
-    csv_writer.writerow(
-        [
-            "timestamp",
-            "heading",
-            "roll",
-            "pitch",
-            "ax",
-            "ay",
-            "az",
-            "lax",
-            "lay",
-            "laz",
-            "left_throttle",
-            "right_throttle",
-        ]
-    )
-
-print(f"CSV出力先: {csv_path}")
+# バイナリ形式で記録 (CSVへは python3 telemetry_bin.py imu_log.bin で変換)
+log_path = "imu_log.bin"
+imu_log = FlightLogger(log_path, header=IMU_SCHEMA.header_bytes(), encoder=IMU_SCHEMA.encode)
+
+print(f"ログ出力先: {log_path}")
 left_throttle = BASE_THROTTLE
 right_throttle = BASE_THROTTLE + RIGHT_TRIM
 
@@ -96,44 +85,38 @@ count = 0
 try:
     while True:
         try:
-            euler = sensor.euler       # (heading, roll, pitch)
-            accel = sensor.acceleration  # (ax, ay, az) [m/s^2]
-            lin_accel = sensor.linear_acceleration  # 重力抜き [m/s^2]
-
-            if euler and accel and lin_accel:
-                heading, roll, pitch = euler
-                ax, ay, az = accel
-                lax, lay, laz = lin_accel
-
-                timestamp = datetime.now().isoformat(timespec="milliseconds")
-                csv_writer.writerow([
-                    timestamp,
-                    heading,
-                    roll,
-                    pitch,
-                    ax,
-                    ay,
-                    az,
-                    lax,
-                    lay,
-                    laz,
-                    left_throttle,
-                    right_throttle,
-                ])
-                csv_file.flush()
-
-                count += 1
-                now = time.monotonic()
-                if now - last_time >= 1.0:
-                    print(
-                        f"FPS: {count} | "
-                        f"Heading: {heading:.2f} Roll: {roll:.2f} Pitch: {pitch:.2f} | "
-                        f"Accel: ({ax:.2f}, {ay:.2f}, {az:.2f}) m/s^2 | "
-                        f"LinAcc: ({lax:.2f}, {lay:.2f}, {laz:.2f}) m/s^2"
-                    )
-                    count = 0
-                    last_time = now
-                
+            sample = burst.read()
+            heading, roll, pitch = sample.euler  # (heading, roll, pitch)
+            ax, ay, az = sample.accel            # [m/s^2]
+            lax, lay, laz = sample.linear_accel  # 重力抜き [m/s^2]
+
+            imu_log.log(
+                time.time(),
+                heading,
+                roll,
+                pitch,
+                ax,
+                ay,
+                az,
+                lax,
+                lay,
+                laz,
+                left_throttle,
+                right_throttle,
+            )
+
+            count += 1
+            now = time.monotonic()
+            if now - last_time >= 1.0:
+                print(
+                    f"FPS: {count} | "
+                    f"Heading: {heading:.2f} Roll: {roll:.2f} Pitch: {pitch:.2f} | "
+                    f"Accel: ({ax:.2f}, {ay:.2f}, {az:.2f}) m/s^2 | "
+                    f"LinAcc: ({lax:.2f}, {lay:.2f}, {laz:.2f}) m/s^2"
+                )
+                count = 0
+                last_time = now
+            
 
 
         except OSError as e:
@@ -152,4 +135,5 @@ try:
 finally:
     stop_motors()
     print("モーター停止")
-    csv_file.close()
+    imu_log.close()
+    print(f"ログ: {imu_log.report()}")